@@ -0,0 +1,79 @@
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+class RegistrantBatchWriter:
+    """Queue the registrant creates and updates of MIS records and run them per chunk.
+
+    Records are identified by their ``(remote id, is group)`` key. A chunk of
+    creates is a single multi-create. Each update carries the values of its own
+    record, so a chunk of updates runs their writes under a single savepoint
+    instead of one per record. When a chunk fails, its records are run again
+    one by one, each in its own savepoint, so a bad record only loses itself.
+    """
+
+    def __init__(self, env, chunk_size=100):
+        self.env = env
+        self.chunk_size = max(chunk_size or 1, 1)
+        self.to_create = []
+        self.to_update = []
+        self.created = 0
+        self.updated = 0
+        self.failed = 0
+        # (remote id, is group) -> id of the partner created for it
+        self.partner_ids = {}
+
+    def create(self, key, vals):
+        self.to_create.append((key, vals))
+
+    def update(self, key, partner_id, vals):
+        self.to_update.append((key, partner_id, vals))
+
+    def flush(self):
+        to_create, to_update = self.to_create, self.to_update
+        self.to_create, self.to_update = [], []
+        self._run(to_create, self._create_chunk, "create")
+        self._run(to_update, self._update_chunk, "update")
+
+    def _run(self, records, run_chunk, action):
+        for start in range(0, len(records), self.chunk_size):
+            chunk = records[start : start + self.chunk_size]
+            try:
+                with self.env.cr.savepoint():
+                    run_chunk(chunk)
+                continue
+            except Exception as e:
+                if len(chunk) == 1:
+                    self._record_failed(chunk[0][0], action)
+                    continue
+                _logger.warning(
+                    "MIS import: %s of %s registrants failed (%s), retrying one by one", action, len(chunk), e
+                )
+            for record in chunk:
+                try:
+                    with self.env.cr.savepoint():
+                        run_chunk([record])
+                except Exception:
+                    self._record_failed(record[0], action)
+
+    def _record_failed(self, key, action):
+        remote_id, is_group = key
+        self.failed += 1
+        _logger.exception(
+            "MIS import: %s of the registrant of %s %s failed",
+            action,
+            "group" if is_group else "individual",
+            remote_id,
+        )
+
+    def _create_chunk(self, chunk):
+        partners = self.env["res.partner"].sudo().create([vals for _key, vals in chunk])
+        self.partner_ids.update(zip((key for key, _vals in chunk), partners.ids))
+        self.created += len(chunk)
+
+    def _update_chunk(self, chunk):
+        partner_model = self.env["res.partner"].sudo()
+        for _key, partner_id, vals in chunk:
+            partner_model.browse(partner_id).write(vals)
+        self.updated += len(chunk)
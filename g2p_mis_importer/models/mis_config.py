@@ -1,14 +1,40 @@
 import json
 import logging
-from datetime import date, datetime
+import time
+from datetime import date, datetime, timezone
 
 import requests
 
 from odoo import _, fields, models
 from odoo.exceptions import UserError
 
+from .mis_batch_writer import RegistrantBatchWriter
+from .mis_members import MemberCollector
+from .mis_reference_cache import ReferenceDataResolver
+from .mis_registrant_resolver import RegistrantResolver
+
 _logger = logging.getLogger(__name__)
 
+MIS_DATE_FORMAT = "%Y-%m-%dT%H:%M:%S.%f%z"
+
+
+def _parse_date(value):
+    return datetime.strptime(value, MIS_DATE_FORMAT).replace(tzinfo=None)
+
+
+def _format_date(value):
+    return value.replace(tzinfo=timezone.utc).strftime(MIS_DATE_FORMAT)
+
+
+def _record_key(record):
+    """Position of an MIS group in the import order: the date of its last change, then its id.
+
+    The ``change_date`` of a group is the latest write date of the group, its
+    memberships and their individuals. A MIS which does not send it is paged
+    on the ``write_date`` of the group alone.
+    """
+    return _parse_date(record.get("change_date") or record.get("write_date")), record.get("id")
+
 
 class MisConfig(models.Model):
     _name = "mis.config"
@@ -22,6 +48,37 @@ class MisConfig(models.Model):
     username = fields.Char(required=True)
     password = fields.Char(required=True)
     last_updated_at = fields.Datetime()
+    page_size = fields.Integer(
+        default=100,
+        help="Number of MIS groups, with their members, fetched per request and imported together.",
+    )
+    batch_size = fields.Integer(
+        default=100,
+        help="Number of registrants created with a single ORM call, or updated under a single savepoint.",
+    )
+    max_run_seconds = fields.Integer(
+        string="Time budget (s)",
+        default=0,
+        help="Scheduled imports stop after the page of groups taking them past this duration and "
+        "continue right away in a new run, so that a large delta is imported as a series of "
+        "committed pages instead of being killed at the server time limit. 0 for no limit.",
+    )
+    max_run_records = fields.Integer(
+        string="Record budget",
+        default=0,
+        help="Scheduled imports stop after the page taking them past this number of MIS groups "
+        "and continue right away in a new run. 0 for no limit.",
+    )
+    # Char as Datetime fields drop the microseconds MIS write dates are ordered by
+    resume_write_date = fields.Char(
+        readonly=True,
+        help="Change date of the last group committed by an import stopped at its budget, "
+        "the next run resumes after it.",
+    )
+    resume_record_id = fields.Integer(string="Resume after MIS ID", readonly=True)
+    resume_started_at = fields.Datetime(
+        readonly=True, help="Start of the import being resumed, last updated on once it is done."
+    )
     cron_id = fields.Many2one("ir.cron", string="Cron Job", required=False)
     job_status = fields.Selection(
         [
@@ -77,7 +134,7 @@ class MisConfig(models.Model):
 
         try:
             test_url = self.mis_api_url
-            response = requests.get(test_url, cookies={"session_id": self.session_token})
+            response = requests.get(test_url, params={"limit": 1}, cookies={"session_id": self.session_token})
             response.raise_for_status()
 
         except Exception as e:
@@ -86,486 +143,384 @@ class MisConfig(models.Model):
         finally:
             self.logout()
 
-    # TODO: Split the methods into smaller methods
-    # flake8: noqa: C901
     def import_records(self, config_id=None):
+        """Import the MIS groups and individuals changed since ``last_updated_at``.
+
+        The cron passes the id of its config: those imports are committed page
+        by page and stop once over the time or record budget of the config,
+        continuing right away from where they stopped.
+        """
         if config_id:
             config = self.browse(config_id)
         else:
             config = self
 
         config.ensure_one()
+        config._import_delta(commit=bool(config_id))
 
-        config.login()
-        is_updated = False
-        individuals_list = []
+    def _get_resume_cursor(self):
+        self.ensure_one()
+        if self.resume_write_date:
+            return datetime.fromisoformat(self.resume_write_date), self.resume_record_id
+        return None
 
-        import_url = config.mis_api_url
-        response = requests.get(import_url, cookies={"session_id": config.session_token})
-        response.raise_for_status()
-        response = response.json()
-
-        for item in response:
-            group = None
-            create_date_str = item.get("create_date")
-            create_date = datetime.strptime(create_date_str, "%Y-%m-%dT%H:%M:%S.%f%z").replace(tzinfo=None)
-            write_date_str = item.get("write_date")
-            write_date = datetime.strptime(write_date_str, "%Y-%m-%dT%H:%M:%S.%f%z").replace(tzinfo=None)
-            prog_reg_info = item.get("program_membership_ids", None)
-            if prog_reg_info:
-                prog_reg_info = prog_reg_info[0].get("program_registrant_info_ids", None)
-            if prog_reg_info:
-                prog_reg_info = prog_reg_info[0].get("program_registrant_info", None)
-
-            if (not config.last_updated_at) or create_date > config.last_updated_at:
-                group = self.env["res.partner"].create(
+    def _import_delta(self, commit=False):
+        """Import the delta page by page, in ``(change_date, id)`` order of the groups.
+
+        With ``commit``, each page is committed with the key of its last group
+        as resume cursor, the next run skipping the groups up to it, and the
+        import stops at the budget. ``last_updated_at`` only moves once the whole
+        delta is imported, to the time its first run started.
+        """
+        self.ensure_one()
+        started = time.perf_counter()
+        run_started_at = self.resume_started_at or datetime.utcnow()
+        resume_cursor = self._get_resume_cursor()
+        max_seconds = self.max_run_seconds if commit else 0
+        max_records = self.max_run_records if commit else 0
+
+        self.login()
+        try:
+            # Pages committed by the runs being resumed count as updates
+            is_updated = bool(resume_cursor)
+            imported = 0
+            resolver = RegistrantResolver(self.env, self.mis_id_type.id)
+            writer = RegistrantBatchWriter(self.env, chunk_size=self.batch_size)
+            references = ReferenceDataResolver(self.env)
+            references.preload()
+            pages = self._iter_record_pages(resume_cursor)
+            for records in pages:
+                is_updated = self._import_page(records, resolver, writer, references) or is_updated
+                imported += len(records)
+                if not commit:
+                    continue
+                change_date, record_id = _record_key(records[-1])
+                self.write(
                     {
-                        "name": item.get("name"),
-                        "is_group": item.get("is_group"),
-                        "is_registrant": True,
-                        "registration_date": item.get("registration_date"),
-                        "reg_ids": [
-                            (
-                                0,
-                                0,
-                                {
-                                    "id_type": self.env["g2p.id.type"]
-                                    .search(
-                                        [("name", "=", reg_id.get("id_type", None))],
-                                    )[0]
-                                    .id,
-                                    "value": reg_id.get("value", None),
-                                    "expiry_date": reg_id.get("expiry_date", None),
-                                },
-                            )
-                            for reg_id in item.get("ids")
-                        ]
-                        + [
-                            (
-                                0,
-                                0,
-                                {
-                                    "id_type": config.mis_id_type.id,
-                                    "value": item.get("id"),
-                                },
-                            )
-                        ],
-                        "phone_number_ids": [
-                            (
-                                0,
-                                0,
-                                {
-                                    "phone_no": phone.get("phone_no"),
-                                    "date_collected": phone.get("date_collected"),
-                                    "disabled": phone.get("disabled"),
-                                },
-                            )
-                            for phone in item.get("phone_numbers")
-                        ],
-                        "email": item.get("email"),
-                        "address": item.get("address"),
-                        "bank_ids": [
-                            (
-                                0,
-                                0,
-                                {
-                                    "bank_id": self.env["res.bank"]
-                                    .search([("name", "=", bank.get("bank_name"))], limit=1)[0]
-                                    .id,
-                                    "acc_number": bank.get("acc_number"),
-                                },
-                            )
-                            for bank in item.get("bank_ids")
-                        ],
-                        "program_membership_ids": [
-                            (
-                                0,
-                                0,
-                                {
-                                    "program_id": config.mis_program_id.id,
-                                    "state": "draft",
-                                    "enrollment_date": date.today(),
-                                },
-                            )
-                        ],
-                        "program_registrant_info_ids": [
-                            (
-                                0,
-                                0,
-                                {
-                                    "program_id": config.mis_program_id.id,
-                                    "state": "active",
-                                    "program_registrant_info": json.dumps(prog_reg_info)
-                                    if prog_reg_info
-                                    else None,
-                                },
-                            )
-                        ],
-                        "notification_preference": item.get("notification_preference", None),
-                        "kind": self.env["g2p.group.kind"]
-                        .search([("name", "=", item.get("kind", None))], limit=1)[0]
-                        .id
-                        if item.get("kind", None)
-                        else None,
-                        "is_partial_group": item.get("is_partial_group"),
-                        "active": item.get("active"),
+                        "resume_write_date": change_date.isoformat(),
+                        "resume_record_id": record_id,
+                        "resume_started_at": run_started_at,
                     }
                 )
-                is_updated = True
-
-            elif write_date > config.last_updated_at:
-                group = (
-                    self.env["g2p.reg.id"]
-                    .search(
-                        [
-                            ("id_type", "=", config.mis_id_type.id),
-                            ("value", "=", item.get("id")),
-                            ("partner_id.is_group", "=", True),
-                        ]
-                    )[0]
-                    .partner_id
-                )
-                group.update(
-                    {
-                        "name": item.get("name"),
-                        "is_group": item.get("is_group"),
-                        "registration_date": item.get("registration_date"),
-                        "reg_ids": [
-                            (5,),
-                        ]
-                        + [
-                            (
-                                0,
-                                0,
-                                {
-                                    "id_type": self.env["g2p.id.type"]
-                                    .search(
-                                        [("name", "=", reg_id.get("id_type", None))],
-                                    )[0]
-                                    .id,
-                                    "value": reg_id.get("value", None),
-                                    "expiry_date": reg_id.get("expiry_date", None),
-                                },
-                            )
-                            for reg_id in item.get("ids")
-                        ]
-                        + [
-                            (
-                                0,
-                                0,
-                                {
-                                    "id_type": config.mis_id_type.id,
-                                    "value": item.get("id"),
-                                },
-                            )
-                        ],
-                        "phone_number_ids": [
-                            (5,),
-                        ]
-                        + [
-                            (
-                                0,
-                                0,
-                                {
-                                    "phone_no": phone.get("phone_no"),
-                                    "date_collected": phone.get("date_collected"),
-                                    "disabled": phone.get("disabled"),
-                                },
-                            )
-                            for phone in item.get("phone_numbers")
-                        ],
-                        "email": item.get("email"),
-                        "address": item.get("address"),
-                        "bank_ids": [
-                            (5,),
-                        ]
-                        + [
-                            (
-                                0,
-                                0,
-                                {
-                                    "bank_id": self.env["res.bank"]
-                                    .search([("name", "=", bank.get("bank_name"))], limit=1)[0]
-                                    .id,
-                                    "acc_number": bank.get("acc_number"),
-                                },
-                            )
-                            for bank in item.get("bank_ids")
-                        ],
-                        "notification_preference": item.get("notification_preference", None),
-                        "kind": self.env["g2p.group.kind"]
-                        .search([("name", "=", item.get("kind", None))], limit=1)[0]
-                        .id
-                        if item.get("kind", None)
-                        else None,
-                        "is_partial_group": item.get("is_partial_group"),
-                        "active": item.get("active"),
-                        "program_registrant_info_ids": [
-                            (5,),
-                        ]
-                        + [
-                            (
-                                0,
-                                0,
-                                {
-                                    "program_id": config.mis_program_id.id,
-                                    "state": "active",
-                                    "program_registrant_info": json.dumps(prog_reg_info)
-                                    if prog_reg_info
-                                    else None,
-                                },
-                            )
-                        ],
-                    }
+                self.env.cr.commit()  # pylint: disable=invalid-commit
+                over_budget = (max_seconds and time.perf_counter() - started >= max_seconds) or (
+                    max_records and imported >= max_records
                 )
-                is_updated = True
-
-            for membership in item.get("members"):
-                individual = membership.get("individual")
-                if not any(ind.get("id") == individual.get("id") for ind in individuals_list):
-                    individuals_list.append(individual)
-
-        for member in individuals_list:
-            create_date_str = member.get("create_date")
-            create_date = datetime.strptime(create_date_str, "%Y-%m-%dT%H:%M:%S.%f%z").replace(tzinfo=None)
-            write_date_str = member.get("write_date")
-            write_date = datetime.strptime(write_date_str, "%Y-%m-%dT%H:%M:%S.%f%z").replace(tzinfo=None)
-            if (not config.last_updated_at) or create_date > config.last_updated_at:
-                individual = self.env["res.partner"].create(
+                # A delta ending with this page needs no continuation; knowing it only
+                # costs a request when the page was full.
+                if over_budget and next(pages, None) is not None:
+                    _logger.info(
+                        "MIS import of %s stopped at its budget after %s group(s) in %.1fs",
+                        self.name,
+                        imported,
+                        time.perf_counter() - started,
+                    )
+                    self._log_import(writer, references, imported, started)
+                    self._continue_import()
+                    return
+
+            self._log_import(writer, references, imported, started)
+            vals = {"resume_write_date": False, "resume_record_id": 0, "resume_started_at": False}
+            if is_updated:
+                vals["last_updated_at"] = run_started_at
+            self.write(vals)
+        finally:
+            self.logout()
+
+    def _log_import(self, writer, references, imported, started):
+        _logger.info(
+            "MIS import of %s: %s group(s) in %.1fs, %s registrant(s) created, %s updated, %s failed",
+            self.name,
+            imported,
+            time.perf_counter() - started,
+            writer.created,
+            writer.updated,
+            writer.failed,
+        )
+        references.log_unresolved()
+
+    def _continue_import(self):
+        """Schedule the rest of an import stopped at its budget to run right away."""
+        self.ensure_one()
+        if self.cron_id:
+            self.cron_id.sudo()._trigger()
+        else:
+            self.delayable(description=_("MIS import %s: continue") % self.name)._import_delta(
+                commit=True
+            ).delay()
+
+    def _fetch_records(self, after=None):
+        """Download a page of the groups of the remote MIS, with their members.
+
+        The MIS is asked for the groups after the ``(change_date, id)`` key
+        ``after``, in that order, through the ``updated_after``, ``after_id`` and
+        ``limit`` query parameters: groups changed after ``updated_after``, or
+        changed at that same date with an id greater than ``after_id``.
+
+        A group changes when the group, one of its memberships or one of their
+        individuals is written, so that an edited member or a new membership
+        comes with its group even when the group itself is not written. The MIS
+        returns the date of that last change as the ``change_date`` of the group.
+        """
+        params = {"limit": self.page_size}
+        if after:
+            params.update({"updated_after": _format_date(after[0]), "after_id": after[1]})
+        response = requests.get(self.mis_api_url, params=params, cookies={"session_id": self.session_token})
+        response.raise_for_status()
+        return response.json()
+
+    def _iter_record_pages(self, cursor=None):
+        """Yield the pages of groups changed since ``last_updated_at``, or after ``cursor``.
+
+        Pages are requested by keyset on ``(change_date, id)``, each one starting
+        after the last group of the previous one: a group changed during the
+        import moves to the end of the delta without shifting the others. The
+        groups up to the key are also left out on our side, for a MIS ignoring
+        the parameters.
+        """
+        if not cursor and self.last_updated_at:
+            cursor = (self.last_updated_at, 0)
+        while True:
+            records = self._fetch_records(cursor)
+            page = sorted(
+                (record for record in records if not cursor or _record_key(record) > cursor), key=_record_key
+            )
+            if len(records) > self.page_size:
+                _logger.warning("MIS %s does not page its records, they were all fetched at once", self.name)
+                if page:
+                    yield page
+                return
+            if not page:
+                return
+            yield page
+            if len(records) < self.page_size:
+                return
+            cursor = _record_key(page[-1])
+
+    def _import_page(self, items, resolver, writer, references):
+        """Import groups, then their members, then link them. Returns whether anything changed."""
+        is_updated = False
+        references.prepare(items)
+        resolver.resolve([item.get("id") for item in items], True)
+        members = MemberCollector()
+        for item in items:
+            is_updated = self._import_registrant(item, True, resolver, writer, references) or is_updated
+            members.add_group_members(item)
+        self._flush_registrants(resolver, writer)
+
+        resolver.resolve([member.get("id") for member in members], False)
+        for member in members:
+            is_updated = self._import_registrant(member, False, resolver, writer, references) or is_updated
+        self._flush_registrants(resolver, writer)
+
+        for item in items:
+            is_updated = self._link_members(item, resolver, references) or is_updated
+        return is_updated
+
+    @staticmethod
+    def _flush_registrants(resolver, writer):
+        writer.flush()
+        for (remote_id, is_group), partner_id in writer.partner_ids.items():
+            resolver.remember(remote_id, is_group, partner_id)
+        writer.partner_ids = {}
+
+    def _is_new(self, record):
+        return not self.last_updated_at or _parse_date(record.get("create_date")) > self.last_updated_at
+
+    def _is_changed(self, record):
+        return _parse_date(record.get("write_date")) > self.last_updated_at
+
+    def _reg_ids_vals(self, record, references):
+        """IDs of an MIS record, leaving out those of an unknown ID type."""
+        reg_ids = []
+        for reg_id in record.get("ids"):
+            id_type_id = references.id_type_id(reg_id.get("id_type", None))
+            if not id_type_id:
+                continue
+            reg_ids.append(
+                (
+                    0,
+                    0,
                     {
-                        "name": member.get("name"),
-                        "is_group": member.get("is_group"),
-                        "registration_date": member.get("registration_date"),
-                        "phone_number_ids": [
-                            (
-                                0,
-                                0,
-                                {
-                                    "phone_no": phone.get("phone_no"),
-                                    "date_collected": phone.get("date_collected"),
-                                    "disabled": phone.get("disabled"),
-                                },
-                            )
-                            for phone in member.get("phone_numbers")
-                        ],
-                        "reg_ids": [
-                            (
-                                0,
-                                0,
-                                {
-                                    "id_type": self.env["g2p.id.type"]
-                                    .search(
-                                        [("name", "=", reg_id.get("id_type", None))],
-                                    )[0]
-                                    .id,
-                                    "value": reg_id.get("value", None),
-                                    "expiry_date": reg_id.get("expiry_date", None),
-                                },
-                            )
-                            for reg_id in member.get("ids")
-                        ]
-                        + [
-                            (
-                                0,
-                                0,
-                                {
-                                    "id_type": config.mis_id_type.id,
-                                    "value": member.get("id"),
-                                },
-                            )
-                        ],
-                        "email": member.get("email"),
-                        "address": member.get("address"),
-                        "bank_ids": [
-                            (
-                                0,
-                                0,
-                                {
-                                    "bank_id": self.env["res.bank"]
-                                    .search([("name", "=", bank.get("bank_name"))], limit=1)[0]
-                                    .id,
-                                    "acc_number": bank.get("acc_number"),
-                                },
-                            )
-                            for bank in member.get("bank_ids")
-                        ],
-                        "notification_preference": member.get("notification_preference", None),
-                        "given_name": member.get("given_name"),
-                        "addl_name": member.get("addl_name"),
-                        "family_name": member.get("family_name"),
-                        "gender": member.get("gender"),
-                        "birthdate": member.get("birthdate"),
-                        "birth_place": member.get("birth_place"),
-                    }
+                        "id_type": id_type_id,
+                        "value": reg_id.get("value", None),
+                        "expiry_date": reg_id.get("expiry_date", None),
+                    },
                 )
+            )
+        return reg_ids + [
+            (
+                0,
+                0,
+                {
+                    "id_type": self.mis_id_type.id,
+                    "value": record.get("id"),
+                },
+            )
+        ]
 
-                is_updated = True
-            elif write_date > config.last_updated_at:
-                individual = (
-                    self.env["g2p.reg.id"]
-                    .search(
-                        [
-                            ("id_type", "=", config.mis_id_type.id),
-                            ("value", "=", member.get("id")),
-                            ("partner_id.is_group", "=", False),
-                        ]
-                    )[0]
-                    .partner_id
-                )
-                individual.update(
+    @staticmethod
+    def _phone_numbers_vals(record):
+        return [
+            (
+                0,
+                0,
+                {
+                    "phone_no": phone.get("phone_no"),
+                    "date_collected": phone.get("date_collected"),
+                    "disabled": phone.get("disabled"),
+                },
+            )
+            for phone in record.get("phone_numbers")
+        ]
+
+    @staticmethod
+    def _bank_ids_vals(record, references):
+        return [
+            (
+                0,
+                0,
+                {
+                    "bank_id": references.bank_id(bank.get("bank_name")),
+                    "acc_number": bank.get("acc_number"),
+                },
+            )
+            for bank in record.get("bank_ids")
+        ]
+
+    def _group_vals(self, item, references, update=False):
+        """Values of the group of an MIS item, replacing its sub-records if ``update``."""
+        replace = [(5,)] if update else []
+        prog_reg_info = item.get("program_membership_ids", None)
+        if prog_reg_info:
+            prog_reg_info = prog_reg_info[0].get("program_registrant_info_ids", None)
+        if prog_reg_info:
+            prog_reg_info = prog_reg_info[0].get("program_registrant_info", None)
+        vals = {
+            "name": item.get("name"),
+            "is_group": item.get("is_group"),
+            "registration_date": item.get("registration_date"),
+            "reg_ids": replace + self._reg_ids_vals(item, references),
+            "phone_number_ids": replace + self._phone_numbers_vals(item),
+            "email": item.get("email"),
+            "address": item.get("address"),
+            "bank_ids": replace + self._bank_ids_vals(item, references),
+            "program_registrant_info_ids": replace
+            + [
+                (
+                    0,
+                    0,
                     {
-                        "name": member.get("name"),
-                        "is_group": member.get("is_group"),
-                        "registration_date": member.get("registration_date"),
-                        "phone_number_ids": [
-                            (5,),
-                        ]
-                        + [
-                            (
-                                0,
-                                0,
-                                {
-                                    "phone_no": phone.get("phone_no"),
-                                    "date_collected": phone.get("date_collected"),
-                                    "disabled": phone.get("disabled"),
-                                },
-                            )
-                            for phone in member.get("phone_numbers")
-                        ],
-                        "reg_ids": [
-                            (5,),
-                        ]
-                        + [
-                            (
-                                0,
-                                0,
-                                {
-                                    "id_type": self.env["g2p.id.type"]
-                                    .search(
-                                        [("name", "=", reg_id.get("id_type", None))],
-                                    )[0]
-                                    .id,
-                                    "value": reg_id.get("value", None),
-                                    "expiry_date": reg_id.get("expiry_date", None),
-                                },
-                            )
-                            for reg_id in member.get("ids")
-                        ]
-                        + [
-                            (
-                                0,
-                                0,
-                                {
-                                    "id_type": config.mis_id_type.id,
-                                    "value": member.get("id"),
-                                },
-                            )
-                        ],
-                        "email": member.get("email"),
-                        "address": member.get("address"),
-                        "bank_ids": [
-                            (5,),
-                        ]
-                        + [
-                            (
-                                0,
-                                0,
-                                {
-                                    "bank_id": self.env["res.bank"]
-                                    .search([("name", "=", bank.get("bank_name"))], limit=1)[0]
-                                    .id,
-                                    "acc_number": bank.get("acc_number"),
-                                },
-                            )
-                            for bank in member.get("bank_ids")
-                        ],
-                        "notification_preference": member.get("notification_preference", None),
-                        "given_name": member.get("given_name"),
-                        "addl_name": member.get("addl_name"),
-                        "family_name": member.get("family_name"),
-                        "gender": member.get("gender"),
-                        "birthdate": member.get("birthdate"),
-                        "birth_place": member.get("birth_place"),
-                    }
+                        "program_id": self.mis_program_id.id,
+                        "state": "active",
+                        "program_registrant_info": json.dumps(prog_reg_info) if prog_reg_info else None,
+                    },
                 )
-                is_updated = True
-        for item in response:
-            group = (
-                self.env["g2p.reg.id"]
-                .search(
-                    [
-                        ("id_type", "=", config.mis_id_type.id),
-                        ("value", "=", item.get("id")),
-                        ("partner_id.is_group", "=", True),
-                    ]
-                )[0]
-                .partner_id
+            ],
+            "notification_preference": item.get("notification_preference", None),
+            "kind": references.group_kind_id(item.get("kind")),
+            "is_partial_group": item.get("is_partial_group"),
+            "active": item.get("active"),
+        }
+        if not update:
+            vals.update(
+                {
+                    "is_registrant": True,
+                    "program_membership_ids": [
+                        (
+                            0,
+                            0,
+                            {
+                                "program_id": self.mis_program_id.id,
+                                "state": "draft",
+                                "enrollment_date": date.today(),
+                            },
+                        )
+                    ],
+                }
             )
+        return vals
 
-            for membership in item.get("members"):
-                member = membership.get("individual")
-                individual = (
-                    self.env["g2p.reg.id"]
-                    .search(
-                        [
-                            ("id_type", "=", config.mis_id_type.id),
-                            ("value", "=", member.get("id")),
-                            ("partner_id.is_group", "=", False),
-                        ]
-                    )[0]
-                    .partner_id
-                )
+    def _individual_vals(self, member, references, update=False):
+        """Values of an MIS individual, replacing its sub-records if ``update``."""
+        replace = [(5,)] if update else []
+        return {
+            "name": member.get("name"),
+            "is_group": member.get("is_group"),
+            "registration_date": member.get("registration_date"),
+            "phone_number_ids": replace + self._phone_numbers_vals(member),
+            "reg_ids": replace + self._reg_ids_vals(member, references),
+            "email": member.get("email"),
+            "address": member.get("address"),
+            "bank_ids": replace + self._bank_ids_vals(member, references),
+            "notification_preference": member.get("notification_preference", None),
+            "given_name": member.get("given_name"),
+            "addl_name": member.get("addl_name"),
+            "family_name": member.get("family_name"),
+            "gender": member.get("gender"),
+            "birthdate": member.get("birthdate"),
+            "birth_place": member.get("birth_place"),
+        }
 
-                create_date_str = membership.get("create_date")
-                create_date = datetime.strptime(create_date_str, "%Y-%m-%dT%H:%M:%S.%f%z").replace(
-                    tzinfo=None
-                )
-                write_date_str = membership.get("write_date")
-                write_date = datetime.strptime(write_date_str, "%Y-%m-%dT%H:%M:%S.%f%z").replace(tzinfo=None)
-
-                if (not config.last_updated_at) or create_date > config.last_updated_at:
-                    group.update(
-                        {
-                            "group_membership_ids": [
-                                (
-                                    0,
-                                    0,
-                                    {
-                                        "individual": individual.id,
-                                        "kind": [
-                                            (
-                                                4,
-                                                config.get_or_create_kind(member_kind.get("name")).id,
-                                            )
-                                            for member_kind in membership.get("kind")
-                                        ],
-                                    },
-                                )
-                            ]
-                        }
-                    )
-                    is_updated = True
-                elif write_date > config.last_updated_at:
-                    group_membership = group.group_membership_ids.filter(individual=individual.id)
-                    group_membership.update(
-                        {
-                            "kind": [
-                                (5,),
-                            ]
-                            + [
-                                (
-                                    4,
-                                    config.get_or_create_kind(member_kind.get("name")).id,
-                                )
-                                for member_kind in membership.get("kind")
-                            ]
-                        }
-                    )
-                    is_updated = True
+    def _import_registrant(self, record, is_group, resolver, writer, references):
+        """Queue the creation or update of the registrant of an MIS record, returns whether it changed.
+
+        A record imported by an earlier page of the run is updated rather than
+        created again.
+        """
+        vals_for = self._group_vals if is_group else self._individual_vals
+        is_new = self._is_new(record)
+        if not is_new and not self._is_changed(record):
+            return False
+        remote_id = record.get("id")
+        partner_id = resolver.partner_id(remote_id, is_group)
+        if partner_id:
+            writer.update((remote_id, is_group), partner_id, vals_for(record, references, update=True))
+        elif is_new:
+            writer.create((remote_id, is_group), vals_for(record, references))
+        else:
+            writer.failed += 1
+            _logger.error("MIS record %s changed but was never imported", remote_id)
+            return False
+        return True
 
-        if is_updated:
-            config.last_updated_at = datetime.utcnow()
-        config.logout()
+    def _link_members(self, item, resolver, references):
+        """Create or update the memberships of an MIS group, returns whether any changed."""
+        is_updated = False
+        group = None
+        new_memberships = []
+        for membership in item.get("members"):
+            if not self._is_new(membership) and not self._is_changed(membership):
+                continue
+            individual_id = resolver.partner_id(membership.get("individual").get("id"), False)
+            if group is None:
+                group = self.env["res.partner"].browse(resolver.partner_id(item.get("id"), True))
+            if not group or not individual_id:
+                _logger.error(
+                    "Membership of MIS individual %s in group %s skipped, one of them was not imported",
+                    membership.get("individual").get("id"),
+                    item.get("id"),
+                )
+                continue
+            group_membership = group.group_membership_ids.filtered(
+                lambda group_membership: group_membership.individual.id == individual_id
+            )
+            kinds = [
+                (4, kind_id)
+                for kind_id in (
+                    references.membership_kind_id(member_kind.get("name"))
+                    for member_kind in membership.get("kind")
+                )
+                if kind_id
+            ]
+            if group_membership:
+                group_membership.update({"kind": [(5,)] + kinds})
+            else:
+                new_memberships.append((0, 0, {"individual": individual_id, "kind": kinds}))
+            is_updated = True
+        if new_memberships:
+            group.update({"group_membership_ids": new_memberships})
+        return is_updated
 
     def get_or_create_kind(self, kind_str):
         kind = self.env["g2p.group.membership.kind"].search([("name", "=", kind_str)], limit=1)
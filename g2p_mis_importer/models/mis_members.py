@@ -0,0 +1,33 @@
+class MemberCollector:
+    """The individuals of a page of MIS groups, by remote id, in the order they were first seen.
+
+    An individual member of several groups is collected once. When the copies
+    differ, the one with the latest ``write_date`` wins (the first seen on a
+    tie) and the fields it lacks are taken from the others, so the result does
+    not depend on which group listed the individual first.
+    """
+
+    def __init__(self):
+        self._members = {}
+
+    def add(self, individual):
+        remote_id = individual.get("id")
+        known = self._members.get(remote_id)
+        if known is None:
+            self._members[remote_id] = individual
+        elif known is not individual and known != individual:
+            # MIS dates are all in UTC with the same format: they sort as strings
+            if (individual.get("write_date") or "") > (known.get("write_date") or ""):
+                self._members[remote_id] = dict(known, **individual)
+            else:
+                self._members[remote_id] = dict(individual, **known)
+
+    def add_group_members(self, item):
+        for membership in item.get("members"):
+            self.add(membership.get("individual"))
+
+    def __iter__(self):
+        return iter(self._members.values())
+
+    def __len__(self):
+        return len(self._members)
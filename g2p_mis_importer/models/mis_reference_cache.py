@@ -0,0 +1,96 @@
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+class ReferenceDataResolver:
+    """In-memory name to id maps of the reference tables used by the MIS import.
+
+    The tables are read once per import run. Before a page is imported, the
+    banks, group kinds and membership kinds it names but which do not exist
+    are created with one create per table; ID types are never created; the
+    names of missing ones are collected in ``unresolved`` and the IDs using
+    them left out.
+    """
+
+    # Tables looked up by name, with whether missing names are created
+    TABLES = {
+        "g2p.id.type": False,
+        "res.bank": True,
+        "g2p.group.kind": True,
+        "g2p.group.membership.kind": True,
+    }
+
+    def __init__(self, env):
+        self.env = env
+        self.created = 0
+        self.unresolved = {model: set() for model in self.TABLES}
+        self._ids = {}
+
+    def preload(self):
+        for model in self.TABLES:
+            self._ids[model] = {}
+            for rec in self.env[model].sudo().search_read([], ["name"]):
+                self._ids[model].setdefault(rec["name"], rec["id"])
+
+    @staticmethod
+    def _page_names(items):
+        """The names of the reference records used by a page of MIS groups, by table."""
+        names = {model: set() for model in ReferenceDataResolver.TABLES}
+        records = list(items)
+        for item in items:
+            if item.get("kind"):
+                names["g2p.group.kind"].add(item["kind"])
+            for membership in item.get("members") or []:
+                records.append(membership.get("individual"))
+                names["g2p.group.membership.kind"].update(
+                    kind.get("name") for kind in membership.get("kind") or []
+                )
+        for record in records:
+            names["g2p.id.type"].update(reg_id.get("id_type") for reg_id in record.get("ids") or [])
+            names["res.bank"].update(bank.get("bank_name") for bank in record.get("bank_ids") or [])
+        return names
+
+    def prepare(self, items):
+        """Create the missing reference records named by a page of MIS groups."""
+        if not self._ids:
+            self.preload()
+        for model, names in self._page_names(items).items():
+            missing = sorted(name for name in names if name and name not in self._ids[model])
+            if not missing or not self.TABLES[model]:
+                continue
+            records = self.env[model].sudo().create([{"name": name} for name in missing])
+            self._ids[model].update(zip(missing, records.ids))
+            self.created += len(missing)
+            _logger.info(
+                "Created %s %s record(s) named by the MIS: %s", len(missing), model, ", ".join(missing)
+            )
+
+    def _get(self, model, name):
+        if not name:
+            return None
+        record_id = self._ids[model].get(name)
+        if not record_id:
+            self.unresolved[model].add(name)
+        return record_id
+
+    def id_type_id(self, name):
+        return self._get("g2p.id.type", name)
+
+    def bank_id(self, name):
+        return self._get("res.bank", name)
+
+    def group_kind_id(self, name):
+        return self._get("g2p.group.kind", name)
+
+    def membership_kind_id(self, name):
+        return self._get("g2p.group.membership.kind", name)
+
+    def log_unresolved(self):
+        for model, names in self.unresolved.items():
+            if names:
+                _logger.warning(
+                    "MIS import: no %s named %s, the values using them were left out",
+                    model,
+                    ", ".join(sorted(names)),
+                )
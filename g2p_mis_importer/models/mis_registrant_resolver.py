@@ -0,0 +1,54 @@
+class RegistrantResolver:
+    """Map the remote ids of MIS groups and individuals to their registrants, for an import run.
+
+    The registrants created or updated by the run are remembered as they are
+    written; the others are read with a single ``g2p.reg.id`` query per call
+    to :meth:`resolve`, for all the ids it was given and does not know yet.
+    """
+
+    def __init__(self, env, id_type_id):
+        self.env = env
+        self.id_type_id = id_type_id
+        self.queries = 0
+        # (remote id, is group) -> partner id, False once known to be missing
+        self._partners = {}
+
+    @staticmethod
+    def _key(remote_id, is_group):
+        # Remote ids are stored as the value of a g2p.reg.id, a string
+        return str(remote_id), bool(is_group)
+
+    def remember(self, remote_id, is_group, partner_id):
+        self._partners[self._key(remote_id, is_group)] = partner_id
+
+    def resolve(self, remote_ids, is_group):
+        """Look up the registrants of ``remote_ids`` which are not known yet."""
+        values = {
+            str(remote_id) for remote_id in remote_ids if self._key(remote_id, is_group) not in self._partners
+        }
+        if not values:
+            return
+        self.queries += 1
+        reg_ids = (
+            self.env["g2p.reg.id"]
+            .sudo()
+            .search_read(
+                [
+                    ("id_type", "=", self.id_type_id),
+                    ("value", "in", list(values)),
+                    ("partner_id.is_group", "=", bool(is_group)),
+                ],
+                ["value", "partner_id"],
+            )
+        )
+        for reg_id in reg_ids:
+            self._partners.setdefault((reg_id["value"], bool(is_group)), reg_id["partner_id"][0])
+        for value in values:
+            self._partners.setdefault((value, bool(is_group)), False)
+
+    def partner_id(self, remote_id, is_group):
+        """The partner id of a registrant, looking it up if it was not resolved; False if missing."""
+        key = self._key(remote_id, is_group)
+        if key not in self._partners:
+            self.resolve([remote_id], is_group)
+        return self._partners[key]
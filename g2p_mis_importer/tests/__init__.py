@@ -0,0 +1,8 @@
+# Part of Newlogic G2P. See LICENSE file for full copyright and licensing details.
+
+from . import test_mis_config
+from . import test_mis_members
+from . import test_mis_registrant_resolver
+from . import test_mis_batch_writer
+from . import test_mis_reference_cache
+from . import test_mis_benchmark
@@ -0,0 +1,99 @@
+"""A stand-in for the group endpoint of a remote MIS, to patch ``requests.get`` with in tests."""
+from datetime import datetime, timedelta
+from unittest.mock import MagicMock
+
+MIS_DATE_FORMAT = "%Y-%m-%dT%H:%M:%S.%f%z"
+START = datetime(2024, 1, 1)
+
+
+def mis_date(value):
+    return value.strftime("%Y-%m-%dT%H:%M:%S.%f") + "+0000"
+
+
+def _parse(value):
+    return datetime.strptime(value, MIS_DATE_FORMAT).replace(tzinfo=None)
+
+
+def mis_group(group_id, written_at, members=()):
+    return {
+        "id": group_id,
+        "name": f"Group {group_id}",
+        "is_group": True,
+        "active": True,
+        "create_date": mis_date(written_at),
+        "write_date": mis_date(written_at),
+        "ids": [],
+        "phone_numbers": [],
+        "bank_ids": [],
+        "members": list(members),
+    }
+
+
+def mis_member(individual_id, written_at):
+    """A membership of the individual ``individual_id``, both written at ``written_at``."""
+    return {
+        "create_date": mis_date(written_at),
+        "write_date": mis_date(written_at),
+        "kind": [],
+        "individual": {
+            "id": individual_id,
+            "name": f"Individual {individual_id}",
+            "is_group": False,
+            "create_date": mis_date(written_at),
+            "write_date": mis_date(written_at),
+            "ids": [],
+            "phone_numbers": [],
+            "bank_ids": [],
+        },
+    }
+
+
+def mis_change_date(group):
+    """Latest write date of a group, its memberships and their individuals."""
+    return max(
+        [_parse(group["write_date"])]
+        + [_parse(membership["write_date"]) for membership in group["members"]]
+        + [_parse(membership["individual"]["write_date"]) for membership in group["members"]]
+    )
+
+
+def mis_groups(count, start=START, per_date=1):
+    """``count`` groups, ``per_date`` of them sharing each write date."""
+    return [mis_group(index + 1, start + timedelta(seconds=index // per_date)) for index in range(count)]
+
+
+class FakeMIS:
+    """Serves groups by ``(change_date, id)`` keyset, from ``updated_after`` and ``after_id``.
+
+    ``on_request`` is called with the request count before each response, to
+    change the groups between two pages. With ``ignore_params``, the MIS
+    returns all its groups to every request.
+    """
+
+    def __init__(self, groups, ignore_params=False, on_request=None):
+        self.groups = groups
+        self.ignore_params = ignore_params
+        self.on_request = on_request
+        self.requests = []
+
+    def touch(self, group_id, written_at):
+        for group in self.groups:
+            if group["id"] == group_id:
+                group["write_date"] = mis_date(written_at)
+
+    def get(self, url, params=None, cookies=None):
+        params = dict(params or {})
+        self.requests.append(params)
+        if self.on_request:
+            self.on_request(len(self.requests))
+        groups = sorted(self.groups, key=lambda group: (mis_change_date(group), group["id"]))
+        if not self.ignore_params:
+            if "updated_after" in params:
+                after = (_parse(params["updated_after"]), params.get("after_id", 0))
+                groups = [group for group in groups if (mis_change_date(group), group["id"]) > after]
+            groups = groups[: params.get("limit", len(groups))]
+        response = MagicMock()
+        response.json.return_value = [
+            dict(group, change_date=mis_date(mis_change_date(group))) for group in groups
+        ]
+        return response
@@ -0,0 +1,67 @@
+from unittest.mock import MagicMock
+
+from odoo.tests.common import TransactionCase
+
+from odoo.addons.g2p_mis_importer.models.mis_batch_writer import RegistrantBatchWriter
+
+
+class TestRegistrantBatchWriter(TransactionCase):
+    def setUp(self):
+        super().setUp()
+        self.env_mock = MagicMock()
+        self.partner_model = self.env_mock.__getitem__.return_value.sudo.return_value
+        self.written = {}
+        self.partner_model.browse.side_effect = lambda partner_id: MagicMock(
+            write=lambda vals: self.written.__setitem__(partner_id, vals)
+        )
+
+    def test_maps_created_registrants_to_their_mis_records(self):
+        self.partner_model.create.side_effect = lambda vals_list: MagicMock(
+            ids=[100 + len(vals["name"]) for vals in vals_list]
+        )
+        writer = RegistrantBatchWriter(self.env_mock, chunk_size=2)
+
+        writer.create((1, True), {"name": "Group"})
+        writer.create((1, False), {"name": "Individual"})
+        writer.create((2, False), {"name": "Member"})
+        writer.flush()
+
+        self.assertEqual(self.partner_model.create.call_count, 2)
+        self.assertEqual(writer.partner_ids, {(1, True): 105, (1, False): 110, (2, False): 106})
+        self.assertEqual((writer.created, writer.failed), (3, 0))
+
+    def test_updates_each_registrant_with_its_own_values(self):
+        writer = RegistrantBatchWriter(self.env_mock, chunk_size=2)
+
+        for remote_id in range(1, 6):
+            writer.update((remote_id, False), 10 + remote_id, {"name": f"Individual {remote_id}"})
+        writer.flush()
+
+        self.assertEqual(self.written, {10 + i: {"name": f"Individual {i}"} for i in range(1, 6)})
+        # One savepoint per chunk of updates, not per registrant
+        self.assertEqual(self.env_mock.cr.savepoint.call_count, 3)
+        self.assertEqual((writer.updated, writer.failed), (5, 0))
+
+    def test_bad_record_only_loses_itself(self):
+        def create(vals_list):
+            if any(vals["name"] == "Bad" for vals in vals_list):
+                raise ValueError("Invalid record")
+            return MagicMock(ids=[7])
+
+        def browse(partner_id):
+            partner = MagicMock()
+            partner.write.side_effect = ValueError("Invalid record") if partner_id == 12 else None
+            return partner
+
+        self.partner_model.create.side_effect = create
+        self.partner_model.browse.side_effect = browse
+        writer = RegistrantBatchWriter(self.env_mock, chunk_size=10)
+
+        writer.create((1, True), {"name": "Good"})
+        writer.create((2, True), {"name": "Bad"})
+        for remote_id in (3, 4):
+            writer.update((remote_id, True), 10 + remote_id - 1, {"name": "Group"})
+        writer.flush()
+
+        self.assertEqual(writer.partner_ids, {(1, True): 7})
+        self.assertEqual((writer.created, writer.updated, writer.failed), (1, 1, 2))
@@ -0,0 +1,85 @@
+import logging
+import time
+
+from odoo.tests.common import TransactionCase, tagged
+
+from odoo.addons.g2p_mis_importer.models.mis_members import MemberCollector
+
+_logger = logging.getLogger(__name__)
+
+# The list scan is quadratic: it already takes minutes over 50k memberships
+LEGACY_MAX_MEMBERSHIPS = 50000
+
+
+def synthetic_groups(memberships, members_per_group=5, shared_every=10):
+    """MIS groups with ``memberships`` memberships, every ``shared_every``-th individual in two groups."""
+    groups = []
+    for group_index in range(memberships // members_per_group):
+        members = []
+        for position in range(members_per_group):
+            index = group_index * members_per_group + position
+            if index % shared_every == shared_every - 1 and index > members_per_group:
+                index -= members_per_group
+            members.append(
+                {
+                    "individual": {
+                        "id": index + 1,
+                        "name": f"Individual {index}",
+                        "write_date": "2024-01-01T00:00:00.000000+0000",
+                    },
+                    "kind": [],
+                }
+            )
+        groups.append({"id": group_index + 1, "members": members})
+    return groups
+
+
+def legacy_collect(groups):
+    """Member collection as it was done before :class:`MemberCollector`."""
+    individuals_list = []
+    for item in groups:
+        for membership in item.get("members"):
+            individual = membership.get("individual")
+            if not any(ind.get("id") == individual.get("id") for ind in individuals_list):
+                individuals_list.append(individual)
+    return individuals_list
+
+
+@tagged("-standard", "mis_benchmark")
+class TestMisMemberCollectorBenchmark(TransactionCase):
+    """Benchmarks run with ``--test-tags mis_benchmark``, they are not part of the regular suite."""
+
+    def test_collector_versus_list_scan(self):
+        for count in (5000, 50000, 200000):
+            groups = synthetic_groups(count)
+
+            start = time.perf_counter()
+            members = MemberCollector()
+            for item in groups:
+                members.add_group_members(item)
+            collected = list(members)
+            collector_time = time.perf_counter() - start
+
+            if count > LEGACY_MAX_MEMBERSHIPS:
+                _logger.info(
+                    "MIS member collection of %s memberships (%s individuals): %.3fs",
+                    count,
+                    len(collected),
+                    collector_time,
+                )
+                continue
+
+            start = time.perf_counter()
+            scanned = legacy_collect(groups)
+            legacy_time = time.perf_counter() - start
+
+            self.assertEqual(collected, scanned)
+            _logger.info(
+                "MIS member collection of %s memberships (%s individuals): list scan %.3fs, "
+                "collector %.3fs, %.0fx faster",
+                count,
+                len(collected),
+                legacy_time,
+                collector_time,
+                legacy_time / collector_time,
+            )
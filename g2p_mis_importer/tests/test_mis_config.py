@@ -0,0 +1,175 @@
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+from odoo.tests.common import TransactionCase
+
+from odoo.addons.g2p_mis_importer.models.mis_config import MisConfig
+
+from .mis_server import START, FakeMIS, mis_date, mis_groups, mis_member
+
+
+class TestMisConfigPaging(TransactionCase):
+    def _config(self, **vals):
+        return self.env["mis.config"].new(
+            dict(
+                {
+                    "name": "Test MIS",
+                    "mis_api_url": "http://mis.example.com/api/groups",
+                    "page_size": 2,
+                },
+                **vals,
+            )
+        )
+
+    def _pages(self, config, mis, cursor=None):
+        with patch("requests.get", mis.get):
+            return [[group["id"] for group in page] for page in config._iter_record_pages(cursor)]
+
+    def test_pages_a_static_delta(self):
+        mis = FakeMIS(mis_groups(5))
+
+        self.assertEqual(self._pages(self._config(), mis), [[1, 2], [3, 4], [5]])
+        self.assertNotIn("updated_after", mis.requests[0])
+        self.assertEqual(mis.requests[1]["after_id"], 2)
+
+    def test_starts_after_last_updated_at(self):
+        mis = FakeMIS(mis_groups(5))
+        config = self._config(last_updated_at=START + timedelta(seconds=1))
+
+        self.assertEqual(self._pages(config, mis), [[2, 3], [4, 5]])
+        self.assertEqual(mis.requests[0]["after_id"], 0)
+
+    def test_pages_groups_sharing_a_write_date(self):
+        # Groups written in one transaction share their write date across page boundaries
+        mis = FakeMIS(mis_groups(5, per_date=5))
+
+        self.assertEqual(self._pages(self._config(), mis), [[1, 2], [3, 4], [5]])
+        self.assertEqual(mis.requests[1]["updated_after"], mis.requests[2]["updated_after"])
+        self.assertEqual((mis.requests[1]["after_id"], mis.requests[2]["after_id"]), (2, 4))
+
+    def test_group_written_during_the_import_does_not_shift_the_others(self):
+        mis = FakeMIS(
+            mis_groups(3, per_date=3),
+            on_request=lambda count: count == 2 and mis.touch(1, START + timedelta(hours=1)),
+        )
+
+        self.assertEqual(self._pages(self._config(), mis), [[1, 2], [3, 1]])
+
+    def test_resumes_after_cursor(self):
+        groups = mis_groups(4, per_date=4)
+        mis = FakeMIS(groups)
+
+        self.assertEqual(self._pages(self._config(), mis, cursor=(START, 2)), [[3, 4]])
+
+    def test_mis_ignoring_the_parameters(self):
+        for count in (2, 3):
+            mis = FakeMIS(mis_groups(count), ignore_params=True)
+            pages = self._pages(self._config(), mis)
+
+            self.assertEqual([group_id for page in pages for group_id in page], list(range(1, count + 1)))
+            self.assertLessEqual(len(mis.requests), 2)
+
+
+class TestMisConfigImport(TransactionCase):
+    def setUp(self):
+        super().setUp()
+        self.config = self.env["mis.config"].create(
+            {
+                "name": "Test MIS",
+                "mis_api_url": "http://mis.example.com/api/groups",
+                "mis_login_url": "http://mis.example.com/web/session/authenticate",
+                "mis_logout_url": "http://mis.example.com/web/session/destroy",
+                "database": "mis",
+                "username": "admin",
+                "password": "admin",
+                "mis_id_type": self.env["g2p.id.type"].create({"name": "MIS ID"}).id,
+                "mis_program_id": self.env["g2p.program"].create({"name": "MIS Program"}).id,
+                "page_size": 2,
+            }
+        )
+
+    def _import(self, mis, commit=True):
+        """Run an import against ``mis``, returns whether it scheduled a continuation."""
+        with patch("requests.get", mis.get), patch.object(MisConfig, "login"), patch.object(
+            MisConfig, "logout"
+        ), patch.object(self.env.cr, "commit"), patch.object(MisConfig, "_continue_import") as continued:
+            self.config._import_delta(commit=commit)
+        return continued.called
+
+    def _groups(self, is_group=True):
+        """The names of the imported groups, or individuals, by MIS id."""
+        reg_ids = self.env["g2p.reg.id"].search(
+            [("id_type", "=", self.config.mis_id_type.id), ("partner_id.is_group", "=", is_group)]
+        )
+        return {int(reg_id.value): reg_id.partner_id.name for reg_id in reg_ids}
+
+    def test_stops_at_the_record_budget(self):
+        groups = mis_groups(5)
+        self.config.max_run_records = 3
+
+        self.assertTrue(self._import(FakeMIS(groups)))
+        self.assertEqual(sorted(self._groups()), [1, 2, 3, 4])
+        self.assertEqual(self.config._get_resume_cursor(), (START + timedelta(seconds=3), 4))
+        self.assertTrue(self.config.resume_started_at)
+        self.assertFalse(self.config.last_updated_at)
+
+    def test_resumes_after_the_cursor(self):
+        groups = mis_groups(5)
+        started_at = datetime(2024, 2, 1)
+        self.config.write(
+            {
+                "resume_write_date": (START + timedelta(seconds=3)).isoformat(),
+                "resume_record_id": 4,
+                "resume_started_at": started_at,
+            }
+        )
+        mis = FakeMIS(groups)
+
+        self.assertFalse(self._import(mis))
+        self.assertEqual(mis.requests[0]["updated_after"], mis_date(START + timedelta(seconds=3)))
+        self.assertEqual(list(self._groups()), [5])
+        # The delta is done, the next one starts from the time its first run started
+        self.assertFalse(self.config._get_resume_cursor())
+        self.assertFalse(self.config.resume_started_at)
+        self.assertEqual(self.config.last_updated_at, started_at)
+
+    def test_budget_reached_with_the_last_page_ends_the_import(self):
+        # A short last page tells the delta ended, a full one takes asking the MIS for the next
+        for count, requests in ((3, 2), (4, 3)):
+            self.config.write({"max_run_records": count, "last_updated_at": False})
+            mis = FakeMIS(mis_groups(count, start=START + timedelta(days=count)))
+
+            self.assertFalse(self._import(mis))
+            self.assertEqual(len(mis.requests), requests)
+            self.assertFalse(self.config._get_resume_cursor())
+            self.assertTrue(self.config.last_updated_at)
+
+    def test_imports_a_member_edited_without_its_group(self):
+        groups = mis_groups(2)
+        groups[0]["members"] = [mis_member(10, START)]
+        self._import(FakeMIS(groups), commit=False)
+        self.config.last_updated_at = START + timedelta(days=1)
+
+        # Only the individual is written, the group row keeps its write date
+        individual = groups[0]["members"][0]["individual"]
+        individual.update(
+            {"name": "Individual 10 renamed", "write_date": mis_date(START + timedelta(days=2))}
+        )
+        mis = FakeMIS(groups)
+        self._import(mis, commit=False)
+
+        self.assertEqual(self._groups(is_group=False), {10: "Individual 10 renamed"})
+        self.assertEqual(mis.requests[0]["updated_after"], mis_date(START + timedelta(days=1)))
+
+    def test_group_imported_earlier_in_the_run_is_updated(self):
+        groups = mis_groups(3, per_date=3)
+
+        def rename_group_1(count):
+            if count == 2:
+                mis.touch(1, START + timedelta(hours=1))
+                groups[0]["name"] = "Group 1 renamed"
+
+        mis = FakeMIS(groups, on_request=rename_group_1)
+
+        self._import(mis, commit=False)
+        self.assertEqual(self._groups(), {1: "Group 1 renamed", 2: "Group 2", 3: "Group 3"})
@@ -0,0 +1,37 @@
+from odoo.tests.common import TransactionCase
+
+from odoo.addons.g2p_mis_importer.models.mis_members import MemberCollector
+
+
+def group(group_id, *individuals):
+    return {"id": group_id, "members": [{"individual": individual} for individual in individuals]}
+
+
+class TestMemberCollector(TransactionCase):
+    def test_collects_each_individual_once_in_first_seen_order(self):
+        members = MemberCollector()
+        members.add_group_members(group(1, {"id": 3}, {"id": 1}))
+        members.add_group_members(group(2, {"id": 2}, {"id": 3}))
+
+        self.assertEqual([individual["id"] for individual in members], [3, 1, 2])
+        self.assertEqual(len(members), 3)
+
+    def test_latest_copy_of_an_individual_wins(self):
+        older = {"id": 1, "name": "Old", "write_date": "2024-01-01T00:00:00.000000+0000", "email": "a@b.c"}
+        newer = {"id": 1, "name": "New", "write_date": "2024-01-02T00:00:00.000000+0000"}
+
+        for first, second in ((older, newer), (newer, older)):
+            members = MemberCollector()
+            members.add_group_members(group(1, first))
+            members.add_group_members(group(2, second))
+            # Fields missing from the latest copy are taken from the older one
+            self.assertEqual(list(members), [dict(newer, email="a@b.c")])
+
+    def test_first_copy_wins_on_the_same_write_date(self):
+        first = {"id": 1, "name": "First", "write_date": "2024-01-01T00:00:00.000000+0000"}
+        second = {"id": 1, "name": "Second", "write_date": "2024-01-01T00:00:00.000000+0000"}
+        members = MemberCollector()
+        members.add(first)
+        members.add(second)
+
+        self.assertEqual(list(members), [first])
@@ -0,0 +1,75 @@
+from unittest.mock import MagicMock
+
+from odoo.tests.common import TransactionCase
+
+from odoo.addons.g2p_mis_importer.models.mis_reference_cache import ReferenceDataResolver
+
+
+class TestReferenceDataResolver(TransactionCase):
+    def setUp(self):
+        super().setUp()
+        self.tables = {
+            "g2p.id.type": [{"id": 1, "name": "National ID"}],
+            "res.bank": [{"id": 2, "name": "Bank A"}],
+            "g2p.group.kind": [{"id": 3, "name": "Household"}],
+            "g2p.group.membership.kind": [{"id": 4, "name": "Head"}],
+        }
+        self.models = {}
+        for model, rows in self.tables.items():
+            model_mock = MagicMock()
+            model_mock.sudo.return_value = model_mock
+            model_mock.search_read.return_value = rows
+            model_mock.create.side_effect = lambda vals_list: MagicMock(
+                ids=list(range(10, 10 + len(vals_list)))
+            )
+            self.models[model] = model_mock
+        self.env_mock = MagicMock()
+        self.env_mock.__getitem__.side_effect = self.models.__getitem__
+        individual = {
+            "id": 2,
+            "ids": [{"id_type": "National ID", "value": "1"}, {"id_type": "Passport", "value": "2"}],
+            "bank_ids": [{"bank_name": "Bank B"}, {"bank_name": "Bank C"}],
+        }
+        self.page = [
+            {
+                "id": 1,
+                "kind": "Household",
+                "ids": [],
+                "bank_ids": [{"bank_name": "Bank A"}],
+                "members": [{"individual": individual, "kind": [{"name": "Head"}, {"name": "Spouse"}]}],
+            }
+        ]
+
+    def test_resolves_from_preloaded_tables(self):
+        references = ReferenceDataResolver(self.env_mock)
+        references.preload()
+        references.prepare(self.page)
+
+        for _i in range(3):
+            self.assertEqual(references.id_type_id("National ID"), 1)
+            self.assertEqual(references.bank_id("Bank A"), 2)
+            self.assertEqual(references.group_kind_id("Household"), 3)
+            self.assertEqual(references.membership_kind_id("Head"), 4)
+        self.assertIsNone(references.group_kind_id(None))
+        for model_mock in self.models.values():
+            self.assertEqual(model_mock.search_read.call_count, 1)
+            model_mock.search.assert_not_called()
+
+    def test_creates_missing_banks_and_kinds_in_one_batch(self):
+        references = ReferenceDataResolver(self.env_mock)
+        references.prepare(self.page)
+
+        self.models["res.bank"].create.assert_called_once_with([{"name": "Bank B"}, {"name": "Bank C"}])
+        self.models["g2p.group.membership.kind"].create.assert_called_once_with([{"name": "Spouse"}])
+        self.models["g2p.group.kind"].create.assert_not_called()
+        self.assertEqual((references.bank_id("Bank B"), references.bank_id("Bank C")), (10, 11))
+        self.assertEqual(references.membership_kind_id("Spouse"), 10)
+        self.assertEqual(references.created, 3)
+
+    def test_reports_unknown_id_types(self):
+        references = ReferenceDataResolver(self.env_mock)
+        references.prepare(self.page)
+
+        self.models["g2p.id.type"].create.assert_not_called()
+        self.assertIsNone(references.id_type_id("Passport"))
+        self.assertEqual(references.unresolved["g2p.id.type"], {"Passport"})
@@ -0,0 +1,43 @@
+from unittest.mock import MagicMock
+
+from odoo.tests.common import TransactionCase
+
+from odoo.addons.g2p_mis_importer.models.mis_registrant_resolver import RegistrantResolver
+
+
+class TestRegistrantResolver(TransactionCase):
+    def setUp(self):
+        super().setUp()
+        self.reg_id_model = MagicMock()
+        self.reg_id_model.sudo.return_value = self.reg_id_model
+        self.reg_id_model.search_read.return_value = [
+            {"value": "1", "partner_id": (11, "Group 1")},
+            {"value": "2", "partner_id": (12, "Group 2")},
+        ]
+        self.env_mock = MagicMock()
+        self.env_mock.__getitem__.side_effect = {"g2p.reg.id": self.reg_id_model}.__getitem__
+
+    def test_resolves_unknown_ids_in_one_query(self):
+        resolver = RegistrantResolver(self.env_mock, 7)
+        resolver.remember(3, True, 13)
+        resolver.resolve([1, 2, 3, 4], True)
+
+        domain = self.reg_id_model.search_read.call_args.args[0]
+        self.assertEqual(domain[0], ("id_type", "=", 7))
+        self.assertEqual(sorted(domain[1][2]), ["1", "2", "4"])
+        self.assertEqual(domain[2], ("partner_id.is_group", "=", True))
+        self.assertEqual(
+            [resolver.partner_id(remote_id, True) for remote_id in (1, 2, 3, 4)], [11, 12, 13, False]
+        )
+        # Known and missing ids are not looked up again
+        resolver.resolve([1, 2, 3, 4], True)
+        self.assertEqual(resolver.queries, 1)
+
+    def test_groups_and_individuals_are_resolved_separately(self):
+        resolver = RegistrantResolver(self.env_mock, 7)
+        resolver.remember(1, True, 11)
+        self.reg_id_model.search_read.return_value = [{"value": "1", "partner_id": (21, "Individual 1")}]
+
+        self.assertEqual(resolver.partner_id(1, False), 21)
+        self.assertEqual(resolver.partner_id(1, True), 11)
+        self.assertEqual(resolver.queries, 1)
@@ -15,11 +15,13 @@
     ],
     "data": [
         "security/ir.model.access.csv",
+        "data/queue_job_data.xml",
         "views/odk_config_views.xml",
         "views/odk_menu.xml",
     ],
     "external_dependencies": {
         "python": [
+            "ijson",
             "pyjq",
         ]
     },
@@ -2,3 +2,5 @@
 
 from . import odk_client
 from . import odk_config
+from . import odk_import_run
+from . import odk_submission_binding
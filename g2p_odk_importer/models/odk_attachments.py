@@ -0,0 +1,145 @@
+import hashlib
+import logging
+import mimetypes
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+_logger = logging.getLogger(__name__)
+
+# Size of the chunks attachments are downloaded and hashed by
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+
+class AttachmentDownloader:
+    """Download the media attachments of imported submissions and store them on their registrant.
+
+    The attachments of a page are listed and downloaded by a pool of threads,
+    each file being streamed in chunks to a temporary file while its SHA-1 is
+    computed. Files whose content is already attached to the registrant are
+    skipped, the others are stored as ``ir.attachment`` from the Odoo thread.
+    """
+
+    def __init__(self, client, workers=4):
+        self.client = client
+        self.workers = max(workers or 1, 1)
+        self.stored = 0
+        self.skipped = 0
+        self.failed = 0
+
+    def _submission_url(self, instance_id):
+        client = self.client
+        return (
+            f"{client.base_url}/v1/projects/{client.project_id}/forms/{client.form_id}"
+            f"/submissions/{quote(instance_id, safe=':')}/attachments"
+        )
+
+    def list_attachments(self, instance_id):
+        """Return the names of the attachments of a submission which were uploaded."""
+        response = self.client._get(self._submission_url(instance_id))
+        response.raise_for_status()
+        return [attachment["name"] for attachment in response.json() if attachment.get("exists", True)]
+
+    def download(self, instance_id, name, directory):
+        """Stream an attachment to a file of ``directory``, returns its path and SHA-1."""
+        sha1 = hashlib.sha1()
+        response = self.client._get(f"{self._submission_url(instance_id)}/{quote(name)}", stream=True)
+        try:
+            response.raise_for_status()
+            file_descriptor, path = tempfile.mkstemp(dir=directory)
+            with os.fdopen(file_descriptor, "wb") as attachment_file:
+                for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                    sha1.update(chunk)
+                    attachment_file.write(chunk)
+        finally:
+            self.client._count_bytes(response)
+            response.close()
+        return path, sha1.hexdigest()
+
+    def _fetch_submission(self, instance_id, partner_id, directory):
+        files = []
+        try:
+            names = self.list_attachments(instance_id)
+        except Exception as e:
+            _logger.error("Failed to list the attachments of ODK submission %s: %s", instance_id, e)
+            return files, 1
+        failed = 0
+        for name in names:
+            try:
+                path, checksum = self.download(instance_id, name, directory)
+            except Exception as e:
+                failed += 1
+                _logger.error(
+                    "Failed to download attachment %s of ODK submission %s: %s", name, instance_id, e
+                )
+                continue
+            files.append({"partner_id": partner_id, "name": name, "path": path, "checksum": checksum})
+        return files, failed
+
+    def import_attachments(self, env, submissions):
+        """Download and attach the attachments of ``(submission, partner id)`` pairs.
+
+        Submissions known to have no attachment are not listed.
+        """
+        submissions = [
+            (member["__id"], partner_id)
+            for member, partner_id in submissions
+            if member.get("__id") and (member.get("__system") or {}).get("attachmentsPresent") != 0
+        ]
+        if not submissions:
+            return
+        with tempfile.TemporaryDirectory() as directory:
+            with ThreadPoolExecutor(
+                max_workers=self.workers, thread_name_prefix="odk_attachments"
+            ) as executor:
+                fetched = list(
+                    executor.map(
+                        lambda submission: self._fetch_submission(*submission, directory), submissions
+                    )
+                )
+            files = []
+            for submission_files, failed in fetched:
+                files.extend(submission_files)
+                self.failed += failed
+            self._store(env, files)
+
+    def _store(self, env, files):
+        if not files:
+            return
+        attachment_model = env["ir.attachment"].sudo()
+        existing = {
+            (attachment["res_id"], attachment["checksum"])
+            for attachment in attachment_model.search_read(
+                [
+                    ("res_model", "=", "res.partner"),
+                    ("res_id", "in", list({file["partner_id"] for file in files})),
+                    ("checksum", "in", list({file["checksum"] for file in files})),
+                ],
+                ["res_id", "checksum"],
+            )
+        }
+        for file in files:
+            if (file["partner_id"], file["checksum"]) in existing:
+                self.skipped += 1
+                continue
+            # ir.attachment only takes the content as a whole: read one file at a time
+            with open(file["path"], "rb") as attachment_file:
+                raw = attachment_file.read()
+            try:
+                with env.cr.savepoint():
+                    attachment_model.create(
+                        {
+                            "name": file["name"],
+                            "res_model": "res.partner",
+                            "res_id": file["partner_id"],
+                            "raw": raw,
+                            "mimetype": mimetypes.guess_type(file["name"])[0] or "application/octet-stream",
+                        }
+                    )
+            except Exception:
+                self.failed += 1
+                _logger.exception("Failed to store attachment %s", file["name"])
+                continue
+            existing.add((file["partner_id"], file["checksum"]))
+            self.stored += 1
@@ -0,0 +1,70 @@
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+class PartnerBatchWriter:
+    """Buffer res.partner vals and create them with one multi-create per chunk.
+
+    Each chunk is created inside a savepoint. When a chunk fails, its records
+    are retried one by one so a single bad record only loses itself.
+    """
+
+    def __init__(self, env, chunk_size=100):
+        self.env = env
+        self.chunk_size = max(chunk_size or 1, 1)
+        self.pending = []
+        self.created = 0
+        self.updated = 0
+        self.failed = 0
+        self.partner_ids = {}
+
+    def add(self, vals, key=None):
+        """Queue ``vals`` for creation, ``key`` identifies the record in ``partner_ids``."""
+        self.pending.append((key, vals))
+        if len(self.pending) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        while self.pending:
+            chunk = self.pending[: self.chunk_size]
+            del self.pending[: self.chunk_size]
+            self._create_chunk(chunk)
+
+    def _create_chunk(self, chunk):
+        partner_model = self.env["res.partner"].sudo()
+        try:
+            with self.env.cr.savepoint():
+                partners = partner_model.create([vals for _key, vals in chunk])
+        except Exception as e:
+            _logger.warning("Creating %s partners at once failed (%s), retrying one by one", len(chunk), e)
+        else:
+            self.created += len(chunk)
+            for (key, _vals), partner_id in zip(chunk, partners.ids):
+                if key is not None:
+                    self.partner_ids[key] = partner_id
+            return
+
+        for key, vals in chunk:
+            try:
+                with self.env.cr.savepoint():
+                    partner = partner_model.create(vals)
+            except Exception:
+                self.failed += 1
+                _logger.exception("Failed to create partner %s", key if key is not None else "")
+            else:
+                self.created += 1
+                if key is not None:
+                    self.partner_ids[key] = partner.id
+
+    def write(self, partner_id, vals, key=None):
+        """Write ``vals`` on an existing partner inside a savepoint, returns whether it succeeded."""
+        try:
+            with self.env.cr.savepoint():
+                self.env["res.partner"].sudo().browse(partner_id).write(vals)
+        except Exception:
+            self.failed += 1
+            _logger.exception("Failed to update partner %s", key if key is not None else partner_id)
+            return False
+        self.updated += 1
+        return True
@@ -1,15 +1,103 @@
+import hashlib
 import json
 import logging
-from datetime import date
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
 
-import pyjq
+import ijson
 import requests
+from requests.adapters import HTTPAdapter
 
 from odoo import _
 from odoo.exceptions import ValidationError
 
+from .odk_attachments import AttachmentDownloader
+from .odk_batch_writer import PartnerBatchWriter
+from .odk_export import iter_export_submissions
+from .odk_field_mapping import field_mapping_names
+from .odk_reference_cache import ReferenceDataResolver
+from .odk_transform import formatter_field_names, iter_transformed, transform_page
+
 _logger = logging.getLogger(__name__)
 
+SUBMISSION_DATE = "__system/submissionDate"
+SUBMISSION_DATE_FORMAT = "%Y-%m-%dT%H:%M:%S.%fZ"
+
+# Submission keys fetched per request when splitting a delta into page ranges
+KEY_PAGE_SIZE = 1000
+HTTP_POOL_SIZE = 8
+# Phases the time of an import is split into, see ODKClient._timed
+IMPORT_PHASES = ("fetch", "transform", "lookup", "write")
+# Central tokens are reused until this close to their expiry
+TOKEN_EXPIRY_MARGIN = timedelta(minutes=5)
+TOKEN_DEFAULT_LIFETIME = timedelta(hours=24)
+FORM_SCHEMA_LIFETIME = timedelta(hours=1)
+
+# Keep-alive HTTP sessions per Central server, session tokens per (server, user, password hash) and
+# form schemas per (server, project, form), shared by every client of the worker process.
+_http_sessions = {}
+_tokens = {}
+_form_schemas = {}
+_lock = threading.Lock()
+
+
+def get_http_session(base_url):
+    with _lock:
+        http = _http_sessions.get(base_url)
+        if http is None:
+            http = requests.Session()
+            http.headers["Accept-Encoding"] = "gzip, deflate"
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_SIZE)
+            http.mount("http://", adapter)
+            http.mount("https://", adapter)
+            _http_sessions[base_url] = http
+        return http
+
+
+def _next_millisecond(submission_date):
+    """The submission date one millisecond after ``submission_date``.
+
+    Central may store submission dates more precisely than the milliseconds it
+    sends, so ``le`` the date of a submission can leave that submission out.
+    """
+    value = datetime.strptime(submission_date, SUBMISSION_DATE_FORMAT) + timedelta(milliseconds=1)
+    return value.strftime(SUBMISSION_DATE_FORMAT)[:-4] + "Z"
+
+
+def clear_token_cache():
+    with _lock:
+        _tokens.clear()
+
+
+def iter_odata_values(stream, data):
+    """Decode the entries of the ``value`` array of an OData JSON document one at a time.
+
+    The other top-level properties (``@odata.count``...) are stored into ``data``.
+    """
+    events = ijson.parse(stream, use_float=True)
+    key = None
+    for prefix, event, value in events:
+        if prefix == "" and event == "map_key":
+            key = value
+        elif key == "value" and prefix == "value.item":
+            builder = ijson.ObjectBuilder()
+            builder.event(event, value)
+            depth = 1 if event in ("start_map", "start_array") else 0
+            while depth:
+                prefix, event, value = next(events)
+                builder.event(event, value)
+                if event in ("start_map", "start_array"):
+                    depth += 1
+                elif event in ("end_map", "end_array"):
+                    depth -= 1
+            yield builder.value
+        elif key is not None and prefix == key and event in ("null", "boolean", "number", "string"):
+            data[key] = value
+
 
 class ODKClient:
     def __init__(
@@ -22,6 +110,14 @@ class ODKClient:
         form_id,
         target_registry,
         json_formatter=".",
+        batch_size=100,
+        config_id=None,
+        stream=False,
+        project_fields=False,
+        transform_workers=0,
+        fetch_workers=0,
+        mapping_engine="jq",
+        attachment_workers=0,
     ):
         self.base_url = base_url.rstrip("/")
         self.username = username
@@ -29,30 +125,87 @@ class ODKClient:
         self.project_id = project_id
         self.form_id = form_id
         self.session = None
+        self.http = get_http_session(self.base_url)
         self.env = env
         self.json_formatter = json_formatter
+        self.mapping_engine = mapping_engine
         self.target_registry = target_registry
+        self.batch_size = batch_size
+        self.config_id = config_id
+        self.stream = stream
+        self.project_fields = project_fields
+        self.transform_workers = transform_workers
+        self.fetch_workers = min(fetch_workers, HTTP_POOL_SIZE)
+        self.bytes_downloaded = 0
+        self._bytes_lock = threading.Lock()
+        self.timings = {phase: [0.0, 0.0] for phase in IMPORT_PHASES}
+        self._phase_stack = []
+        self._projection = None
+        self.references = ReferenceDataResolver(env)
+        self.attachments = (
+            AttachmentDownloader(self, min(attachment_workers, HTTP_POOL_SIZE))
+            if attachment_workers
+            else None
+        )
+
+    @property
+    def _token_key(self):
+        # With the password, a token is not reused once the password is changed, e.g. to test it
+        return self.base_url, self.username, hashlib.sha256((self.password or "").encode()).hexdigest()
+
+    def login(self, force=False):
+        """Get a session token, reusing the cached one of these credentials while it is valid."""
+        token_key = self._token_key
+        if not force:
+            with _lock:
+                token, expires_at = _tokens.get(token_key, (None, None))
+            if token and expires_at - TOKEN_EXPIRY_MARGIN > datetime.utcnow():
+                self.session = token
+                return
 
-    def login(self):
         login_url = f"{self.base_url}/v1/sessions"
         headers = {"Content-Type": "application/json"}
         data = json.dumps({"email": self.username, "password": self.password})
         try:
-            response = requests.post(login_url, headers=headers, data=data)
+            response = self.http.post(login_url, headers=headers, data=data)
             response.raise_for_status()
             if response.status_code == 200:
-                self.session = response.json()["token"]
+                session = response.json()
+                self.session = session["token"]
+                with _lock:
+                    _tokens[token_key] = (self.session, self._token_expiry(session.get("expiresAt")))
         except Exception as e:
             _logger.exception("Login failed: %s", e)
             raise ValidationError(f"Login failed: {e}") from e
 
+    @staticmethod
+    def _token_expiry(expires_at):
+        try:
+            return datetime.strptime(expires_at, "%Y-%m-%dT%H:%M:%S.%fZ")
+        except (TypeError, ValueError):
+            return datetime.utcnow() + TOKEN_DEFAULT_LIFETIME
+
+    def _get(self, url, **kwargs):
+        """GET ``url`` with the session token, logging in again once if Central rejects it."""
+        headers = dict(kwargs.pop("headers", None) or {})
+        headers["Authorization"] = f"Bearer {self.session}"
+        response = self.http.get(url, headers=headers, **kwargs)
+        if response.status_code == 401:
+            _logger.info("ODK Central session expired, logging in again")
+            with _lock:
+                if _tokens.get(self._token_key, (None,))[0] == self.session:
+                    del _tokens[self._token_key]
+            self.login(force=True)
+            headers = dict(headers, Authorization=f"Bearer {self.session}")
+            response = self.http.get(url, headers=headers, **kwargs)
+        return response
+
     def test_connection(self):
         if not self.session:
             raise ValidationError(_("Session not created"))
         info_url = f"{self.base_url}/v1/users/current"
-        headers = {"Authorization": f"Bearer {self.session}"}
         try:
-            response = requests.get(info_url, headers=headers)
+            response = self._get(info_url)
             response.raise_for_status()
             if response.status_code == 200:
                 user = response.json()
@@ -62,165 +215,824 @@ class ODKClient:
             _logger.exception("Connection test failed: %s", e)
             raise ValidationError(f"Connection test failed: {e}") from e
 
-    # TODO: Split the methods into smaller methods
-    # flake8: noqa: C901
+    def _submissions_url(self):
+        return f"{self.base_url}/v1/projects/{self.project_id}/forms/{self.form_id}.svc/Submissions"
+
+    @staticmethod
+    def submission_key(member):
+        """Return the (submissionDate, __id) keyset position of a submission, if present."""
+        submission_date = (member.get("__system") or {}).get("submissionDate")
+        instance_id = member.get("__id")
+        if not submission_date or not instance_id:
+            return None
+        return submission_date, instance_id
+
+    def _page_params(self, last_sync_timestamp=None, cursor=None, top=100, until=None, select=None):
+        params = {
+            "$top": top,
+            "$count": "true",
+            "$orderby": f"{SUBMISSION_DATE} asc,__id asc",
+        }
+        if select:
+            params["$select"] = select
+        elif self.project_fields:
+            params.update(self._get_projection())
+        else:
+            params["$expand"] = "*"
+        filters = []
+        if last_sync_timestamp:
+            startdate = last_sync_timestamp.strftime("%Y-%m-%dT%H:%M:%S.000Z")
+            filters.append(f"{SUBMISSION_DATE} ge {startdate}")
+        if cursor:
+            # Submissions sharing the cursor's submissionDate are re-sent by Central
+            # and dropped client side by __id, see iter_submission_pages.
+            filters.append(f"{SUBMISSION_DATE} ge {cursor[0]}")
+        if until:
+            # Submissions after the key at that same date are dropped client side
+            filters.append(f"{SUBMISSION_DATE} lt {_next_millisecond(until[0])}")
+        if filters:
+            params["$filter"] = " and ".join(filters)
+        return params
+
+    def _get_submissions(self, params, stream=False):
+        """Fetch a page of submissions, returns the response properties and its submissions.
+
+        With ``stream`` the submissions are a generator decoding them one at a time
+        from the response body, and the properties are complete once it is exhausted.
+        """
+        try:
+            response = self._get(self._submissions_url(), params=params, stream=stream)
+            response.raise_for_status()
+        except Exception as e:
+            _logger.exception("Failed to parse response: %s", e)
+            raise ValidationError(f"Failed to parse response: {e}") from e
+        if not stream:
+            data = response.json()
+            self._count_bytes(response)
+            return data, data.get("value", [])
+        data = {}
+        return data, self._stream_values(response, data)
+
+    def _stream_values(self, response, data):
+        response.raw.decode_content = True
+        try:
+            yield from iter_odata_values(response.raw, data)
+        finally:
+            self._count_bytes(response)
+            response.close()
+
+    def _count_bytes(self, response):
+        wire_bytes = self._wire_bytes(response)
+        with self._bytes_lock:
+            self.bytes_downloaded += wire_bytes
+
+    @staticmethod
+    def _wire_bytes(response):
+        """Bytes of a consumed response as transferred, i.e. before gzip decoding."""
+        try:
+            return int(response.raw.tell())
+        except (AttributeError, TypeError, ValueError):
+            return len(response.content or b"")
+
+    def fetch_submissions(self, instance_ids):
+        """Fetch the submissions of ``instance_ids`` again, leaving out the ones Central no longer has."""
+        params = self._get_projection() if self.project_fields else {"$expand": "*"}
+        submissions = []
+        for instance_id in instance_ids:
+            # Quotes in an OData key are escaped by doubling them
+            url = "%s('%s')" % (self._submissions_url(), instance_id.replace("'", "''"))
+            try:
+                response = self._get(url, params=params)
+                if response.status_code == 404:
+                    _logger.warning("ODK submission %s no longer exists, not retrying it", instance_id)
+                    continue
+                response.raise_for_status()
+            except Exception as e:
+                _logger.exception("Failed to fetch ODK submission %s: %s", instance_id, e)
+                raise ValidationError(f"Failed to fetch ODK submission {instance_id}: {e}") from e
+            self._count_bytes(response)
+            submissions.extend(response.json().get("value", []))
+        return submissions
+
+    def _with_retried_pages(self, instance_ids, pages, top, pending):
+        """Yield the submissions of ``instance_ids`` fetched again by pages of ``top``, then ``pages``.
+
+        Each page of retried submissions is only fetched once the previous one
+        is imported. The ids Central no longer has are dropped from ``pending``,
+        the set of retried ids not imported yet.
+        """
+        try:
+            for start in range(0, len(instance_ids), top):
+                requested = instance_ids[start : start + top]
+                retried = self.fetch_submissions(requested)
+                pending.difference_update(set(requested) - {member.get("__id") for member in retried})
+                if retried:
+                    _logger.info("Retrying %s ODK submission(s) which failed to import", len(retried))
+                    yield retried
+            yield from pages
+        finally:
+            if hasattr(pages, "close"):
+                pages.close()
+
+    def get_form_fields(self):
+        """Return the OData schema of the form fields, cached per process for a while."""
+        schema_key = (self.base_url, self.project_id, self.form_id)
+        with _lock:
+            fields, fetched_at = _form_schemas.get(schema_key, (None, None))
+        if fields is not None and fetched_at + FORM_SCHEMA_LIFETIME > datetime.utcnow():
+            return fields
+
+        url = f"{self.base_url}/v1/projects/{self.project_id}/forms/{self.form_id}/fields"
+        try:
+            response = self._get(url, params={"odata": "true"})
+            response.raise_for_status()
+        except Exception as e:
+            _logger.exception("Failed to fetch the form fields: %s", e)
+            raise ValidationError(f"Failed to fetch the form fields: {e}") from e
+        fields = response.json()
+        with _lock:
+            _form_schemas[schema_key] = (fields, datetime.utcnow())
+        return fields
+
+    def _get_projection(self):
+        """OData parameters fetching only the top-level fields the formatter reads.
+
+        Central can only expand all repeats at once, so repeats are expanded only
+        when the formatter reads one of them.
+        """
+        if self._projection is None:
+            if self.mapping_engine == "fields":
+                names = field_mapping_names(self.json_formatter)
+            else:
+                names = formatter_field_names(self.json_formatter)
+            if names is None:
+                self._projection = {"$expand": "*"}
+            else:
+                selected = ["__id", "__system"]
+                expand = False
+                for field in self.get_form_fields():
+                    top_level = field["path"].strip("/").split("/")[0]
+                    if top_level in names and top_level not in selected:
+                        selected.append(top_level)
+                    if field["type"] == "repeat" and top_level in names:
+                        expand = True
+                self._projection = {"$select": ",".join(selected)}
+                if expand:
+                    self._projection["$expand"] = "*"
+                _logger.info("Fetching ODK fields %s", self._projection)
+        return self._projection
+
+    def iter_submission_pages(self, last_sync_timestamp=None, top=100, cursor=None, until=None, select=None):
+        """Yield pages of submissions ordered by submissionDate and __id until the delta is drained.
+
+        Pages are walked with a keyset cursor (the key of the last yielded submission)
+        instead of $skip, so submissions arriving during the run neither shift pages
+        nor get imported twice. ``cursor`` and ``until`` bound the walk to the
+        submissions after and up to (inclusive) the given keys.
+
+        When the client streams, each OData page is yielded in chunks of
+        ``batch_size`` submissions while it is being decoded.
+        """
+        chunk_size = self.batch_size if self.stream else None
+        page_size = top
+        first_page = True
+        while True:
+            # The submission at the cursor is sent again, ask for one more to fill the page
+            requested = page_size + 1 if cursor else page_size
+            params = self._page_params(last_sync_timestamp, cursor, requested, until=until, select=select)
+            data, values = self._get_submissions(params, stream=self.stream)
+            values_count = 0
+            last_key = None
+            reached_until = False
+            chunk = []
+            for member in values:
+                values_count += 1
+                key = self.submission_key(member)
+                if cursor and (key or cursor) <= cursor:
+                    continue
+                if until and (key or until) > until:
+                    reached_until = True
+                    continue
+                chunk.append(member)
+                last_key = key
+                if chunk_size and len(chunk) >= chunk_size:
+                    yield chunk
+                    chunk = []
+            if chunk:
+                yield chunk
+
+            if first_page:
+                _logger.info("ODK delta holds %s submission(s)", data.get("@odata.count", values_count))
+                first_page = False
+            if values_count and not last_key:
+                if cursor and values_count >= requested:
+                    # A full page of submissions sharing the cursor's submissionDate,
+                    # widen the page until it reaches past them.
+                    page_size *= 2
+                    continue
+                if not cursor:
+                    _logger.warning("ODK submissions carry no submissionDate/__id, stopping after one page")
+                    return
+            cursor = last_key or cursor
+
+            if (
+                reached_until
+                or values_count < requested
+                or data.get("@odata.count", values_count) <= values_count
+            ):
+                return
+            page_size = top
+
+    def list_page_ranges(self, last_sync_timestamp=None, top=100, cursor=None, until=None):
+        """Split the delta into ranges of ``top`` submissions without downloading their content.
+
+        Returns a list of ``(after, until)`` keyset bounds, ``after`` being exclusive
+        (``None`` for the first range) and ``until`` inclusive, to be passed to
+        :meth:`import_delta_records` as ``cursor`` and ``until``.
+        """
+        return list(self.iter_page_ranges(last_sync_timestamp, top=top, cursor=cursor, until=until))
+
+    def iter_page_ranges(self, last_sync_timestamp=None, top=100, cursor=None, until=None):
+        """Yield the ranges of :meth:`list_page_ranges` as their keys are listed.
+
+        Keys are listed ``KEY_PAGE_SIZE`` at a time, only as far as the ranges
+        consumed so far need.
+        """
+        keys = []
+        after = cursor
+        pages = self.iter_submission_pages(
+            last_sync_timestamp=last_sync_timestamp,
+            top=KEY_PAGE_SIZE,
+            cursor=cursor,
+            until=until,
+            select="__id,__system",
+        )
+        try:
+            for page in pages:
+                keys.extend(self.submission_key(member) for member in page)
+                while len(keys) >= top:
+                    range_until, keys = keys[top - 1], keys[top:]
+                    yield after, range_until
+                    after = range_until
+            if keys:
+                yield after, keys[-1]
+        finally:
+            pages.close()
+
+    def iter_concurrent_pages(self, last_sync_timestamp=None, top=100, cursor=None, until=None):
+        """Yield the same pages as :meth:`iter_submission_pages`, downloading several at a time.
+
+        The delta is split lazily with :meth:`iter_page_ranges`, then up to
+        ``fetch_workers`` ranges are downloaded by threads while the caller
+        processes the previous ones. Pages are yielded in order and at most
+        twice ``fetch_workers`` downloaded ranges are held in memory, so an
+        import stopping at its budget does not list the rest of the delta.
+        """
+        if self.project_fields:
+            self._get_projection()
+        ranges = self.iter_page_ranges(last_sync_timestamp, top=top, cursor=cursor, until=until)
+        _logger.info("Fetching ODK pages with %s threads", self.fetch_workers)
+
+        def fetch(after, range_until):
+            # A range holds ``top`` submissions but Central also re-sends those sharing
+            # the submissionDate of ``after``: leave room for them, ``until`` bounds the page.
+            return list(
+                self.iter_submission_pages(last_sync_timestamp, top=2 * top, cursor=after, until=range_until)
+            )
+
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=self.fetch_workers, thread_name_prefix="odk_fetch") as executor:
+            try:
+                for after, range_until in ranges:
+                    pending.append(executor.submit(fetch, after, range_until))
+                    if len(pending) >= 2 * self.fetch_workers:
+                        yield from pending.popleft().result()
+                while pending:
+                    yield from pending.popleft().result()
+            finally:
+                ranges.close()
+                for future in pending:
+                    future.cancel()
+
+    @contextmanager
+    def _timed(self, phase):
+        """Add the wall and CPU time spent in the block to ``timings[phase]``.
+
+        Phases may be nested, the time of a nested phase is only counted in it.
+        CPU time is the one of the calling thread: downloads in fetch threads and
+        transform worker processes only show up as wall time.
+        """
+        wall, cpu = time.perf_counter(), time.thread_time()
+        self._phase_stack.append([0.0, 0.0])
+        try:
+            yield
+        finally:
+            nested_wall, nested_cpu = self._phase_stack.pop()
+            wall, cpu = time.perf_counter() - wall, time.thread_time() - cpu
+            self.timings[phase][0] += wall - nested_wall
+            self.timings[phase][1] += cpu - nested_cpu
+            if self._phase_stack:
+                self._phase_stack[-1][0] += wall
+                self._phase_stack[-1][1] += cpu
+
+    def _timed_iter(self, phase, iterable):
+        """Iterate over ``iterable``, timing the production of each item as ``phase``.
+
+        Closing the iteration closes ``iterable`` too.
+        """
+        iterator = iter(iterable)
+        try:
+            while True:
+                with self._timed(phase):
+                    item = next(iterator, StopIteration)
+                if item is StopIteration:
+                    return
+                yield item
+        finally:
+            if hasattr(iterator, "close"):
+                iterator.close()
+
     def import_delta_records(
         self,
         last_sync_timestamp=None,
         program_id=None,
-        skip=0,
         top=100,
+        cursor=None,
+        until=None,
+        on_page_done=None,
+        max_seconds=0,
+        max_records=0,
+        retry_instance_ids=(),
     ):
+        """Import the submissions after ``cursor`` (up to ``until``) page by page.
 
-        url = f"{self.base_url}/v1/projects/{self.project_id}/forms/{self.form_id}.svc/Submissions"
-        if last_sync_timestamp:
-            startdate = last_sync_timestamp.strftime("%Y-%m-%dT%H:%M:%S.000Z")
-            params = {
-                "$top": top,
-                "$skip": skip,
-                "$count": "true",
-                "$expand": "*",
-                "$filter": "__system/submissionDate ge " + startdate,
-            }
-        else:
-            params = {"$top": top, "$skip": skip, "$count": "true", "$expand": "*"}
+        ``on_page_done`` is called once the registrants of each page are created
+        with the key of the latest imported submission and the instance ids of
+        the submissions to retry in a later run, to persist the sync position:
+        those which failed so far, and those of ``retry_instance_ids`` not
+        imported yet. The submissions of ``retry_instance_ids``, which failed in
+        a previous run, are fetched and imported again first.
 
-        headers = {"Authorization": f"Bearer {self.session}"}
+        The import stops after the page that takes it past ``max_seconds`` or
+        ``max_records`` (0 for no limit), flagging the result ``budget_exhausted``:
+        the submissions after its ``cursor`` are left for the next run.
+
+        Besides the import counters, the result holds the wall and CPU time of
+        the import and of each of its :data:`IMPORT_PHASES`.
+        """
+        iter_pages = self.iter_concurrent_pages if self.fetch_workers > 1 else self.iter_submission_pages
+        pages = iter_pages(last_sync_timestamp=last_sync_timestamp, top=top, cursor=cursor, until=until)
+        retry_pending = set(retry_instance_ids)
+        if retry_instance_ids:
+            pages = self._with_retried_pages(list(retry_instance_ids), pages, top, retry_pending)
+        return self._import_pages(
+            pages,
+            program_id,
+            cursor=cursor,
+            on_page_done=on_page_done,
+            retry_pending=retry_pending,
+            max_seconds=max_seconds,
+            max_records=max_records,
+        )
+
+    def import_submissions(self, instance_ids, program_id=None, top=100):
+        """Fetch the submissions of ``instance_ids`` again and import them, e.g. those which failed."""
+        pending = set(instance_ids)
+        pages = self._with_retried_pages(list(instance_ids), iter(()), top, pending)
+        return self._import_pages(pages, program_id, retry_pending=pending)
+
+    def download_export(self, path):
+        """Download the CSV export of the form submissions (without attachments) to ``path``."""
+        url = f"{self.base_url}/v1/projects/{self.project_id}/forms/{self.form_id}/submissions.csv.zip"
         try:
-            response = requests.get(url, headers=headers, params=params)
+            response = self._get(url, params={"attachments": "false"}, stream=True)
             response.raise_for_status()
+            with open(path, "wb") as export_file:
+                for chunk in response.iter_content(chunk_size=1 << 20):
+                    export_file.write(chunk)
         except Exception as e:
-            _logger.exception("Failed to parse response: %s", e)
-            raise ValidationError(f"Failed to parse response: {e}") from e
-        data = response.json()
+            _logger.exception("Failed to download the submissions export: %s", e)
+            raise ValidationError(f"Failed to download the submissions export: {e}") from e
+        self._count_bytes(response)
+        response.close()
+
+    def import_export(self, export_path, program_id=None, top=100, on_page_done=None):
+        """Import the submissions of a ``submissions.csv.zip`` export in pages of ``top``.
+
+        The export is not ordered by submission key, so ``on_page_done`` gets the
+        key of the last submission of each page but the ``cursor`` of the result
+        is the key of the latest submission of the export.
+        """
+        submissions = iter_export_submissions(export_path, self.form_id, self.get_form_fields())
+        end = {"cursor": None}
+
+        def pages():
+            page = []
+            for member in submissions:
+                key = self.submission_key(member)
+                if key and (end["cursor"] is None or key > end["cursor"]):
+                    end["cursor"] = key
+                page.append(member)
+                if len(page) >= top:
+                    yield page
+                    page = []
+            if page:
+                yield page
+
+        result = self._import_pages(pages(), program_id, on_page_done=on_page_done)
+        result["cursor"] = end["cursor"]
+        return result
+
+    def _import_pages(
+        self,
+        pages,
+        program_id=None,
+        cursor=None,
+        on_page_done=None,
+        max_seconds=0,
+        max_records=0,
+        retry_pending=None,
+    ):
+        """Import pages of submissions through the transform and batched write pipeline.
+
+        ``retry_pending`` holds the ids of the retried submissions not imported
+        yet, they are passed to ``on_page_done`` until their page is imported.
+        """
+        retry_pending = retry_pending if retry_pending is not None else set()
+        wall, cpu = time.perf_counter(), time.thread_time()
+        result = {
+            "pages": 0,
+            "fetched": 0,
+            "cursor": cursor,
+            "skipped": 0,
+            "failed": 0,
+            "failed_ids": set(),
+            "budget_exhausted": False,
+        }
+        writer = PartnerBatchWriter(self.env, chunk_size=self.batch_size)
+        member_writer = PartnerBatchWriter(self.env, chunk_size=self.batch_size)
+        with self._timed("lookup"):
+            self.references.preload()
+        pages = self._timed_iter("fetch", pages)
+        transformed = iter_transformed(
+            self.json_formatter,
+            self._pending_pages(pages),
+            workers=self.transform_workers,
+            engine=self.mapping_engine,
+        )
+        try:
+            for (page, to_map), formatted in self._timed_iter("transform", transformed):
+                with self._timed("write"):
+                    self._import_page(
+                        page,
+                        program_id,
+                        writer,
+                        result,
+                        member_writer=member_writer,
+                        prepared=(to_map, formatted),
+                    )
+                result["pages"] += 1
+                result["fetched"] += len(page)
+                key = self.submission_key(page[-1])
+                # Retried submissions are older than the cursor, which only moves forward
+                if key and (not result["cursor"] or key > result["cursor"]):
+                    result["cursor"] = key
+                retry_pending.difference_update(member.get("__id") for member in page)
+                if on_page_done:
+                    on_page_done(result["cursor"], sorted(result["failed_ids"] | retry_pending))
+                over_budget = (max_seconds and time.perf_counter() - wall >= max_seconds) or (
+                    max_records and result["fetched"] >= max_records
+                )
+                # A delta ending with this page needs no continuation; knowing it only
+                # costs fetching the next page when there is one.
+                if over_budget and next(transformed, None) is not None:
+                    _logger.info(
+                        "ODK import stopped at its budget after %s submission(s) in %.1fs",
+                        result["fetched"],
+                        time.perf_counter() - wall,
+                    )
+                    result["budget_exhausted"] = True
+                    break
+        finally:
+            # Stop the download threads and transform processes working ahead
+            transformed.close()
+            pages.close()
+        self.references.log_stats()
+        result.update(
+            {
+                "created": writer.created,
+                "updated": writer.updated,
+                "failed": result["failed"] + writer.failed,
+                "members_created": member_writer.created,
+                "bytes_downloaded": self.bytes_downloaded,
+                "reference_hits": self.references.hits,
+                "reference_misses": self.references.misses,
+                "attachments": self.attachments.stored if self.attachments else 0,
+                "attachments_skipped": self.attachments.skipped if self.attachments else 0,
+                "attachments_failed": self.attachments.failed if self.attachments else 0,
+                "wall_time": time.perf_counter() - wall,
+                "cpu_time": time.thread_time() - cpu,
+                "timings": {phase: tuple(timing) for phase, timing in self.timings.items()},
+            }
+        )
+        return result
+
+    @staticmethod
+    def payload_hash(member):
+        """Hash of the submission data, leaving out the __system metadata (review state etc.)."""
+        payload = {key: value for key, value in member.items() if key != "__system"}
+        return hashlib.sha1(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+    def _get_bindings(self, page):
+        """Return the existing bindings of a page's submissions by instance id, in a single query."""
+        if not self.config_id:
+            return {}
+        bindings = (
+            self.env["odk.submission.binding"]
+            .sudo()
+            .search_read(
+                [
+                    ("config_id", "=", self.config_id),
+                    ("instance_id", "in", [member.get("__id") for member in page]),
+                ],
+                ["instance_id", "partner_id", "payload_hash"],
+            )
+        )
+        return {binding["instance_id"]: binding for binding in bindings}
+
+    def _pending_submissions(self, page):
+        """Return the submissions of a page to import as (submission, payload hash, binding).
+
+        Submissions already imported with the same payload are left out.
+        """
+        with self._timed("lookup"):
+            bindings = self._get_bindings(page)
+        to_map = []
+        for member in page:
+            payload_hash = self.payload_hash(member) if self.config_id else None
+            binding = bindings.get(member.get("__id"))
+            if not binding or binding["payload_hash"] != payload_hash:
+                to_map.append((member, payload_hash, binding))
+        return to_map
 
-        for member in data["value"]:
+    def _pending_pages(self, pages):
+        """Yield ``((page, pending submissions), submissions to format)`` for the transform step."""
+        for page in pages:
+            to_map = self._pending_submissions(page)
+            yield (page, to_map), [member for member, _hash, _binding in to_map]
+
+    def _import_page(self, page, program_id, writer, result, member_writer=None, prepared=None):
+        """Map the submissions of a page and create or update their partners in batches.
+
+        Submissions already imported with the same payload are skipped, changed
+        ones update the registrant they are bound to. ``prepared`` holds the
+        pending submissions of the page and their formatted values when these
+        were computed ahead, e.g. by transform worker processes.
+        """
+        member_writer = member_writer or PartnerBatchWriter(self.env, chunk_size=self.batch_size)
+        created, updated, failed = writer.created, writer.updated, writer.failed + result["failed"]
+        if prepared is None:
+            to_map = self._pending_submissions(page)
+            with self._timed("transform"):
+                members = [member for member, _hash, _binding in to_map]
+                prepared = to_map, transform_page(self.json_formatter, members, engine=self.mapping_engine)
+        to_map, formatted = prepared
+        # Submissions already imported with the same payload
+        result["skipped"] += len(page) - len(to_map)
+
+        to_create = []
+        imported = []
+        failed_ids = []
+        for (member, payload_hash, binding), mapped_json in zip(to_map, formatted):
+            instance_id = member.get("__id")
             try:
-                mapped_json = pyjq.compile(self.json_formatter).all(member)[0]
-
-                if self.target_registry == "individual":
-                    mapped_json.update({"is_registrant": True, "is_group": False})
-                elif self.target_registry == "group":
-                    mapped_json.update({"is_registrant": True, "is_group": True})
-
-                # TODO: Handle many one2many based on requirements
-                # phone one2many
-                if "phone_number_ids" in mapped_json:
-                    mapped_json["phone_number_ids"] = [
-                        (
-                            0,
-                            0,
-                            {
-                                "phone_no": phone.get("phone_no", None),
-                                "date_collected": phone.get("date_collected", None),
-                                "disabled": phone.get("disabled", None),
-                            },
-                        )
-                        for phone in mapped_json["phone_number_ids"]
-                    ]
-
-                # program registrant info
-                if (
-                    self.target_registry == "individual"
-                    and program_id
-                    and "program_registrant_info_ids" in mapped_json
-                ):
-                    individual = self.get_individual_data(mapped_json)
-                    mapped_json.update(individual)
-                    prog_reg_info = mapped_json["program_registrant_info_ids"].get("data", None)
-                    mapped_json["program_membership_ids"] = [
-                        (
-                            0,
-                            0,
-                            {
-                                "program_id": program_id.id,
-                                "state": "draft",
-                                "enrollment_date": date.today(),
-                            },
-                        )
-                    ]
-                    mapped_json["program_registrant_info_ids"] = [
-                        (
-                            0,
-                            0,
-                            {
-                                "program_id": program_id.id,
-                                "state": "active",
-                                "program_registrant_info": prog_reg_info if prog_reg_info else None,
-                            },
-                        )
-                    ]
-
-                # Membership one2many
-                if "group_membership_ids" in mapped_json and self.target_registry == "group":
-                    individual_ids = []
-                    head_added = False
-                    for individual_mem in mapped_json.get("group_membership_ids"):
-                        # Create individual partner
-
-                        individual_data = self.get_individual_data(individual_mem)
-                        individual = self.env["res.partner"].sudo().create(individual_data)
-                        if individual:
-                            kind = None
-                            if individual_mem.get("relationship_with_household_head") == 1 and not head_added:
-                                kind = self.get_or_create_kind("Head")
-                                head_added = True
-
-                            individual_data = {"individual": individual.id}
-                            if kind:
-                                individual_data["kind"] = [(4, kind.id)]
-
-                            individual_ids.append((0, 0, individual_data))
-
-                    mapped_json["group_membership_ids"] = individual_ids
-
-                # Reg_ids one2many
-                if "reg_ids" in mapped_json:
-                    mapped_json["reg_ids"] = [
-                        (
-                            0,
-                            0,
-                            {
-                                "id_type": self.env["g2p.id.type"]
-                                .search(
-                                    [("name", "=", reg_id.get("id_type", None))],
-                                )[0]
-                                .id,
-                                "value": reg_id.get("value", None),
-                                "expiry_date": reg_id.get("expiry_date", None),
-                            },
-                        )
-                        for reg_id in mapped_json["reg_ids"]
-                    ]
-
-                # update value into the res_partner table
-                self.env["res.partner"].sudo().create(mapped_json)
-                data.update({"form_updated": True})
-            except AttributeError as ex:
-                data.update({"form_failed": True})
-                _logger.error("Attribute Error", ex)
-            except Exception as ex:
-                data.update({"form_failed": True})
-                _logger.error("An exception occurred", ex)
-
-        return data
+                if isinstance(mapped_json, Exception):
+                    raise mapped_json
+                with self._timed("lookup"):
+                    mapped_json = self._map_submission(mapped_json, program_id, update=bool(binding))
+                    household = None if binding else self._map_household_members(mapped_json)
+                if binding:
+                    mapped_json = self._replace_x2many(mapped_json)
+            except Exception:
+                result["failed"] += 1
+                failed_ids.append(instance_id)
+                _logger.exception("Failed to map ODK submission %s", instance_id or "")
+                continue
+
+            if not binding:
+                to_create.append((instance_id, payload_hash, mapped_json, household))
+            elif writer.write(binding["partner_id"][0], mapped_json, key=instance_id):
+                self.env["odk.submission.binding"].sudo().browse(binding["id"]).write(
+                    {"payload_hash": payload_hash}
+                )
+                imported.append((member, binding["partner_id"][0]))
+            else:
+                failed_ids.append(instance_id)
+
+        if any(household for _id, _hash, _vals, household in to_create):
+            self._create_household_members(to_create, member_writer)
+
+        new_hashes = {}
+        for instance_id, payload_hash, mapped_json, household in to_create:
+            if household is not None:
+                membership_vals = self._membership_vals(instance_id, household, member_writer)
+                if membership_vals is None:
+                    result["failed"] += 1
+                    failed_ids.append(instance_id)
+                    _logger.error("Household members of ODK submission %s could not be created", instance_id)
+                    continue
+                mapped_json["group_membership_ids"] = membership_vals
+            writer.add(mapped_json, key=instance_id)
+            new_hashes[instance_id] = payload_hash
+        writer.flush()
+        failed_ids.extend(instance_id for instance_id in new_hashes if instance_id not in writer.partner_ids)
+        self._unlink_orphan_members(
+            [
+                (instance_id, household)
+                for instance_id, _hash, _vals, household in to_create
+                if household and instance_id not in writer.partner_ids
+            ],
+            member_writer,
+        )
+        result["failed_ids"].update(instance_id for instance_id in failed_ids if instance_id)
+
+        if self.config_id and new_hashes:
+            self.env["odk.submission.binding"].sudo().create(
+                [
+                    {
+                        "config_id": self.config_id,
+                        "instance_id": instance_id,
+                        "partner_id": writer.partner_ids[instance_id],
+                        "payload_hash": payload_hash,
+                    }
+                    for instance_id, payload_hash in new_hashes.items()
+                    if instance_id in writer.partner_ids
+                ]
+            )
+
+        if self.attachments:
+            members = {member.get("__id"): member for member, _hash, _binding in to_map}
+            imported.extend(
+                (members[instance_id], writer.partner_ids[instance_id])
+                for instance_id in new_hashes
+                if instance_id in writer.partner_ids
+            )
+            with self._timed("fetch"):
+                self.attachments.import_attachments(self.env, imported)
+
+        if writer.created > created or writer.updated > updated:
+            result.update({"form_updated": True})
+        if writer.failed + result["failed"] > failed:
+            result.update({"form_failed": True})
+
+    def _map_household_members(self, mapped_json):
+        """Pop the household members of group vals as a list of (individual vals, membership kind id)."""
+        if self.target_registry != "group" or "group_membership_ids" not in mapped_json:
+            return None
+        household = []
+        head_added = False
+        for individual_mem in mapped_json.pop("group_membership_ids") or []:
+            kind = None
+            if individual_mem.get("relationship_with_household_head") == 1 and not head_added:
+                kind = self.references.membership_kind_id("Head")
+                head_added = True
+            household.append((self.get_individual_data(individual_mem), kind))
+        return household
+
+    @staticmethod
+    def _create_household_members(to_create, member_writer):
+        """Create the household members of all the groups of a page with batched multi-creates."""
+        for instance_id, _hash, _vals, household in to_create:
+            for index, (individual_vals, _kind) in enumerate(household or []):
+                member_writer.add(individual_vals, key=(instance_id, index))
+        member_writer.flush()
+
+    def _unlink_orphan_members(self, households, member_writer):
+        """Delete the members created for the ``(instance id, household)`` groups which were not created.
+
+        Their submissions have no binding, the next import creates them again
+        with their group.
+        """
+        member_ids = [
+            member_writer.partner_ids.pop((instance_id, index))
+            for instance_id, household in households
+            for index in range(len(household))
+            if (instance_id, index) in member_writer.partner_ids
+        ]
+        if member_ids:
+            self.env["res.partner"].sudo().browse(member_ids).unlink()
+            member_writer.created -= len(member_ids)
+            _logger.info("Deleted %s household member(s) of groups which failed to import", len(member_ids))
+
+    @staticmethod
+    def _membership_vals(instance_id, household, member_writer):
+        """Membership commands of a group, None if one of its members could not be created."""
+        membership_vals = []
+        for index, (_individual_vals, kind) in enumerate(household):
+            individual_id = member_writer.partner_ids.get((instance_id, index))
+            if not individual_id:
+                return None
+            vals = {"individual": individual_id}
+            if kind:
+                vals["kind"] = [(4, kind)]
+            membership_vals.append((0, 0, vals))
+        return membership_vals
+
+    @staticmethod
+    def _replace_x2many(vals):
+        """Turn the x2many creations of mapped vals into replacements for an update."""
+        for field in ("phone_number_ids", "reg_ids", "program_registrant_info_ids"):
+            if field in vals:
+                vals[field] = [(5,)] + vals[field]
+        return vals
+
+    # TODO: Split the methods into smaller methods
+    # flake8: noqa: C901
+    def _map_submission(self, mapped_json, program_id, update=False):
+        """Turn a submission formatted by the JSON formatter into res.partner vals.
+
+        With ``update`` the vals are meant for the registrant already imported from
+        the submission: household members and program enrollment are left untouched.
+        """
+        if update:
+            mapped_json.pop("group_membership_ids", None)
+
+        if self.target_registry == "individual":
+            mapped_json.update({"is_registrant": True, "is_group": False})
+        elif self.target_registry == "group":
+            mapped_json.update({"is_registrant": True, "is_group": True})
+
+        # TODO: Handle many one2many based on requirements
+        # phone one2many
+        if "phone_number_ids" in mapped_json:
+            mapped_json["phone_number_ids"] = [
+                (
+                    0,
+                    0,
+                    {
+                        "phone_no": phone.get("phone_no", None),
+                        "date_collected": phone.get("date_collected", None),
+                        "disabled": phone.get("disabled", None),
+                    },
+                )
+                for phone in mapped_json["phone_number_ids"]
+            ]
+
+        # program registrant info
+        if (
+            self.target_registry == "individual"
+            and program_id
+            and "program_registrant_info_ids" in mapped_json
+        ):
+            individual = self.get_individual_data(mapped_json)
+            mapped_json.update(individual)
+            prog_reg_info = mapped_json["program_registrant_info_ids"].get("data", None)
+            if not update:
+                mapped_json["program_membership_ids"] = [
+                    (
+                        0,
+                        0,
+                        {
+                            "program_id": program_id.id,
+                            "state": "draft",
+                            "enrollment_date": date.today(),
+                        },
+                    )
+                ]
+            mapped_json["program_registrant_info_ids"] = [
+                (
+                    0,
+                    0,
+                    {
+                        "program_id": program_id.id,
+                        "state": "active",
+                        "program_registrant_info": prog_reg_info if prog_reg_info else None,
+                    },
+                )
+            ]
+
+        # Reg_ids one2many
+        if "reg_ids" in mapped_json:
+            mapped_json["reg_ids"] = [
+                (
+                    0,
+                    0,
+                    {
+                        "id_type": self.references.id_type_id(reg_id.get("id_type", None)),
+                        "value": reg_id.get("value", None),
+                        "expiry_date": reg_id.get("expiry_date", None),
+                    },
+                )
+                for reg_id in mapped_json["reg_ids"]
+            ]
+
+        return mapped_json
 
     def get_or_create_kind(self, kind_str):
-        kind = self.env["g2p.group.membership.kind"].search([("name", "=", kind_str)], limit=1)
-        if kind:
-            return kind
-        else:
-            return self.env["g2p.group.membership.kind"].sudo().create({"name": kind_str})
+        return self.env["g2p.group.membership.kind"].browse(self.references.membership_kind_id(kind_str))
 
     def get_gender(self, gender_val):
-        if gender_val:
-            gender = self.env["gender.type"].sudo().search([("code", "=", gender_val)], limit=1)
-            if gender:
-                return gender.code
-            else:
-                return None
-        else:
-            return None
+        return self.references.gender_code(gender_val)
 
     def get_individual_data(self, record):
         name = record.get("name", None)
@@ -1,15 +1,23 @@
 import logging
+import os
+import shutil
+import tempfile
+import zipfile
 from datetime import datetime, timedelta
 
-import pyjq
-
 from odoo import _, api, fields, models
 from odoo.exceptions import ValidationError
 
+from odoo.addons.queue_job.delay import chain, group
+
 from .odk_client import ODKClient
+from .odk_transform import validate_formatter
 
 _logger = logging.getLogger(__name__)
 
+# Bytes read at a time when copying an uploaded export out of the filestore
+COPY_CHUNK_SIZE = 1024 * 1024
+
 
 class OdkConfig(models.Model):
     _name = "odk.config"
@@ -21,9 +29,94 @@ class OdkConfig(models.Model):
     password = fields.Char(required=True)
     project = fields.Char(required=False)
     form_id = fields.Char(string="Form ID", required=False)
+    mapping_engine = fields.Selection(
+        [("jq", "jq expression"), ("jq_page", "jq expression, page at once"), ("fields", "Field mapping")],
+        required=True,
+        default="jq",
+        help="How the JSON formatter turns submissions into registrants: a jq expression run on each "
+        "submission or on each page at once, or a declarative field mapping (JSON object of target "
+        "fields to submission paths) which is faster for plain renames. Formatting a page at once "
+        "formats it again submission by submission when one of them fails.",
+    )
     json_formatter = fields.Text(string="JSON Formatter", required=True)
     target_registry = fields.Selection([("individual", "Individual"), ("group", "Group")], required=True)
+    batch_size = fields.Integer(
+        default=100,
+        help="Number of registrants created with a single ORM call during an import.",
+    )
+    transform_workers = fields.Integer(
+        default=0,
+        help="Number of processes formatting the submissions with the JSON formatter while "
+        "the registrants of previous pages are written. 0 or 1 formats them in the import itself.",
+    )
+    page_size = fields.Integer(
+        default=100, help="Number of submissions fetched from ODK Central per request."
+    )
+    fetch_workers = fields.Integer(
+        string="Concurrent downloads",
+        default=0,
+        help="Number of pages downloaded from ODK Central at the same time while the previous "
+        "ones are imported. 0 or 1 downloads them one after the other.",
+    )
+    attachment_workers = fields.Integer(
+        string="Attachment downloads",
+        default=0,
+        help="Number of submission media attachments (photos, scans...) downloaded at the same time "
+        "and attached to the imported registrants. 0 does not import attachments.",
+    )
+    stream_submissions = fields.Boolean(
+        help="Decode submissions one at a time while they are downloaded and import them in "
+        "batches, so memory use does not grow with the page size.",
+    )
+    project_fields = fields.Boolean(
+        string="Fetch only formatter fields",
+        help="Only download the form fields the JSON formatter reads. Formatters passing "
+        "the whole submission through still download every field.",
+    )
+    import_mode = fields.Selection(
+        [("cron", "Within the cron"), ("queue", "Queue jobs per page")],
+        required=True,
+        default="cron",
+        help="In queue mode the cron only lists the new submissions and imports them "
+        "with one queue job per page.",
+    )
+    max_run_seconds = fields.Integer(
+        string="Time budget (s)",
+        default=0,
+        help="Scheduled imports stop after the page taking them past this duration and continue "
+        "right away in a new run, so that a large delta is imported as a series of committed "
+        "slices instead of being killed at the server time limit. 0 for no limit.",
+    )
+    max_run_records = fields.Integer(
+        string="Record budget",
+        default=0,
+        help="Scheduled imports stop after the page taking them past this number of submissions "
+        "and continue right away in a new run. 0 for no limit.",
+    )
     last_sync_time = fields.Datetime(string="Last synced on", required=False)
+    sync_cursor_date = fields.Char(
+        string="Last imported submission date",
+        readonly=True,
+        help="ODK submissionDate of the last committed submission, imports resume after it.",
+    )
+    sync_cursor_instance_id = fields.Char(string="Last imported instance ID", readonly=True)
+    failed_instance_ids = fields.Text(
+        string="Failed instance IDs",
+        readonly=True,
+        help="Submissions before the sync cursor which failed to import, one instance ID per line. "
+        "They are fetched and imported again at the start of the next import.",
+    )
+    backfill_file = fields.Binary(
+        string="Submissions export",
+        attachment=True,
+        help="A submissions.csv.zip export of the form to backfill from. When empty, the backfill "
+        "downloads the export from ODK Central.",
+    )
+    backfill_filename = fields.Char()
+    import_run_ids = fields.One2many("odk.import.run", "config_id", string="Import runs", readonly=True)
+    last_records_per_second = fields.Float(
+        string="Records/s (last run)", digits=(16, 1), compute="_compute_last_records_per_second"
+    )
     cron_id = fields.Many2one("ir.cron", string="Cron Job", required=False)
     job_status = fields.Selection(
         [
@@ -42,15 +135,38 @@ class OdkConfig(models.Model):
     end_datetime = fields.Datetime(string="End Time", required=False)
     odk_program_id = fields.Many2one("g2p.program", string="ODK Program ID")
 
-    @api.constrains("json_formatter")
+    @api.constrains("json_formatter", "mapping_engine")
     def constraint_json_fields(self):
         for rec in self:
             if rec.json_formatter:
                 try:
-                    pyjq.compile(rec.json_formatter)
+                    validate_formatter(rec.json_formatter, engine=rec.mapping_engine)
                 except ValueError as ve:
+                    if rec.mapping_engine == "fields":
+                        raise ValidationError(_("Json Format is not a valid field mapping: %s") % ve) from ve
                     raise ValidationError(_("Json Format is not valid pyjq expression.")) from ve
 
+    def _get_client(self):
+        self.ensure_one()
+        return ODKClient(
+            self.env,
+            self.base_url,
+            self.username,
+            self.password,
+            self.project,
+            self.form_id,
+            self.target_registry,
+            self.json_formatter,
+            batch_size=self.batch_size,
+            config_id=self.id,
+            stream=self.stream_submissions,
+            project_fields=self.project_fields,
+            transform_workers=self.transform_workers,
+            fetch_workers=self.fetch_workers,
+            mapping_engine=self.mapping_engine,
+            attachment_workers=self.attachment_workers,
+        )
+
     def test_connection(self):
 
         for config in self:
@@ -79,22 +195,7 @@ class OdkConfig(models.Model):
 
     def import_records(self):
         for config in self:
-            client = ODKClient(
-                self.env,
-                config.base_url,
-                config.username,
-                config.password,
-                config.project,
-                config.form_id,
-                config.target_registry,
-                config.json_formatter,
-            )
-            client.login()
-            imported = client.import_delta_records(
-                last_sync_timestamp=config.last_sync_time,
-                program_id=config.odk_program_id,
-            )
-            config.update({"last_sync_time": fields.Datetime.now()})
+            imported = config._import_delta()
             if "form_updated" in imported:
                 message = "ODK form records were imported successfully."
                 types = "success"
@@ -116,21 +217,265 @@ class OdkConfig(models.Model):
 
     def import_records_by_id(self, _id):
         config = self.env["odk.config"].browse(_id)
-        client = ODKClient(
-            self.env,
-            config.base_url,
-            config.username,
-            config.password,
-            config.project,
-            config.form_id,
-            config.target_registry,
-            config.json_formatter,
+        if config.import_mode == "queue":
+            config._enqueue_import_jobs()
+            return
+        config._import_delta(commit=True)
+
+    @api.depends("import_run_ids.records_per_second")
+    def _compute_last_records_per_second(self):
+        for config in self:
+            config.last_records_per_second = config.import_run_ids[:1].records_per_second
+
+    def _log_import_run(self, imported, started_at):
+        """Record the counters and timings of an import run."""
+        self.ensure_one()
+        vals = self.env["odk.import.run"]._vals_from_result(imported)
+        vals.update({"config_id": self.id, "started_at": started_at})
+        run = self.env["odk.import.run"].sudo().create(vals)
+        _logger.info(
+            "ODK import of %s: %s submission(s) in %.1fs (%.1f/s), fetch %.1fs, transform %.1fs, "
+            "lookup %.1fs, write %.1fs",
+            self.name,
+            run.fetched,
+            run.wall_time,
+            run.records_per_second,
+            run.fetch_time,
+            run.transform_time,
+            run.lookup_time,
+            run.write_time,
+        )
+        return run
+
+    def _get_sync_cursor(self):
+        self.ensure_one()
+        if self.sync_cursor_date and self.sync_cursor_instance_id:
+            return self.sync_cursor_date, self.sync_cursor_instance_id
+        return None
+
+    def _set_sync_cursor(self, cursor, commit=False, failed_ids=None):
+        """Move the sync cursor to ``cursor``, committing it with the imported page if ``commit``.
+
+        ``failed_ids`` replaces the instance ids of the submissions to retry.
+        """
+        self.ensure_one()
+        if cursor:
+            self.write({"sync_cursor_date": cursor[0], "sync_cursor_instance_id": cursor[1]})
+        if failed_ids is not None:
+            self.failed_instance_ids = "\n".join(failed_ids) or False
+        if commit:
+            self.env.cr.commit()  # pylint: disable=invalid-commit
+
+    def _import_delta(self, commit=False):
+        """Import the submissions after the sync cursor, advancing it page by page."""
+        self.ensure_one()
+        started_at = fields.Datetime.now()
+        client = self._get_client()
+        client.login()
+        cursor = self._get_sync_cursor()
+        imported = client.import_delta_records(
+            last_sync_timestamp=None if cursor else self.last_sync_time,
+            program_id=self.odk_program_id,
+            top=self.page_size,
+            cursor=cursor,
+            on_page_done=lambda page_cursor, failed_ids: self._set_sync_cursor(
+                page_cursor, commit=commit, failed_ids=failed_ids
+            ),
+            # Only committed imports can stop half way and be continued
+            max_seconds=self.max_run_seconds if commit else 0,
+            max_records=self.max_run_records if commit else 0,
+            retry_instance_ids=(self.failed_instance_ids or "").split(),
         )
+        # Submissions arriving during the run are left for the next one
+        self.last_sync_time = started_at
+        self._log_import_run(imported, started_at)
+        if imported.get("budget_exhausted"):
+            self._continue_import()
+        return imported
+
+    def _continue_import(self):
+        """Schedule the rest of an import stopped at its budget to run right away."""
+        self.ensure_one()
+        if self.cron_id:
+            self.cron_id.sudo()._trigger()
+        else:
+            self.delayable(description=_("ODK import %s: continue") % self.name)._import_delta(
+                commit=True
+            ).delay()
+        _logger.info("ODK import of %s continues after %s", self.name, self._get_sync_cursor())
+
+    def _has_pending_import_jobs(self):
+        self.ensure_one()
+        return bool(
+            self.env["queue.job"]
+            .sudo()
+            .search_count(
+                [
+                    ("func_string", "=like", f"odk.config({self.id},)._finish_queued_import(%"),
+                    ("state", "not in", ("done", "cancelled")),
+                ]
+            )
+        )
+
+    def _enqueue_import_jobs(self):
+        """List the delta and import it with one queue job per page range.
+
+        The sync cursor is only advanced by a final job that depends on all the
+        page jobs, so a failed page holds it back until the job is requeued.
+        Submissions which failed in an earlier run are retried by a job of their
+        own; the final job keeps the ids of those failing again for the next one.
+        """
+        self.ensure_one()
+        if self._has_pending_import_jobs():
+            _logger.info("ODK import of %s is still queued, not listing a new delta", self.name)
+            return
+
+        listed_at = fields.Datetime.now()
+        client = self._get_client()
+        client.login()
+        cursor = self._get_sync_cursor()
+        page_ranges = client.list_page_ranges(
+            last_sync_timestamp=None if cursor else self.last_sync_time,
+            top=self.page_size,
+            cursor=cursor,
+        )
+        retry_ids = (self.failed_instance_ids or "").split()
+        if not page_ranges and not retry_ids:
+            self.last_sync_time = listed_at
+            return
+
+        page_jobs = [
+            self.delayable(
+                description=_("ODK import %(name)s: page %(page)s/%(pages)s")
+                % {"name": self.name, "page": page, "pages": len(page_ranges)},
+            )._import_page_range(after, until)
+            for page, (after, until) in enumerate(page_ranges, start=1)
+        ]
+        if retry_ids:
+            page_jobs.append(
+                self.delayable(
+                    description=_("ODK import %s: retry failed submissions") % self.name,
+                )._import_failed_submissions(retry_ids)
+            )
+        finish_job = self.delayable(
+            description=_("ODK import %s: advance watermark") % self.name,
+        )._finish_queued_import(listed_at, page_ranges[-1][1] if page_ranges else None, retry_ids)
+        chain(group(*page_jobs), finish_job).delay()
+        _logger.info("Queued %s ODK import job(s) for %s", len(page_jobs), self.name)
+
+    def _import_page_range(self, after, until):
+        self.ensure_one()
+        started_at = fields.Datetime.now()
+        client = self._get_client()
         client.login()
-        client.import_delta_records(
-            last_sync_timestamp=config.last_sync_time, program_id=config.odk_program_id
+        imported = client.import_delta_records(
+            last_sync_timestamp=None if after else self.last_sync_time,
+            program_id=self.odk_program_id,
+            top=self.page_size,
+            cursor=tuple(after) if after else None,
+            until=tuple(until),
         )
-        config.update({"last_sync_time": fields.Datetime.now()})
+        self._log_import_run(imported, started_at)
+        if "form_failed" in imported:
+            return _("Some submissions could not be imported, see the server log.")
+
+    def _import_failed_submissions(self, instance_ids):
+        self.ensure_one()
+        started_at = fields.Datetime.now()
+        client = self._get_client()
+        client.login()
+        imported = client.import_submissions(instance_ids, program_id=self.odk_program_id, top=self.page_size)
+        self._log_import_run(imported, started_at)
+
+    def _finish_queued_import(self, listed_at, until, retried_ids=()):
+        """Advance the sync cursor past the queued delta.
+
+        The submissions to retry become those which failed in the runs of the
+        queued jobs, plus those stored since the delta was listed.
+        """
+        self.ensure_one()
+        runs = self.env["odk.import.run"].search(
+            [("config_id", "=", self.id), ("started_at", ">=", listed_at)]
+        )
+        failed_ids = {instance_id for run in runs for instance_id in (run.failed_instance_ids or "").split()}
+        failed_ids.update(set((self.failed_instance_ids or "").split()) - set(retried_ids))
+        self._set_sync_cursor(tuple(until) if until else None, failed_ids=sorted(failed_ids))
+        self.last_sync_time = listed_at
+
+    def action_backfill(self):
+        """Queue the import of all the past submissions of the form from a CSV export."""
+        for config in self:
+            config.delayable(description=_("ODK backfill %s") % config.name)._backfill_from_export().delay()
+        return {
+            "type": "ir.actions.client",
+            "tag": "display_notification",
+            "params": {
+                "type": "info",
+                "message": _("The backfill was queued, its import run will show on the form once done."),
+                "next": {"type": "ir.actions.act_window_close"},
+            },
+        }
+
+    def _backfill_from_export(self):
+        """Import the uploaded or downloaded submissions export, then move the sync cursor past it.
+
+        Pages are committed as they are imported; the cursor only moves once the
+        whole export is imported, already imported submissions being skipped if
+        the backfill is run again.
+        """
+        self.ensure_one()
+        started_at = fields.Datetime.now()
+        client = self._get_client()
+        client.login()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            export_path = os.path.join(tmp_dir, "submissions.csv.zip")
+            attachment = self._get_backfill_attachment()
+            if attachment:
+                self._copy_attachment(attachment, export_path)
+            else:
+                client.download_export(export_path)
+            try:
+                imported = client.import_export(
+                    export_path,
+                    program_id=self.odk_program_id,
+                    top=self.page_size,
+                    on_page_done=lambda *_args: self.env.cr.commit(),  # pylint: disable=invalid-commit
+                )
+            except (ValueError, zipfile.BadZipFile) as e:
+                raise ValidationError(_("The submissions export could not be read: %s") % e) from e
+
+        cursor = self._get_sync_cursor()
+        if imported["cursor"] and (not cursor or imported["cursor"] > cursor):
+            self._set_sync_cursor(imported["cursor"])
+        self.write({"backfill_file": False, "backfill_filename": False})
+        self._log_import_run(imported, started_at)
+        if "form_failed" in imported:
+            return _("Some submissions could not be imported, see the server log.")
+
+    def _get_backfill_attachment(self):
+        self.ensure_one()
+        return (
+            self.env["ir.attachment"]
+            .sudo()
+            .search(
+                [
+                    ("res_model", "=", self._name),
+                    ("res_field", "=", "backfill_file"),
+                    ("res_id", "=", self.id),
+                ],
+                limit=1,
+            )
+        )
+
+    @staticmethod
+    def _copy_attachment(attachment, path):
+        """Copy the content of an attachment to ``path``, from its filestore file in chunks when it has one."""
+        with open(path, "wb") as target:
+            if attachment.store_fname:
+                with open(attachment._full_path(attachment.store_fname), "rb") as source:
+                    shutil.copyfileobj(source, target, COPY_CHUNK_SIZE)
+            else:
+                target.write(attachment.raw)
 
     def odk_import_action_trigger(self):
         for rec in self:
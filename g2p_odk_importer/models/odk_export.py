@@ -0,0 +1,192 @@
+import csv
+import io
+import json
+import os
+import sqlite3
+import tempfile
+import zipfile
+
+# Metadata columns of the main CSV of a Central export and their OData __system names
+SYSTEM_COLUMNS = {
+    "SubmissionDate": "submissionDate",
+    "SubmitterID": "submitterId",
+    "SubmitterName": "submitterName",
+    "AttachmentsPresent": "attachmentsPresent",
+    "AttachmentsExpected": "attachmentsExpected",
+    "Status": "status",
+    "ReviewState": "reviewState",
+    "DeviceID": "deviceId",
+    "Edits": "edits",
+    "FormVersion": "formVersion",
+}
+# System values which are numbers in the OData feed
+SYSTEM_INTEGERS = ("attachmentsPresent", "attachmentsExpected", "edits")
+_CONTAINER_TYPES = ("structure", "repeat")
+_CONVERTERS = {"int": int, "decimal": float}
+# Rows of repeat CSVs inserted into the join index per transaction
+_INDEX_BATCH_SIZE = 5000
+
+
+def _path_parts(path):
+    return tuple(part for part in path.strip("/").split("/") if part)
+
+
+def _open_csv(archive, name):
+    return csv.reader(io.TextIOWrapper(archive.open(name), encoding="utf-8-sig", newline=""))
+
+
+class _Table:
+    """Column layout of one CSV of an export: where each column goes in a submission.
+
+    Central names columns after the group path of the fields, joined by ``-``;
+    columns of repeat CSVs may also be relative to their repeat.
+    """
+
+    def __init__(self, header, repeat, form_fields, repeats):
+        candidates = {}
+        short_names = {}
+        for field in form_fields:
+            if field["type"] in _CONTAINER_TYPES:
+                continue
+            parts = _path_parts(field["path"])
+            if parts[: len(repeat)] != repeat or any(
+                len(other) > len(repeat) and parts[: len(other)] == other for other in repeats
+            ):
+                continue
+            relative = parts[len(repeat) :]
+            column = (relative, _CONVERTERS.get(field["type"]))
+            candidates.setdefault("-".join(parts), column)
+            candidates.setdefault("-".join(relative), column)
+            short_names.setdefault(relative[-1], column)
+        candidates = dict(short_names, **candidates)
+        self.columns = [(index, candidates.get(name)) for index, name in enumerate(header)]
+        self.system = [
+            (index, SYSTEM_COLUMNS[name]) for index, name in enumerate(header) if name in SYSTEM_COLUMNS
+        ]
+        self.key = header.index("KEY")
+        self.parent_key = header.index("PARENT_KEY") if "PARENT_KEY" in header else None
+
+    def values(self, row):
+        data = {}
+        for index, column in self.columns:
+            if column is None or index >= len(row):
+                continue
+            relative, converter = column
+            value = row[index]
+            if value == "":
+                value = None
+            elif converter:
+                try:
+                    value = converter(value)
+                except ValueError:
+                    pass
+            target = data
+            for part in relative[:-1]:
+                target = target.setdefault(part, {})
+            target[relative[-1]] = value
+        return data
+
+
+def _find_repeat(stem, form_id, repeats):
+    """Repeat path of a repeat CSV, from its name ``<form id>-<repeat name>.csv``."""
+    name = stem[len(form_id) + 1 :] if stem.startswith(form_id + "-") else stem
+    matches = [repeat for repeat in repeats if name in ("-".join(repeat), repeat[-1])]
+    return matches[0] if matches else None
+
+
+def iter_export_submissions(export_path, form_id, form_fields):
+    """Decode the submissions of a Central ``submissions.csv.zip`` export one at a time.
+
+    Submissions are rebuilt in the shape of the OData feed (``__id``, ``__system``,
+    groups as objects and repeats as lists of objects) from ``form_fields``, the
+    OData form schema. Repeat rows are first indexed by parent key in a temporary
+    SQLite database, so neither CSV is held in memory.
+    """
+    repeats = [_path_parts(field["path"]) for field in form_fields if field["type"] == "repeat"]
+    with zipfile.ZipFile(export_path) as archive, tempfile.TemporaryDirectory() as tmp_dir:
+        names = [name for name in archive.namelist() if name.lower().endswith(".csv")]
+        main_name = next((name for name in names if os.path.basename(name) == f"{form_id}.csv"), None)
+        if main_name is None:
+            raise ValueError("The export holds no %s.csv" % form_id)
+
+        index = sqlite3.connect(os.path.join(tmp_dir, "repeats.db"))
+        try:
+            index.execute("CREATE TABLE entry (parent_key TEXT, repeat TEXT, key TEXT, data TEXT)")
+            for name in names:
+                if name == main_name:
+                    continue
+                repeat = _find_repeat(os.path.basename(name)[:-4], form_id, repeats)
+                if repeat is not None:
+                    _index_repeat(index, _open_csv(archive, name), repeat, form_fields, repeats)
+            index.execute("CREATE INDEX entry_parent_key ON entry (parent_key)")
+
+            rows = _open_csv(archive, main_name)
+            table = _Table(next(rows), (), form_fields, repeats)
+            children = _child_repeats(repeats)
+            for row in rows:
+                if not row:
+                    continue
+                submission = {"__id": row[table.key], "__system": {}}
+                for column, name in table.system:
+                    value = row[column] or None
+                    if value is not None and name in SYSTEM_INTEGERS:
+                        try:
+                            value = int(value)
+                        except ValueError:
+                            pass
+                    submission["__system"][name] = value
+                submission.update(table.values(row))
+                _add_repeat_entries(index, submission, row[table.key], (), children)
+                yield submission
+        finally:
+            index.close()
+
+
+def _index_repeat(index, rows, repeat, form_fields, repeats):
+    table = _Table(next(rows), repeat, form_fields, repeats)
+    batch = []
+    for row in rows:
+        if not row:
+            continue
+        batch.append((row[table.parent_key], "/".join(repeat), row[table.key], json.dumps(table.values(row))))
+        if len(batch) >= _INDEX_BATCH_SIZE:
+            index.executemany("INSERT INTO entry VALUES (?, ?, ?, ?)", batch)
+            batch = []
+    if batch:
+        index.executemany("INSERT INTO entry VALUES (?, ?, ?, ?)", batch)
+    index.commit()
+
+
+def _child_repeats(repeats):
+    """Map each repeat (and the root, ``()``) to the repeats directly inside it."""
+    children = {(): []}
+    for repeat in sorted(repeats, key=len):
+        children[repeat] = []
+        parent = max(
+            (other for other in children if repeat[: len(other)] == other and other != repeat), key=len
+        )
+        children[parent].append(repeat)
+    return children
+
+
+def _add_repeat_entries(index, data, key, parent, children):
+    """Add the repeat entries whose parent key is ``key`` to ``data``, recursively.
+
+    Like the OData feed, repeats without entries are empty lists.
+    """
+    entry_lists = {}
+    for repeat in children[parent]:
+        target = data
+        relative = repeat[len(parent) :]
+        for part in relative[:-1]:
+            target = target.setdefault(part, {})
+        entry_lists["/".join(repeat)] = target.setdefault(relative[-1], [])
+    if not entry_lists:
+        return
+    entries = index.execute("SELECT repeat, key, data FROM entry WHERE parent_key = ? ORDER BY rowid", (key,))
+    for repeat, entry_key, entry_data in entries.fetchall():
+        if repeat not in entry_lists:
+            continue
+        entry = json.loads(entry_data)
+        _add_repeat_entries(index, entry, entry_key, tuple(repeat.split("/")), children)
+        entry_lists[repeat].append(entry)
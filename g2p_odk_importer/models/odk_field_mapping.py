@@ -0,0 +1,141 @@
+import copy
+import json
+from functools import lru_cache
+
+# Upper bound on compiled field mappings kept alive by a worker process
+FIELD_MAPPING_CACHE_SIZE = 64
+
+
+def _path_getter(path):
+    if not isinstance(path, str):
+        raise ValueError("Invalid path in field mapping: %r" % (path,))
+    keys = tuple(key for key in path.strip("/").split("/") if key)
+    if not keys:
+        raise ValueError("Empty path in field mapping")
+    if len(keys) == 1:
+        key = keys[0]
+        return lambda data: data.get(key) if isinstance(data, dict) else None
+
+    def get(data):
+        for key in keys:
+            if not isinstance(data, dict):
+                return None
+            data = data.get(key)
+        return data
+
+    return get
+
+
+def _compile_rule(rule):
+    if isinstance(rule, str):
+        return _path_getter(rule)
+    if isinstance(rule, list):
+        getters = [_compile_rule(item) for item in rule]
+        return lambda data: [get(data) for get in getters]
+    if not isinstance(rule, dict):
+        if rule is None or isinstance(rule, (bool, int, float)):
+            return lambda data: rule
+        raise ValueError("Invalid field mapping rule: %r" % (rule,))
+
+    if "const" in rule:
+        value = rule["const"]
+        if isinstance(value, (dict, list)):
+            return lambda data: copy.deepcopy(value)
+        return lambda data: value
+    if "repeat" in rule:
+        get_items = _path_getter(rule["repeat"])
+        fields = rule.get("fields", {})
+        if not isinstance(fields, dict):
+            raise ValueError("The fields of a repeat must be a JSON object: %r" % (fields,))
+        map_item = _compile_object(fields)
+
+        def map_items(data):
+            items = get_items(data)
+            # The entries of a repeat are a list, any other value holds none
+            return [map_item(item) for item in items] if isinstance(items, list) else []
+
+        return map_items
+    if "path" in rule:
+        get = _path_getter(rule["path"])
+        default = rule.get("default")
+        if default is None:
+            return get
+
+        def get_or_default(data):
+            value = get(data)
+            if value is not None:
+                return value
+            # The compiled mapping is cached, each submission gets its own copy of a default
+            return copy.deepcopy(default) if isinstance(default, (dict, list)) else default
+
+        return get_or_default
+    return _compile_object(rule)
+
+
+def _compile_object(spec):
+    getters = tuple((field, _compile_rule(rule)) for field, rule in spec.items())
+    return lambda data: {field: get(data) for field, get in getters}
+
+
+@lru_cache(maxsize=FIELD_MAPPING_CACHE_SIZE)
+def compile_field_mapping(field_mapping):
+    """Compile a declarative field mapping into a function formatting one submission.
+
+    The mapping is a JSON object of the formatted fields, each given by a rule:
+
+    - ``"group/field"``: the value at a slash separated path of the submission,
+      ``None`` when it is missing;
+    - ``{"path": "group/field", "default": value}``: the same, with a default;
+    - ``{"const": value}``: a constant;
+    - ``{"repeat": "group/repeat", "fields": {...}}``: a list with an object per
+      entry of a repeat, its fields mapped from the entry, empty unless the
+      repeat is a list;
+    - a list of rules, or an object of rules (without the keys above).
+
+    Missing submission values never fail the mapping, unlike jq.
+
+    :raises ValueError: if the mapping is not valid.
+    """
+    spec = json.loads(field_mapping)
+    if not isinstance(spec, dict):
+        raise ValueError("A field mapping must be a JSON object")
+    return _compile_object(spec)
+
+
+def map_page(field_mapping, page):
+    """Format the submissions of a page, those failing are replaced by their exception."""
+    map_submission = compile_field_mapping(field_mapping)
+    formatted = []
+    for member in page:
+        try:
+            formatted.append(map_submission(member))
+        except Exception as e:
+            formatted.append(e)
+    return formatted
+
+
+def _rule_names(rule, names):
+    if isinstance(rule, str):
+        names.add(rule.strip("/").split("/")[0])
+    elif isinstance(rule, list):
+        for item in rule:
+            _rule_names(item, names)
+    elif isinstance(rule, dict):
+        if "const" in rule:
+            return
+        if "repeat" in rule:
+            # The fields of a repeat are read from its entries
+            _rule_names(rule["repeat"], names)
+        elif "path" in rule:
+            _rule_names(rule["path"], names)
+        else:
+            for item in rule.values():
+                _rule_names(item, names)
+
+
+def field_mapping_names(field_mapping):
+    """Return the top-level submission fields a field mapping reads."""
+    names = set()
+    for rule in json.loads(field_mapping).values():
+        _rule_names(rule, names)
+    return names
@@ -0,0 +1,68 @@
+from odoo import api, fields, models
+
+from .odk_client import IMPORT_PHASES
+
+
+class OdkImportRun(models.Model):
+    _name = "odk.import.run"
+    _description = "ODK Import Run"
+    _order = "started_at desc, id desc"
+
+    config_id = fields.Many2one(
+        "odk.config", string="ODK Configuration", required=True, index=True, ondelete="cascade"
+    )
+    started_at = fields.Datetime(required=True, default=fields.Datetime.now)
+    pages = fields.Integer()
+    fetched = fields.Integer(string="Submissions fetched")
+    created = fields.Integer()
+    updated = fields.Integer()
+    skipped = fields.Integer()
+    failed = fields.Integer()
+    failed_instance_ids = fields.Text(string="Failed instance IDs")
+    members_created = fields.Integer(string="Household members created")
+    attachments = fields.Integer(string="Attachments stored")
+    # Float as a run can go over the 2 GB of an integer column
+    bytes_downloaded = fields.Float(digits=(16, 0))
+    wall_time = fields.Float(string="Duration (s)", digits=(16, 3))
+    cpu_time = fields.Float(string="CPU time (s)", digits=(16, 3))
+    fetch_time = fields.Float(string="Fetch (s)", digits=(16, 3))
+    fetch_cpu_time = fields.Float(string="Fetch CPU (s)", digits=(16, 3))
+    transform_time = fields.Float(string="Transform (s)", digits=(16, 3))
+    transform_cpu_time = fields.Float(string="Transform CPU (s)", digits=(16, 3))
+    lookup_time = fields.Float(string="Lookup (s)", digits=(16, 3))
+    lookup_cpu_time = fields.Float(string="Lookup CPU (s)", digits=(16, 3))
+    write_time = fields.Float(string="Write (s)", digits=(16, 3))
+    write_cpu_time = fields.Float(string="Write CPU (s)", digits=(16, 3))
+    records_per_second = fields.Float(
+        string="Records/s", digits=(16, 1), compute="_compute_records_per_second", store=True
+    )
+
+    @api.depends("fetched", "wall_time")
+    def _compute_records_per_second(self):
+        for run in self:
+            run.records_per_second = run.fetched / run.wall_time if run.wall_time else 0.0
+
+    @api.model
+    def _vals_from_result(self, imported):
+        """Values of a run from the result of :meth:`ODKClient.import_delta_records`."""
+        vals = {
+            key: imported.get(key, 0)
+            for key in (
+                "pages",
+                "fetched",
+                "created",
+                "updated",
+                "skipped",
+                "failed",
+                "members_created",
+                "attachments",
+                "bytes_downloaded",
+                "wall_time",
+                "cpu_time",
+            )
+        }
+        vals["failed_instance_ids"] = "\n".join(sorted(imported.get("failed_ids") or ())) or False
+        for phase, (wall_time, cpu_time) in imported.get("timings", {}).items():
+            if phase in IMPORT_PHASES:
+                vals.update({f"{phase}_time": wall_time, f"{phase}_cpu_time": cpu_time})
+        return vals
@@ -0,0 +1,70 @@
+import logging
+
+from odoo import _
+from odoo.exceptions import ValidationError
+
+_logger = logging.getLogger(__name__)
+
+
+class ReferenceDataResolver:
+    """In-memory name to id maps of the small reference tables used by the ODK mapping.
+
+    The tables are read once per import run; names missing from a map are
+    looked up (or, for membership kinds, created) once and remembered, so a
+    page costs no reference queries after the first run over it.
+    """
+
+    def __init__(self, env):
+        self.env = env
+        self.hits = 0
+        self.misses = 0
+        self._id_types = None
+        self._genders = None
+        self._kinds = None
+
+    def preload(self):
+        self._id_types = self._read_map("g2p.id.type", "name")
+        self._genders = self._read_map("gender.type", "code")
+        self._kinds = self._read_map("g2p.group.membership.kind", "name")
+
+    def _read_map(self, model, field):
+        values = {}
+        for rec in self.env[model].sudo().search_read([], [field]):
+            values.setdefault(rec[field], rec["id"])
+        return values
+
+    def _resolve(self, values, model, field, value):
+        if value in values:
+            self.hits += 1
+            return values[value]
+        self.misses += 1
+        record = self.env[model].sudo().search([(field, "=", value)], limit=1)
+        values[value] = record.id or None
+        return values[value]
+
+    def id_type_id(self, name):
+        if self._id_types is None:
+            self._id_types = self._read_map("g2p.id.type", "name")
+        id_type_id = self._resolve(self._id_types, "g2p.id.type", "name", name)
+        if not id_type_id:
+            raise ValidationError(_("ID type %s does not exist.") % name)
+        return id_type_id
+
+    def gender_code(self, code):
+        if not code:
+            return None
+        if self._genders is None:
+            self._genders = self._read_map("gender.type", "code")
+        return code if self._resolve(self._genders, "gender.type", "code", code) else None
+
+    def membership_kind_id(self, name):
+        if self._kinds is None:
+            self._kinds = self._read_map("g2p.group.membership.kind", "name")
+        kind_id = self._resolve(self._kinds, "g2p.group.membership.kind", "name", name)
+        if not kind_id:
+            kind_id = self.env["g2p.group.membership.kind"].sudo().create({"name": name}).id
+            self._kinds[name] = kind_id
+        return kind_id
+
+    def log_stats(self):
+        _logger.info("ODK reference data lookups: %s cache hits, %s misses", self.hits, self.misses)
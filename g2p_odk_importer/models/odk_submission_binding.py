@@ -0,0 +1,21 @@
+from odoo import fields, models
+
+
+class OdkSubmissionBinding(models.Model):
+    _name = "odk.submission.binding"
+    _description = "ODK Submission Binding"
+
+    config_id = fields.Many2one("odk.config", string="ODK Configuration", required=True, ondelete="cascade")
+    instance_id = fields.Char(string="Instance ID", required=True)
+    partner_id = fields.Many2one(
+        "res.partner", string="Registrant", required=True, index=True, ondelete="cascade"
+    )
+    payload_hash = fields.Char(help="Hash of the submission data last imported into the registrant.")
+
+    _sql_constraints = [
+        (
+            "config_instance_uniq",
+            "UNIQUE(config_id, instance_id)",
+            "An ODK submission can only be bound to one registrant per configuration.",
+        ),
+    ]
@@ -0,0 +1,330 @@
+import logging
+import multiprocessing
+import os
+import re
+import runpy
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+import pyjq
+
+import odoo.addons
+
+from .odk_field_mapping import compile_field_mapping, map_page
+
+_logger = logging.getLogger(__name__)
+
+# Upper bound on compiled formatter programs kept alive by a worker process
+FORMATTER_CACHE_SIZE = 64
+WORKER_STARTUP = os.path.join(os.path.dirname(__file__), "odk_transform_worker.py")
+
+
+@lru_cache(maxsize=FORMATTER_CACHE_SIZE)
+def _compile(json_formatter, thread_id):
+    return pyjq.compile(json_formatter)
+
+
+def compile_formatter(json_formatter):
+    """Return the compiled pyjq program for ``json_formatter``.
+
+    Programs are compiled once and kept in a process-level LRU cache so that
+    successive pages and cron ticks reuse them. A compiled program holds its
+    own jq state, hence entries are kept per thread.
+
+    :raises ValueError: if the formatter is not a valid jq expression.
+    """
+    return _compile(json_formatter, threading.get_ident())
+
+
+_JQ_TOKEN_RE = re.compile(
+    r"""(?P<space>\s+|\#[^\n]*)
+    |(?P<field>\.(?:[A-Za-z_]\w*|"(?:[^"\\]|\\[^(])*"|\[\s*"(?:[^"\\]|\\[^(])*"\s*\]))
+    |(?P<number>\d+(?:\.\d*)?(?:[eE][+-]?\d+)?)
+    |(?P<recurse>\.\.)
+    |(?P<dot>\.)
+    |(?P<var>\$[A-Za-z_]\w*)
+    |(?P<format>@[A-Za-z_]\w*)
+    |(?P<ident>[A-Za-z_]\w*(?:::[A-Za-z_]\w*)*)
+    |(?P<op>\?//|//=?|\|=|==|!=|<=|>=|[-+*/%]=?|[<>=?;:,|])
+    |(?P<bracket>[][(){}])""",
+    re.VERBOSE,
+)
+_CLOSING_BRACKETS = {")": "(", "]": "[", "}": "{"}
+# Keywords and builtins which never output or serialize the document they are applied to
+_DOCUMENT_SAFE_WORDS = frozenset(
+    ("and", "or", "not", "try", "catch", "empty", "null", "true", "false", "now", "env", "type", "nan")
+)
+
+
+def _jq_tokens(text, pos=0, interpolation=False):
+    """Split a jq program into ``(kind, value)`` tokens, returns them and the position after them.
+
+    String tokens hold their literal text and the tokens of their ``\\(...)``
+    interpolations. With ``interpolation``, stops after the ``)`` closing one.
+
+    :raises ValueError: on text which is not a jq token.
+    """
+    tokens = []
+    depth = 0
+    while pos < len(text):
+        if text[pos] == '"':
+            literal, interpolations, pos = _jq_string(text, pos + 1)
+            tokens.append(("string", (literal, interpolations)))
+            continue
+        if interpolation and text[pos] == ")" and not depth:
+            return tokens, pos + 1
+        match = _JQ_TOKEN_RE.match(text, pos)
+        if not match:
+            raise ValueError("Unexpected %r in jq program" % text[pos])
+        pos = match.end()
+        if match.lastgroup == "space":
+            continue
+        value = match.group()
+        if match.lastgroup == "bracket":
+            depth += 1 if value in "([{" else -1
+        tokens.append((match.lastgroup, value))
+    if interpolation:
+        raise ValueError("Unterminated string interpolation in jq program")
+    return tokens, pos
+
+
+def _jq_string(text, pos):
+    literal = []
+    interpolations = []
+    while pos < len(text):
+        char = text[pos]
+        if char == '"':
+            return "".join(literal), interpolations, pos + 1
+        if text.startswith("\\(", pos):
+            tokens, pos = _jq_tokens(text, pos + 2, interpolation=True)
+            interpolations.append(tokens)
+            continue
+        literal.append(text[pos : pos + 2] if char == "\\" else char)
+        pos += 2 if char == "\\" else 1
+    raise ValueError("Unterminated string in jq program")
+
+
+def _field_name(token):
+    name = token[1:]
+    if name.startswith("["):
+        name = name[1:-1].strip()
+    return name.strip('"')
+
+
+class _FieldReads:
+    """Check whether jq tokens applied to the document only read it through field accesses.
+
+    ``document`` tells whether the input of the tokens is the document. A pipe
+    from an expression which was checked to read fields only hands the next
+    one a value which is not the document, where anything goes. The names of
+    the fields read are collected in ``names``.
+    """
+
+    def __init__(self, tokens, names, document=True):
+        self.tokens = tokens
+        self.names = names
+        self.document = document
+        # ``... as $var | body`` hands the body the input of the binding
+        self.binding = False
+        # The open brackets and if...end, with the document and binding state they were opened in
+        self.frames = [(None, document, False)]
+
+    def check(self):
+        for index, (kind, value) in enumerate(self.tokens):
+            previous = self.tokens[index - 1] if index else (None, None)
+            following = self.tokens[index + 1] if index + 1 < len(self.tokens) else (None, None)
+            is_key = (
+                self.frames[-1][0] == "{" and previous[1] in ("{", ",") and following[1] in (":", ",", "}")
+            )
+            if is_key and following[1] != ":":
+                # Shorthand {name} reads the field it names
+                self.names.add(value[0] if kind == "string" else value)
+            if not getattr(self, "_" + kind)(value, is_key, following):
+                return False
+        return len(self.frames) == 1
+
+    def _string(self, value, _is_key, _following):
+        return all(_FieldReads(tokens, self.names, self.document).check() for tokens in value[1])
+
+    def _field(self, value, _is_key, _following):
+        self.names.add(_field_name(value))
+        return True
+
+    def _format(self, _value, _is_key, following):
+        # A format followed by a string only applies to the string interpolations
+        return not self.document or following[0] == "string"
+
+    def _dot(self, _value, _is_key, _following):
+        return not self.document
+
+    _recurse = _dot
+
+    def _number(self, _value, _is_key, _following):
+        return True
+
+    _var = _number
+
+    def _ident(self, value, is_key, _following):
+        if is_key:
+            return True
+        if value == "if":
+            self.frames.append(("if", self.document, self.binding))
+        elif value in ("then", "elif", "else", "end"):
+            opener, self.document, binding = self.frames[-1]
+            if opener != "if":
+                return False
+            if value == "end":
+                self.frames.pop()
+                self.binding = binding
+        elif value == "as":
+            self.binding = True
+        elif self.document and value not in _DOCUMENT_SAFE_WORDS:
+            return False
+        return True
+
+    def _bracket(self, value, _is_key, _following):
+        if value in "([{":
+            self.frames.append((value, self.document, self.binding))
+            self.binding = False
+            return True
+        if len(self.frames) == 1 or self.frames[-1][0] != _CLOSING_BRACKETS[value]:
+            return False
+        _opener, self.document, self.binding = self.frames.pop()
+        return True
+
+    def _op(self, value, _is_key, _following):
+        if value == "|":
+            self.document = self.document and self.binding
+            self.binding = False
+        elif value == ";" or (value == "," and self.frames[-1][0] == "{"):
+            # Function arguments and object values get the input of their call or object
+            self.document = self.frames[-1][1]
+        return True
+
+
+def formatter_field_names(json_formatter):
+    """Return the names of the fields a formatter may read, at any depth.
+
+    Returns ``None`` unless every use of the document by the formatter is a
+    field access (``.name``, ``."name"``, ``.["name"]``, ``{name}``), or one of
+    the few builtins which never output it, e.g. when it passes the document
+    through or hands it to ``tostring``, ``keys`` or ``map_values``, in which
+    case every field is needed.
+    """
+    try:
+        tokens, _pos = _jq_tokens(json_formatter)
+    except ValueError:
+        return None
+    names = set()
+    if not _FieldReads(tokens, names).check():
+        return None
+    return names or None
+
+
+def validate_formatter(json_formatter, engine="jq"):
+    """Compile a formatter with its engine, raises ValueError if it is not valid."""
+    if engine == "fields":
+        compile_field_mapping(json_formatter)
+    else:
+        compile_formatter(json_formatter)
+
+
+def _page_formatter(json_formatter):
+    return f"[.[] | [({json_formatter})][0]]"
+
+
+def transform_page(json_formatter, page, engine="jq"):
+    """Apply a formatter to every submission of a page.
+
+    Returns the formatted submissions in page order, those failing are replaced
+    by the exception raised for them. The ``jq`` engine runs the compiled
+    formatter on each submission.
+
+    The ``jq_page`` engine formats the page in a single jq invocation instead.
+    When the formatter fails on the page, the submissions are formatted again
+    one by one.
+
+    With the ``fields`` engine, the formatter is a declarative field mapping,
+    see :func:`~.odk_field_mapping.compile_field_mapping`.
+    """
+    if not page:
+        return []
+    if engine == "fields":
+        return map_page(json_formatter, page)
+    if engine == "jq_page":
+        try:
+            return compile_formatter(_page_formatter(json_formatter)).all(page)[0]
+        except Exception as e:
+            _logger.debug("Formatting the page at once failed (%s), formatting submissions one by one", e)
+    return [transform_record(json_formatter, member) for member in page]
+
+
+def transform_record(json_formatter, member):
+    try:
+        return compile_formatter(json_formatter).all(member)[0]
+    except Exception as e:
+        return e
+
+
+# Formatter and engine of the transform worker processes, set once by their initializer
+_worker_formatter = None
+_worker_engine = None
+
+
+def _init_worker(json_formatter, engine):
+    global _worker_formatter, _worker_engine
+    _worker_formatter, _worker_engine = json_formatter, engine
+    if engine == "fields":
+        compile_field_mapping(json_formatter)
+    else:
+        compile_formatter(json_formatter)
+        if engine == "jq_page":
+            compile_formatter(_page_formatter(json_formatter))
+
+
+def _transform_in_worker(page):
+    return transform_page(_worker_formatter, page, engine=_worker_engine)
+
+
+def iter_transformed(json_formatter, items, workers=0, engine="jq"):
+    """Format pages, yielding ``(context, formatted)`` for each ``(context, page)`` of ``items`` in order.
+
+    With ``workers`` > 1 the pages are formatted by a pool of that many processes,
+    a few pages ahead of the consumer. Only the submissions are sent to the
+    workers: ``items`` is consumed and the results are used in the calling
+    process, so the database is only ever accessed from there.
+
+    Workers are started by a fork server rather than forked from the Odoo
+    process, whose threads may hold locks at fork time. They only get the
+    formatter and the addons path, see ``odk_transform_worker.py``.
+    """
+    if workers <= 1:
+        for context, page in items:
+            yield context, transform_page(json_formatter, page, engine=engine)
+        return
+
+    executor = ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("forkserver"),
+        initializer=runpy.run_path,
+        initargs=(
+            WORKER_STARTUP,
+            {"addons_path": list(odoo.addons.__path__), "json_formatter": json_formatter, "engine": engine},
+        ),
+    )
+    pending = deque()
+    try:
+        for context, page in items:
+            pending.append((context, executor.submit(_transform_in_worker, page)))
+            if len(pending) > 2 * workers:
+                context, future = pending.popleft()
+                yield context, future.result()
+        while pending:
+            context, future = pending.popleft()
+            yield context, future.result()
+    finally:
+        for _context, future in pending:
+            future.cancel()
+        executor.shutdown(wait=True)
@@ -0,0 +1,14 @@
+"""Start-up of the ODK transform worker processes, run by path with :func:`runpy.run_path`.
+
+Workers are started by a fork server instead of being forked from the Odoo
+process, so the addons path making this addon importable is set up again
+before the formatter is loaded. The globals ``addons_path``, ``json_formatter``
+and ``engine`` are set by :func:`~.odk_transform.iter_transformed`.
+"""
+import odoo.addons
+
+odoo.addons.__path__.extend(path for path in addons_path if path not in odoo.addons.__path__)  # noqa: F821
+
+from odoo.addons.g2p_odk_importer.models.odk_transform import _init_worker  # noqa: E402
+
+_init_worker(json_formatter, engine)  # noqa: F821
@@ -2,3 +2,10 @@
 
 from . import test_odk_client
 from . import test_odk_config
+from . import test_odk_transform
+from . import test_odk_field_mapping
+from . import test_odk_export
+from . import test_odk_attachments
+from . import test_odk_batch_writer
+from . import test_odk_reference_cache
+from . import test_odk_benchmark
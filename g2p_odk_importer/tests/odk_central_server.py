@@ -0,0 +1,390 @@
+"""Local stand-in for the ODK Central endpoints used by :class:`ODKClient`.
+
+It serves seeded synthetic submissions over real HTTP (keep-alive, gzip) so the
+client can be exercised and benchmarked without a Central server.
+"""
+import csv
+import gzip
+import io
+import json
+import mimetypes
+import random
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+from zipfile import ZIP_DEFLATED, ZipFile
+
+from odoo.addons.g2p_odk_importer.models.odk_export import SYSTEM_COLUMNS
+
+# submissionDate of the first synthetic submission
+SUBMISSIONS_START = datetime(2023, 1, 1)
+
+_FILTER_RE = re.compile(r"^\s*__system/submissionDate (ge|gt|le|lt) (\S+)\s*$")
+_OPERATORS = {
+    "ge": lambda value, bound: value >= bound,
+    "gt": lambda value, bound: value > bound,
+    "le": lambda value, bound: value <= bound,
+    "lt": lambda value, bound: value < bound,
+}
+
+INDIVIDUAL_FORMATTER = """{
+    name: .name,
+    birthdate: .birthdate,
+    gender: .gender,
+    phone_number_ids: [.phones[] | {phone_no: .number, date_collected: .collected_on}],
+    reg_ids: [{id_type: "National ID", value: .national_id}]
+}"""
+
+INDIVIDUAL_FIELD_MAPPING = json.dumps(
+    {
+        "name": "name",
+        "birthdate": "birthdate",
+        "gender": "gender",
+        "phone_number_ids": {
+            "repeat": "phones",
+            "fields": {"phone_no": "number", "date_collected": "collected_on"},
+        },
+        "reg_ids": [{"id_type": {"const": "National ID"}, "value": "national_id"}],
+    }
+)
+
+GROUP_FORMATTER = """{
+    name: .household_name,
+    phone_number_ids: [{phone_no: .household_phone}],
+    group_membership_ids: [.members[] | {name, birthdate, gender, relationship_with_household_head}]
+}"""
+
+INDIVIDUAL_FIELDS = [
+    {"name": "name", "path": "/name", "type": "string"},
+    {"name": "birthdate", "path": "/birthdate", "type": "date"},
+    {"name": "gender", "path": "/gender", "type": "string"},
+    {"name": "national_id", "path": "/national_id", "type": "string"},
+    {"name": "phones", "path": "/phones", "type": "repeat"},
+    {"name": "number", "path": "/phones/number", "type": "string"},
+    {"name": "collected_on", "path": "/phones/collected_on", "type": "date"},
+    {"name": "notes", "path": "/notes", "type": "string"},
+]
+
+GROUP_FIELDS = [
+    {"name": "household_name", "path": "/household_name", "type": "string"},
+    {"name": "household_phone", "path": "/household_phone", "type": "string"},
+    {"name": "members", "path": "/members", "type": "repeat"},
+    {"name": "name", "path": "/members/name", "type": "string"},
+    {"name": "birthdate", "path": "/members/birthdate", "type": "date"},
+    {"name": "gender", "path": "/members/gender", "type": "string"},
+    {
+        "name": "relationship_with_household_head",
+        "path": "/members/relationship_with_household_head",
+        "type": "int",
+    },
+    {"name": "notes", "path": "/notes", "type": "string"},
+]
+
+
+def _system(index, start, per_second):
+    submitted = start + timedelta(seconds=index // per_second)
+    return {
+        "submissionDate": submitted.strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+        "updatedAt": None,
+        "submitterId": "1",
+        "submitterName": "Enumerator",
+        "attachmentsPresent": 0,
+        "attachmentsExpected": 0,
+        "status": None,
+        "reviewState": None,
+        "deviceId": None,
+        "edits": 0,
+        "formVersion": "1",
+    }
+
+
+def individual_submissions(count, seed=0, per_second=3, start=SUBMISSIONS_START):
+    """Synthetic individual registrations, ``per_second`` of them sharing each submissionDate."""
+    rng = random.Random(seed)
+    return [
+        {
+            "__id": f"uuid:{seed:04d}-{index:08d}",
+            "__system": _system(index, start, per_second),
+            "meta": {"instanceID": f"uuid:{seed:04d}-{index:08d}"},
+            "name": f"Given{index} Middle Family{rng.randrange(10000)}",
+            "birthdate": f"{rng.randint(1940, 2020)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+            "gender": rng.choice(("Female", "Male")),
+            "national_id": f"NID{seed:04d}{index:08d}",
+            "phones": [
+                {"number": f"+{rng.randrange(10**11, 10**12)}", "collected_on": "2023-01-01"}
+                for _i in range(rng.randint(1, 2))
+            ],
+            "notes": "x" * rng.randint(0, 200),
+        }
+        for index in range(count)
+    ]
+
+
+def group_submissions(count, members=4, seed=0, per_second=3, start=SUBMISSIONS_START):
+    """Synthetic household registrations of ``members`` members, the first one heading it."""
+    rng = random.Random(seed)
+    return [
+        {
+            "__id": f"uuid:{seed:04d}-{index:08d}",
+            "__system": _system(index, start, per_second),
+            "meta": {"instanceID": f"uuid:{seed:04d}-{index:08d}"},
+            "household_name": f"Household {index}",
+            "household_phone": f"+{rng.randrange(10**11, 10**12)}",
+            "members": [
+                {
+                    "name": f"Member{member} Middle Family{index}",
+                    "birthdate": f"{rng.randint(1940, 2020)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+                    "gender": rng.choice(("Female", "Male")),
+                    "relationship_with_household_head": 1 if member == 0 else 3,
+                }
+                for member in range(members)
+            ],
+            "notes": "x" * rng.randint(0, 200),
+        }
+        for index in range(count)
+    ]
+
+
+def _value(data, path):
+    for part in path.split("/"):
+        data = data.get(part) if isinstance(data, dict) else None
+    return data
+
+
+def _csv_value(data, path):
+    value = _value(data, path)
+    return "" if value is None else str(value)
+
+
+def _to_csv(header, rows):
+    text = io.StringIO()
+    writer = csv.writer(text)
+    writer.writerow(header)
+    writer.writerows(rows)
+    return text.getvalue()
+
+
+class LocalODKCentral:
+    """ODK Central stand-in listening on localhost, to be used as a context manager.
+
+    ``latency`` seconds are waited before answering every request. The served
+    requests are recorded in ``requests`` as ``(method, path, params)``.
+    ``attachments`` maps instance ids to the ``{file name: content}`` of their media.
+    """
+
+    def __init__(
+        self,
+        submissions,
+        fields=None,
+        project_id=5,
+        form_id="registration",
+        username="test_user",
+        password="test_password",
+        latency=0.0,
+        attachments=None,
+    ):
+        self.submissions = sorted(submissions, key=lambda s: (s["__system"]["submissionDate"], s["__id"]))
+        self.fields = fields if fields is not None else INDIVIDUAL_FIELDS
+        self.project_id = project_id
+        self.form_id = form_id
+        self.username = username
+        self.password = password
+        self.latency = latency
+        self.attachments = attachments or {}
+        self.tokens = set()
+        self.requests = []
+        self.base_url = None
+        self._server = None
+        self._thread = None
+
+    def __enter__(self):
+        handler = type("Handler", (_CentralRequestHandler,), {"central": self})
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self._server.daemon_threads = True
+        self.base_url = "http://127.0.0.1:%s" % self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def export_zip(self):
+        """The submissions as a Central ``submissions.csv.zip`` export.
+
+        Only top-level repeats are supported, each in a ``<form id>-<repeat name>.csv``.
+        """
+        repeats = [field["path"].strip("/") for field in self.fields if field["type"] == "repeat"]
+        leaves = [
+            field["path"].strip("/") for field in self.fields if field["type"] not in ("structure", "repeat")
+        ]
+        main_fields = [path for path in leaves if not any(path.startswith(f"{r}/") for r in repeats)]
+        system = {column: name for column, name in SYSTEM_COLUMNS.items() if column != "SubmissionDate"}
+        buffer = io.BytesIO()
+        with ZipFile(buffer, "w", ZIP_DEFLATED) as archive:
+            archive.writestr(
+                f"{self.form_id}.csv",
+                _to_csv(
+                    [
+                        "SubmissionDate",
+                        *(path.replace("/", "-") for path in main_fields),
+                        "KEY",
+                        *system,
+                    ],
+                    (
+                        [submission["__system"]["submissionDate"]]
+                        + [_csv_value(submission, path) for path in main_fields]
+                        + [submission["__id"]]
+                        + [_csv_value(submission["__system"], name) for name in system.values()]
+                        for submission in self.submissions
+                    ),
+                ),
+            )
+            for repeat in repeats:
+                repeat_fields = [path for path in leaves if path.startswith(f"{repeat}/")]
+                archive.writestr(
+                    f"{self.form_id}-{repeat.split('/')[-1]}.csv",
+                    _to_csv(
+                        [*(path.replace("/", "-") for path in repeat_fields), "PARENT_KEY", "KEY"],
+                        (
+                            [_csv_value(entry, path[len(repeat) + 1 :]) for path in repeat_fields]
+                            + [submission["__id"], f"{submission['__id']}/{repeat}[{index}]"]
+                            for submission in self.submissions
+                            for index, entry in enumerate(_value(submission, repeat) or [], start=1)
+                        ),
+                    ),
+                )
+        return buffer.getvalue()
+
+    def request_count(self, path_part=""):
+        return sum(1 for _method, path, _params in self.requests if path_part in path)
+
+    def query_submissions(self, params):
+        """Answer an OData Submissions query: returns the response document."""
+        matching = self.submissions
+        odata_filter = params.get("$filter")
+        if odata_filter:
+            for condition in odata_filter.split(" and "):
+                match = _FILTER_RE.match(condition)
+                if not match:
+                    raise ValueError("Unsupported $filter: %s" % condition)
+                operator, bound = _OPERATORS[match.group(1)], match.group(2)
+                matching = [s for s in matching if operator(s["__system"]["submissionDate"], bound)]
+        skip = int(params.get("$skip", 0))
+        top = int(params["$top"]) if "$top" in params else len(matching)
+        values = [self._project(s, params) for s in matching[skip : skip + top]]
+        document = {
+            "@odata.context": f"{self.base_url}/v1/projects/{self.project_id}/forms/"
+            f"{self.form_id}.svc/$metadata#Submissions"
+        }
+        if params.get("$count") == "true":
+            document["@odata.count"] = len(matching)
+        document["value"] = values
+        return document
+
+    def get_submission(self, instance_id, params):
+        """Answer an OData single Submission query: returns the status and response document."""
+        for submission in self.submissions:
+            if submission["__id"] == instance_id:
+                return 200, {"value": [self._project(submission, params)]}
+        return 404, {"message": "Could not find the resource you were looking for."}
+
+    def _project(self, submission, params):
+        selected = params.get("$select")
+        if selected:
+            names = {"__id", *selected.split(",")}
+            submission = {key: value for key, value in submission.items() if key in names}
+        if params.get("$expand") == "*":
+            return submission
+        # Without $expand, Central replaces repeats by navigation links
+        return {
+            (f"{key}@odata.navigationLink" if isinstance(value, list) else key): (
+                f"Submissions('{submission['__id']}')/{key}" if isinstance(value, list) else value
+            )
+            for key, value in submission.items()
+        }
+
+
+class _CentralRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    central = None
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status, document):
+        self._reply_bytes(status, json.dumps(document).encode(), "application/json", compress=True)
+
+    def _reply_bytes(self, status, body, content_type, compress=False):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        if compress and "gzip" in self.headers.get("Accept-Encoding", ""):
+            body = gzip.compress(body, compresslevel=1)
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _authorized(self):
+        authorization = self.headers.get("Authorization", "")
+        return authorization.startswith("Bearer ") and authorization[7:] in self.central.tokens
+
+    def _route(self, method):
+        central = self.central
+        url = urlsplit(self.path)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        central.requests.append((method, url.path, params))
+        if central.latency:
+            time.sleep(central.latency)
+        form_path = f"/v1/projects/{central.project_id}/forms/{central.form_id}"
+
+        if method == "POST" and url.path == "/v1/sessions":
+            length = int(self.headers.get("Content-Length", 0))
+            credentials = json.loads(self.rfile.read(length) or b"{}")
+            if (credentials.get("email"), credentials.get("password")) != (
+                central.username,
+                central.password,
+            ):
+                return self._reply(401, {"code": 401.2, "message": "Could not authenticate."})
+            token = "token-%s" % len(central.tokens)
+            central.tokens.add(token)
+            expires_at = (datetime.utcnow() + timedelta(hours=24)).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+            return self._reply(200, {"token": token, "expiresAt": expires_at[:-4] + "Z"})
+        if method != "GET":
+            return self._reply(405, {"message": "Method not allowed"})
+        if not self._authorized():
+            return self._reply(401, {"code": 401.2, "message": "Could not authenticate."})
+        if url.path == "/v1/users/current":
+            return self._reply(200, {"id": 1, "type": "user", "displayName": central.username})
+        if url.path == f"{form_path}/submissions.csv.zip":
+            return self._reply_bytes(200, central.export_zip(), "application/zip")
+        if url.path.startswith(f"{form_path}/submissions/"):
+            parts = [unquote(part) for part in url.path[len(form_path) + 13 :].split("/")]
+            attachments = central.attachments.get(parts[0], {})
+            if parts[1:] == ["attachments"]:
+                return self._reply(200, [{"name": name, "exists": True} for name in attachments])
+            if len(parts) == 3 and parts[1] == "attachments" and parts[2] in attachments:
+                content_type = mimetypes.guess_type(parts[2])[0] or "application/octet-stream"
+                return self._reply_bytes(200, attachments[parts[2]], content_type)
+        if url.path == f"{form_path}/fields":
+            return self._reply(200, central.fields)
+        if url.path.startswith(f"{form_path}.svc/Submissions('") and url.path.endswith("')"):
+            instance_id = unquote(url.path[len(form_path) + 18 : -2]).replace("''", "'")
+            return self._reply(*central.get_submission(instance_id, params))
+        if url.path == f"{form_path}.svc/Submissions":
+            try:
+                return self._reply(200, central.query_submissions(params))
+            except ValueError as e:
+                return self._reply(501, {"message": str(e)})
+        return self._reply(404, {"message": "Not found"})
+
+    def do_GET(self):
+        self._route("GET")
+
+    def do_POST(self):
+        self._route("POST")
@@ -0,0 +1,82 @@
+import hashlib
+from unittest.mock import MagicMock
+
+from odoo.tests.common import TransactionCase
+
+from odoo.addons.g2p_odk_importer.models.odk_client import ODKClient, clear_token_cache
+
+from .odk_central_server import INDIVIDUAL_FORMATTER, LocalODKCentral, individual_submissions
+
+
+class TestOdkAttachments(TransactionCase):
+    def setUp(self):
+        super().setUp()
+        clear_token_cache()
+        self.submissions = individual_submissions(4)
+        for index, submission in enumerate(self.submissions):
+            submission["__system"]["attachmentsPresent"] = index and 2
+        self.attachments = {
+            submission["__id"]: {
+                "photo.jpg": b"photo %d" % index,
+                "id scan.png": b"scan %d" % index * 50000,
+            }
+            for index, submission in enumerate(self.submissions)
+            if index
+        }
+        self.models = {name: MagicMock() for name in ("res.partner", "ir.attachment")}
+        for model in self.models.values():
+            model.sudo.return_value = model
+        self.models["res.partner"].create.side_effect = lambda vals_list: MagicMock(
+            ids=list(range(1, len(vals_list) + 1))
+        )
+        self.env_mock = MagicMock()
+        self.env_mock.__getitem__.side_effect = lambda name: self.models.get(name, MagicMock())
+
+    def test_import_attachments(self):
+        # The photo of the third submission is already attached to its registrant
+        self.models["ir.attachment"].search_read.return_value = [
+            {"res_id": 3, "checksum": hashlib.sha1(b"photo 2").hexdigest()}
+        ]
+        with LocalODKCentral(self.submissions, attachments=self.attachments) as central:
+            odk_client = ODKClient(
+                self.env_mock,
+                central.base_url,
+                central.username,
+                central.password,
+                central.project_id,
+                central.form_id,
+                "individual",
+                INDIVIDUAL_FORMATTER,
+                attachment_workers=3,
+            )
+            odk_client.login()
+            result = odk_client.import_delta_records()
+
+        # The submission without attachments is not listed
+        self.assertEqual(central.request_count("/submissions/"), 3 + 6)
+        self.assertNotIn(f"/submissions/{self.submissions[0]['__id']}/", str(central.requests))
+        created = [call.args[0] for call in self.models["ir.attachment"].create.call_args_list]
+        self.assertEqual(len(created), 5)
+        self.assertEqual((result["attachments"], result["attachments_skipped"]), (5, 1))
+        scan = next(vals for vals in created if vals["res_id"] == 4 and vals["name"] == "id scan.png")
+        self.assertEqual(scan["raw"], self.attachments[self.submissions[3]["__id"]]["id scan.png"])
+        self.assertEqual(scan["mimetype"], "image/png")
+        self.assertEqual(scan["res_model"], "res.partner")
+
+    def test_import_attachments_disabled(self):
+        with LocalODKCentral(self.submissions, attachments=self.attachments) as central:
+            odk_client = ODKClient(
+                self.env_mock,
+                central.base_url,
+                central.username,
+                central.password,
+                central.project_id,
+                central.form_id,
+                "individual",
+                INDIVIDUAL_FORMATTER,
+            )
+            odk_client.login()
+            odk_client.import_delta_records()
+
+        self.assertEqual(central.request_count("/submissions/"), 0)
+        self.models["ir.attachment"].create.assert_not_called()
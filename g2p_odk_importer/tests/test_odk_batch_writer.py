@@ -0,0 +1,44 @@
+from unittest.mock import MagicMock
+
+from odoo.tests.common import TransactionCase
+
+from odoo.addons.g2p_odk_importer.models.odk_batch_writer import PartnerBatchWriter
+
+
+class TestPartnerBatchWriter(TransactionCase):
+    def setUp(self):
+        super().setUp()
+        self.env_mock = MagicMock()
+        self.partner_model = self.env_mock.__getitem__.return_value.sudo.return_value
+
+    def test_creates_in_chunks(self):
+        self.partner_model.create.side_effect = lambda vals_list: MagicMock(
+            ids=list(range(1, len(vals_list) + 1))
+        )
+        writer = PartnerBatchWriter(self.env_mock, chunk_size=2)
+
+        for i in range(5):
+            writer.add({"name": f"Partner {i}"}, key=f"uuid:{i}")
+        writer.flush()
+
+        self.assertEqual(self.partner_model.create.call_count, 3)
+        self.assertEqual(writer.created, 5)
+        self.assertEqual(writer.failed, 0)
+        self.assertEqual(writer.partner_ids["uuid:1"], 2)
+
+    def test_falls_back_to_single_creates(self):
+        def create(vals):
+            if isinstance(vals, list) or vals["name"] == "Bad":
+                raise ValueError("Invalid record")
+            return MagicMock(id=7)
+
+        self.partner_model.create.side_effect = create
+        writer = PartnerBatchWriter(self.env_mock, chunk_size=10)
+
+        writer.add({"name": "Good"}, key="uuid:good")
+        writer.add({"name": "Bad"}, key="uuid:bad")
+        writer.flush()
+
+        self.assertEqual(writer.created, 1)
+        self.assertEqual(writer.failed, 1)
+        self.assertEqual(writer.partner_ids, {"uuid:good": 7})
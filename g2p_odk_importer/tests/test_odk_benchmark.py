@@ -0,0 +1,228 @@
+import json
+import logging
+import time
+import tracemalloc
+
+from odoo.tests.common import TransactionCase, tagged
+
+from odoo.addons.g2p_odk_importer.models.odk_client import clear_token_cache
+from odoo.addons.g2p_odk_importer.models.odk_field_mapping import map_page
+from odoo.addons.g2p_odk_importer.models.odk_transform import transform_page, transform_record
+
+from .odk_central_server import (
+    GROUP_FIELDS,
+    GROUP_FORMATTER,
+    INDIVIDUAL_FIELD_MAPPING,
+    INDIVIDUAL_FIELDS,
+    INDIVIDUAL_FORMATTER,
+    LocalODKCentral,
+    group_submissions,
+    individual_submissions,
+)
+
+_logger = logging.getLogger(__name__)
+
+BENCHMARK_FORMATTER = """{
+    name: .name,
+    birthdate: .birthdate,
+    gender: .gender,
+    phone_number_ids: [.phones[] | {phone_no: .number, date_collected: .collected_on}],
+    reg_ids: [{id_type: "National ID", value: .national_id}]
+}"""
+
+# The field mapping equivalent of BENCHMARK_FORMATTER
+BENCHMARK_FIELD_MAPPING = json.dumps(
+    {
+        "name": "name",
+        "birthdate": "birthdate",
+        "gender": "gender",
+        "phone_number_ids": {
+            "repeat": "phones",
+            "fields": {"phone_no": "number", "date_collected": "collected_on"},
+        },
+        "reg_ids": [{"id_type": {"const": "National ID"}, "value": "national_id"}],
+    }
+)
+
+
+def synthetic_submissions(count):
+    return [
+        {
+            "__id": f"uuid:{i:08d}",
+            "__system": {"submissionDate": "2023-01-01T00:00:00.000Z"},
+            "name": f"Given{i} Middle Family{i}",
+            "birthdate": "1990-01-01",
+            "gender": "Female" if i % 2 else "Male",
+            "national_id": f"NID{i:08d}",
+            "phones": [{"number": f"+100{i:08d}", "collected_on": "2023-01-01"}],
+        }
+        for i in range(count)
+    ]
+
+
+@tagged("-standard", "odk_benchmark")
+class TestOdkTransformBenchmark(TransactionCase):
+    """Benchmarks run with ``--test-tags odk_benchmark``, they are not part of the regular suite."""
+
+    def test_page_versus_record_transform(self):
+        for count in (1000, 10000, 50000):
+            submissions = synthetic_submissions(count)
+
+            start = time.perf_counter()
+            per_record = [transform_record(BENCHMARK_FORMATTER, member) for member in submissions]
+            record_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            per_page = transform_page(BENCHMARK_FORMATTER, submissions, engine="jq_page")
+            page_time = time.perf_counter() - start
+
+            self.assertEqual(per_page, per_record)
+            _logger.info(
+                "jq transform of %s submissions: per record %.3fs (%.0f/s), whole page %.3fs (%.0f/s), x%.1f",
+                count,
+                record_time,
+                count / record_time,
+                page_time,
+                count / page_time,
+                record_time / page_time,
+            )
+
+    def test_field_mapping_versus_jq(self):
+        for count in (1000, 10000, 50000):
+            submissions = synthetic_submissions(count)
+
+            start = time.perf_counter()
+            with_jq = transform_page(BENCHMARK_FORMATTER, submissions)
+            jq_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            with_field_mapping = map_page(BENCHMARK_FIELD_MAPPING, submissions)
+            mapping_time = time.perf_counter() - start
+
+            self.assertEqual(with_field_mapping, with_jq)
+            _logger.info(
+                "Transform of %s submissions: jq %.3fs (%.0f/s), field mapping %.3fs (%.0f/s), x%.1f",
+                count,
+                jq_time,
+                count / jq_time,
+                mapping_time,
+                count / mapping_time,
+                jq_time / mapping_time,
+            )
+
+
+@tagged("-standard", "odk_benchmark")
+class TestOdkImportBenchmark(TransactionCase):
+    """End to end ``import_delta_records`` runs against a local ODK Central stand-in.
+
+    Each run is done twice on its own configuration: once timed (records/s and
+    SQL queries per record) and once under tracemalloc for the peak memory, as
+    tracing slows the import down.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        if not cls.env["g2p.id.type"].search([("name", "=", "National ID")]):
+            cls.env["g2p.id.type"].create({"name": "National ID"})
+
+    def _create_config(self, central, target_registry, json_formatter, **options):
+        return self.env["odk.config"].create(
+            dict(
+                {
+                    "name": "ODK benchmark",
+                    "base_url": central.base_url,
+                    "username": central.username,
+                    "password": central.password,
+                    "project": str(central.project_id),
+                    "form_id": central.form_id,
+                    "target_registry": target_registry,
+                    "json_formatter": json_formatter,
+                },
+                **options,
+            )
+        )
+
+    def _run_import(self, config):
+        clear_token_cache()
+        client = config._get_client()
+        client.login()
+        return client.import_delta_records(top=config.page_size)
+
+    def _benchmark(self, label, submissions, fields, target_registry, json_formatter, latency=0.0, **options):
+        with LocalODKCentral(submissions, fields=fields, latency=latency) as central:
+            config = self._create_config(central, target_registry, json_formatter, **options)
+            queries = self.env.cr.sql_log_count
+            result = self._run_import(config)
+            queries = self.env.cr.sql_log_count - queries
+            requests = central.request_count("Submissions")
+
+            config = self._create_config(central, target_registry, json_formatter, **options)
+            tracemalloc.start()
+            try:
+                self._run_import(config)
+                _current, peak_memory = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+
+        self.assertEqual(result["fetched"], len(submissions))
+        self.assertEqual(result["created"], len(submissions))
+        timings = ", ".join("%s %.2fs" % (phase, wall) for phase, (wall, _cpu) in result["timings"].items())
+        _logger.info(
+            "ODK import benchmark %s: %s submissions in %.2fs, %.0f records/s, %.1f queries/record, "
+            "%s requests, %.1f MiB downloaded, peak memory %.1f MiB (%s)",
+            label,
+            result["fetched"],
+            result["wall_time"],
+            result["fetched"] / result["wall_time"],
+            queries / result["fetched"],
+            requests,
+            result["bytes_downloaded"] / 2**20,
+            peak_memory / 2**20,
+            timings,
+        )
+        return result
+
+    def test_individual_import(self):
+        for count in (1000, 5000):
+            submissions = individual_submissions(count)
+            self._benchmark(
+                f"individuals x{count}", submissions, INDIVIDUAL_FIELDS, "individual", INDIVIDUAL_FORMATTER
+            )
+            self._benchmark(
+                f"individuals x{count}, streamed and projected",
+                submissions,
+                INDIVIDUAL_FIELDS,
+                "individual",
+                INDIVIDUAL_FORMATTER,
+                stream_submissions=True,
+                project_fields=True,
+            )
+
+    def test_individual_import_with_field_mapping(self):
+        submissions = individual_submissions(5000)
+        self._benchmark(
+            "individuals x5000, field mapping",
+            submissions,
+            INDIVIDUAL_FIELDS,
+            "individual",
+            INDIVIDUAL_FIELD_MAPPING,
+            mapping_engine="fields",
+        )
+
+    def test_group_import(self):
+        submissions = group_submissions(1000, members=4)
+        self._benchmark("households x1000 of 4", submissions, GROUP_FIELDS, "group", GROUP_FORMATTER)
+
+    def test_import_over_latency(self):
+        submissions = individual_submissions(2000)
+        for fetch_workers in (0, 4):
+            self._benchmark(
+                f"individuals x2000, 100ms latency, {fetch_workers} fetch workers",
+                submissions,
+                INDIVIDUAL_FIELDS,
+                "individual",
+                INDIVIDUAL_FORMATTER,
+                latency=0.1,
+                fetch_workers=fetch_workers,
+            )
@@ -1,9 +1,22 @@
+import io
+import json
+import time
 from unittest.mock import MagicMock, patch
 
 from odoo.exceptions import ValidationError
 from odoo.tests.common import TransactionCase
 
-from odoo.addons.g2p_odk_importer.models.odk_client import ODKClient
+from odoo.addons.g2p_odk_importer.models.odk_client import ODKClient, clear_token_cache
+
+from .odk_central_server import (
+    GROUP_FIELDS,
+    GROUP_FORMATTER,
+    INDIVIDUAL_FIELD_MAPPING,
+    INDIVIDUAL_FORMATTER,
+    LocalODKCentral,
+    group_submissions,
+    individual_submissions,
+)
 
 
 class TestODKClient(TransactionCase):
@@ -17,8 +30,9 @@ class TestODKClient(TransactionCase):
         self.form_id = "test_form_id"
         self.target_registry = "group"
         self.json_formatter = "."
+        clear_token_cache()
 
-    @patch("requests.post")
+    @patch("requests.Session.post")
     def test_login_success(self, mock_post):
         mock_response = MagicMock()
         mock_response.status_code = 200
@@ -39,7 +53,7 @@ class TestODKClient(TransactionCase):
         odk_client.login()
         self.assertEqual(odk_client.session, "test_token")
 
-    @patch("requests.post")
+    @patch("requests.Session.post")
     def test_login_failure(self, mock_post):
         mock_post.side_effect = Exception("Test Error")
 
@@ -57,7 +71,7 @@ class TestODKClient(TransactionCase):
         with self.assertRaises(ValidationError):
             odk_client.login()
 
-    @patch("requests.get")
+    @patch("requests.Session.get")
     def test_test_connection_success(self, mock_get):
         mock_response = MagicMock()
         mock_response.status_code = 200
@@ -78,7 +92,7 @@ class TestODKClient(TransactionCase):
         odk_client.session = "test_token"
         self.assertTrue(odk_client.test_connection())
 
-    @patch("requests.get")
+    @patch("requests.Session.get")
     def test_test_connection_failure(self, mock_get):
         mock_get.side_effect = Exception("Connection Error")
 
@@ -98,7 +112,7 @@ class TestODKClient(TransactionCase):
         with self.assertRaises(ValidationError):
             odk_client.test_connection()
 
-    @patch("requests.get")
+    @patch("requests.Session.get")
     def test_import_delta_records_success(self, mock_get):
         mock_response = MagicMock()
         mock_response.status_code = 200
@@ -120,7 +134,7 @@ class TestODKClient(TransactionCase):
         result = odk_client.import_delta_records()
         self.assertTrue(result.get("form_updated"))
 
-    @patch("requests.get")
+    @patch("requests.Session.get")
     def test_import_delta_records_failure(self, mock_get):
         mock_get.side_effect = Exception("import Error")
 
@@ -138,3 +152,722 @@ class TestODKClient(TransactionCase):
         odk_client.session = "test_token"
         with self.assertRaises(ValidationError):
             odk_client.import_delta_records()
+
+    @patch("requests.Session.get")
+    def test_import_delta_records_pages_with_keyset_cursor(self, mock_get):
+        def submission(instance_id, submission_date):
+            return {
+                "__id": instance_id,
+                "__system": {"submissionDate": submission_date},
+                "name": instance_id,
+            }
+
+        first_page = MagicMock()
+        first_page.json.return_value = {
+            "@odata.count": 3,
+            "value": [
+                submission("uuid:1", "2023-01-01T00:00:00.000Z"),
+                submission("uuid:2", "2023-01-01T00:00:01.000Z"),
+            ],
+        }
+        second_page = MagicMock()
+        second_page.json.return_value = {
+            "@odata.count": 2,
+            "value": [
+                submission("uuid:2", "2023-01-01T00:00:01.000Z"),
+                submission("uuid:3", "2023-01-01T00:00:01.000Z"),
+            ],
+        }
+        mock_get.side_effect = [first_page, second_page]
+
+        odk_client = ODKClient(
+            self.env_mock,
+            self.base_url,
+            self.username,
+            self.password,
+            self.project_id,
+            self.form_id,
+            "individual",
+            self.json_formatter,
+        )
+        odk_client.session = "test_token"
+        pages = list(odk_client.iter_submission_pages(top=2))
+
+        self.assertEqual(mock_get.call_count, 2)
+        second_params = mock_get.call_args_list[1].kwargs["params"]
+        self.assertNotIn("$skip", second_params)
+        self.assertEqual(second_params["$filter"], "__system/submissionDate ge 2023-01-01T00:00:01.000Z")
+        self.assertEqual(
+            [[member["__id"] for member in page] for page in pages],
+            [["uuid:1", "uuid:2"], ["uuid:3"]],
+        )
+
+    @patch("requests.Session.post")
+    def test_login_reuses_cached_token(self, mock_post):
+        mock_response = MagicMock()
+        mock_response.status_code = 200
+        mock_response.json.return_value = {"token": "test_token", "expiresAt": "2999-01-01T00:00:00.000Z"}
+        mock_post.return_value = mock_response
+
+        for _i in range(2):
+            odk_client = ODKClient(
+                self.env_mock,
+                self.base_url,
+                self.username,
+                self.password,
+                self.project_id,
+                self.form_id,
+                self.target_registry,
+                self.json_formatter,
+            )
+            odk_client.login()
+            self.assertEqual(odk_client.session, "test_token")
+
+        self.assertEqual(mock_post.call_count, 1)
+
+    @patch("requests.Session.post")
+    def test_login_with_another_password_does_not_reuse_the_token(self, mock_post):
+        mock_response = MagicMock()
+        mock_response.status_code = 200
+        mock_response.json.return_value = {"token": "test_token", "expiresAt": "2999-01-01T00:00:00.000Z"}
+        mock_post.return_value = mock_response
+
+        for password in (self.password, "wrong_password"):
+            ODKClient(
+                self.env_mock,
+                self.base_url,
+                self.username,
+                password,
+                self.project_id,
+                self.form_id,
+                self.target_registry,
+                self.json_formatter,
+            ).login()
+
+        self.assertEqual(mock_post.call_count, 2)
+        self.assertIn("wrong_password", mock_post.call_args.kwargs["data"])
+
+    @patch("requests.Session.post")
+    @patch("requests.Session.get")
+    def test_relogin_on_unauthorized(self, mock_get, mock_post):
+        login_response = MagicMock()
+        login_response.status_code = 200
+        login_response.json.return_value = {"token": "new_token", "expiresAt": "2999-01-01T00:00:00.000Z"}
+        mock_post.return_value = login_response
+        unauthorized = MagicMock()
+        unauthorized.status_code = 401
+        authorized = MagicMock()
+        authorized.status_code = 200
+        authorized.json.return_value = {"displayName": "test_user"}
+        mock_get.side_effect = [unauthorized, authorized]
+
+        odk_client = ODKClient(
+            self.env_mock,
+            self.base_url,
+            self.username,
+            self.password,
+            self.project_id,
+            self.form_id,
+            self.target_registry,
+            self.json_formatter,
+        )
+        odk_client.session = "expired_token"
+
+        self.assertTrue(odk_client.test_connection())
+        self.assertEqual(odk_client.session, "new_token")
+        self.assertEqual(
+            mock_get.call_args_list[1].kwargs["headers"]["Authorization"],
+            "Bearer new_token",
+        )
+
+    @patch("requests.Session.get")
+    def test_list_page_ranges(self, mock_get):
+        mock_response = MagicMock()
+        mock_response.json.return_value = {
+            "@odata.count": 5,
+            "value": [
+                {"__id": f"uuid:{i}", "__system": {"submissionDate": f"2023-01-01T00:00:0{i}.000Z"}}
+                for i in range(5)
+            ],
+        }
+        mock_get.return_value = mock_response
+
+        odk_client = ODKClient(
+            self.env_mock,
+            self.base_url,
+            self.username,
+            self.password,
+            self.project_id,
+            self.form_id,
+            self.target_registry,
+            self.json_formatter,
+        )
+        odk_client.session = "test_token"
+        page_ranges = odk_client.list_page_ranges(top=2)
+
+        params = mock_get.call_args.kwargs["params"]
+        self.assertEqual(params["$select"], "__id,__system")
+        self.assertNotIn("$expand", params)
+        self.assertEqual(
+            [(after and after[1], until[1]) for after, until in page_ranges],
+            [(None, "uuid:1"), ("uuid:1", "uuid:3"), ("uuid:3", "uuid:4")],
+        )
+
+    def test_timed_phases_are_exclusive(self):
+        odk_client = ODKClient(
+            self.env_mock,
+            self.base_url,
+            self.username,
+            self.password,
+            self.project_id,
+            self.form_id,
+            self.target_registry,
+            self.json_formatter,
+        )
+        with odk_client._timed("write"):
+            time.sleep(0.02)
+            with odk_client._timed("lookup"):
+                time.sleep(0.05)
+
+        self.assertGreaterEqual(odk_client.timings["lookup"][0], 0.05)
+        self.assertGreaterEqual(odk_client.timings["write"][0], 0.02)
+        self.assertLess(odk_client.timings["write"][0], 0.05)
+
+    def test_until_bound_keeps_submissions_stored_past_the_millisecond(self):
+        odk_client = ODKClient(
+            self.env_mock,
+            self.base_url,
+            self.username,
+            self.password,
+            self.project_id,
+            self.form_id,
+            self.target_registry,
+            self.json_formatter,
+        )
+
+        params = odk_client._page_params(until=("2023-01-01T00:00:59.999Z", "uuid:2"))
+
+        self.assertEqual(params["$filter"], "__system/submissionDate lt 2023-01-01T00:01:00.000Z")
+
+    @patch("requests.Session.get")
+    def test_iter_concurrent_pages(self, mock_get):
+        submissions = [
+            {"__id": f"uuid:{i}", "__system": {"submissionDate": f"2023-01-01T00:00:{i:02d}.000Z"}}
+            for i in range(7)
+        ]
+
+        def get(url, params=None, **kwargs):
+            low, high = "", "~"
+            for condition in params.get("$filter", "").split(" and "):
+                if " ge " in condition:
+                    low = max(low, condition.split(" ge ")[1])
+                elif " lt " in condition:
+                    high = min(high, condition.split(" lt ")[1])
+            matching = [s for s in submissions if low <= s["__system"]["submissionDate"] < high]
+            response = MagicMock()
+            response.json.return_value = {"@odata.count": len(matching), "value": matching[: params["$top"]]}
+            return response
+
+        mock_get.side_effect = get
+
+        odk_client = ODKClient(
+            self.env_mock,
+            self.base_url,
+            self.username,
+            self.password,
+            self.project_id,
+            self.form_id,
+            self.target_registry,
+            self.json_formatter,
+            fetch_workers=3,
+        )
+        odk_client.session = "test_token"
+        pages = list(odk_client.iter_concurrent_pages(top=2))
+
+        self.assertEqual(
+            [[member["__id"] for member in page] for page in pages],
+            [["uuid:0", "uuid:1"], ["uuid:2", "uuid:3"], ["uuid:4", "uuid:5"], ["uuid:6"]],
+        )
+        # One listing request and one request per page
+        self.assertEqual(mock_get.call_count, 5)
+
+    @patch("requests.Session.get")
+    def test_import_delta_records_upserts_by_instance_id(self, mock_get):
+        submissions = [{"__id": f"uuid:{i}", "name": f"Registrant {i}"} for i in range(3)]
+        mock_response = MagicMock()
+        mock_response.json.return_value = {"@odata.count": 3, "value": submissions}
+        mock_get.return_value = mock_response
+
+        models = {name: MagicMock() for name in ("res.partner", "odk.submission.binding")}
+        for model in models.values():
+            model.sudo.return_value = model
+        models["res.partner"].create.return_value = MagicMock(ids=[30])
+        models["odk.submission.binding"].search_read.return_value = [
+            {
+                "id": 1,
+                "instance_id": "uuid:0",
+                "partner_id": (10, "Registrant 0"),
+                "payload_hash": ODKClient.payload_hash(submissions[0]),
+            },
+            {"id": 2, "instance_id": "uuid:1", "partner_id": (20, "Registrant 1"), "payload_hash": "old"},
+        ]
+        env_mock = MagicMock()
+        env_mock.__getitem__.side_effect = lambda name: models.get(name, MagicMock())
+
+        odk_client = ODKClient(
+            env_mock,
+            self.base_url,
+            self.username,
+            self.password,
+            self.project_id,
+            self.form_id,
+            "individual",
+            self.json_formatter,
+            config_id=1,
+        )
+        odk_client.session = "test_token"
+        result = odk_client.import_delta_records()
+
+        self.assertEqual(models["odk.submission.binding"].search_read.call_count, 1)
+        self.assertEqual((result["created"], result["updated"], result["skipped"]), (1, 1, 1))
+        models["res.partner"].create.assert_called_once()
+        self.assertEqual(models["res.partner"].create.call_args.args[0][0]["name"], "Registrant 2")
+        models["res.partner"].browse.assert_called_once_with(20)
+        models["odk.submission.binding"].create.assert_called_once_with(
+            [
+                {
+                    "config_id": 1,
+                    "instance_id": "uuid:2",
+                    "partner_id": 30,
+                    "payload_hash": ODKClient.payload_hash(submissions[2]),
+                }
+            ]
+        )
+        self.assertEqual(result["fetched"], 3)
+        self.assertEqual(set(result["timings"]), {"fetch", "transform", "lookup", "write"})
+        self.assertGreaterEqual(result["wall_time"], sum(wall for wall, _cpu in result["timings"].values()))
+
+    @patch("requests.Session.get")
+    def test_update_with_an_invalid_x2many_value_only_fails_its_submission(self, mock_get):
+        submissions = [
+            {"__id": "uuid:0", "name": "Registrant 0", "info": {"data": "not a list"}},
+            {"__id": "uuid:1", "name": "Registrant 1", "info": []},
+        ]
+        mock_response = MagicMock()
+        mock_response.json.return_value = {"@odata.count": 2, "value": submissions}
+        mock_get.return_value = mock_response
+
+        models = {name: MagicMock() for name in ("res.partner", "odk.submission.binding")}
+        for model in models.values():
+            model.sudo.return_value = model
+        models["odk.submission.binding"].search_read.return_value = [
+            {"id": 1, "instance_id": "uuid:0", "partner_id": (10, "Registrant 0"), "payload_hash": "old"},
+            {"id": 2, "instance_id": "uuid:1", "partner_id": (20, "Registrant 1"), "payload_hash": "old"},
+        ]
+        env_mock = MagicMock()
+        env_mock.__getitem__.side_effect = lambda name: models.get(name, MagicMock())
+
+        odk_client = ODKClient(
+            env_mock,
+            self.base_url,
+            self.username,
+            self.password,
+            self.project_id,
+            self.form_id,
+            "group",
+            "{ name: .name, program_registrant_info_ids: .info }",
+            config_id=1,
+        )
+        odk_client.session = "test_token"
+        result = odk_client.import_delta_records()
+
+        self.assertEqual((result["updated"], result["failed"], result["failed_ids"]), (1, 1, {"uuid:0"}))
+        models["res.partner"].browse.assert_called_once_with(20)
+
+    @patch("requests.Session.get")
+    def test_import_delta_records_creates_household_members_in_bulk(self, mock_get):
+        mock_response = MagicMock()
+        mock_response.json.return_value = {
+            "value": [
+                {
+                    "__id": f"uuid:{household}",
+                    "name": f"Household {household}",
+                    "group_membership_ids": [
+                        {"name": f"Head {household}", "relationship_with_household_head": 1},
+                        {"name": f"Child {household}", "relationship_with_household_head": 3},
+                    ],
+                }
+                for household in range(2)
+            ]
+        }
+        mock_get.return_value = mock_response
+
+        partner_model = MagicMock()
+        partner_model.sudo.return_value = partner_model
+        partner_model.create.side_effect = lambda vals_list: MagicMock(
+            ids=[100 + i for i in range(len(vals_list))]
+        )
+        env_mock = MagicMock()
+        env_mock.__getitem__.side_effect = (
+            lambda name: partner_model if name == "res.partner" else MagicMock()
+        )
+
+        odk_client = ODKClient(
+            env_mock,
+            self.base_url,
+            self.username,
+            self.password,
+            self.project_id,
+            self.form_id,
+            "group",
+            self.json_formatter,
+        )
+        odk_client.session = "test_token"
+        odk_client.references.membership_kind_id = MagicMock(return_value=7)
+        result = odk_client.import_delta_records()
+
+        self.assertEqual(partner_model.create.call_count, 2)
+        individuals, groups = (call.args[0] for call in partner_model.create.call_args_list)
+        self.assertEqual([vals["name"] for vals in individuals], ["Head 0", "Child 0", "Head 1", "Child 1"])
+        self.assertEqual(
+            groups[1]["group_membership_ids"],
+            [(0, 0, {"individual": 102, "kind": [(4, 7)]}), (0, 0, {"individual": 103})],
+        )
+        self.assertEqual((result["created"], result["members_created"]), (2, 4))
+
+    @patch("requests.Session.get")
+    def test_import_delta_records_deletes_members_of_failed_households(self, mock_get):
+        mock_response = MagicMock()
+        mock_response.json.return_value = {
+            "value": [
+                {
+                    "__id": f"uuid:{household}",
+                    "name": f"Household {household}",
+                    "group_membership_ids": [
+                        {"name": f"Head {household}", "relationship_with_household_head": 1},
+                        {"name": f"Child {household}", "relationship_with_household_head": 3},
+                    ],
+                }
+                for household in range(3)
+            ]
+        }
+        mock_get.return_value = mock_response
+
+        # A member of household 1 and the group of household 2 cannot be created
+        partner_ids = iter(range(1, 100))
+
+        def create(vals):
+            if isinstance(vals, list) or vals["name"] in ("Child 1", "Household 2"):
+                raise ValueError("Invalid registrant")
+            return MagicMock(id=next(partner_ids))
+
+        partner_model = MagicMock()
+        partner_model.sudo.return_value = partner_model
+        partner_model.create.side_effect = create
+        env_mock = MagicMock()
+        env_mock.__getitem__.side_effect = (
+            lambda name: partner_model if name == "res.partner" else MagicMock()
+        )
+
+        odk_client = ODKClient(
+            env_mock,
+            self.base_url,
+            self.username,
+            self.password,
+            self.project_id,
+            self.form_id,
+            "group",
+            self.json_formatter,
+        )
+        odk_client.session = "test_token"
+        odk_client.references.membership_kind_id = MagicMock(return_value=7)
+        result = odk_client.import_delta_records()
+
+        # Head 1, Head 2 and Child 2 were created, then deleted with their households
+        partner_model.browse.assert_called_once_with([3, 4, 5])
+        partner_model.browse.return_value.unlink.assert_called_once_with()
+        self.assertEqual((result["created"], result["members_created"], result["failed"]), (1, 2, 2))
+        self.assertEqual(result["failed_ids"], {"uuid:1", "uuid:2"})
+
+    @patch("requests.Session.get")
+    def test_iter_submission_pages_streaming(self, mock_get):
+        mock_response = MagicMock()
+        mock_response.raw = io.BytesIO(
+            json.dumps(
+                {
+                    "@odata.count": 3,
+                    "value": [
+                        {"__id": f"uuid:{i}", "__system": {"submissionDate": f"2023-01-01T00:00:0{i}.000Z"}}
+                        for i in range(3)
+                    ],
+                }
+            ).encode()
+        )
+        mock_get.return_value = mock_response
+
+        odk_client = ODKClient(
+            self.env_mock,
+            self.base_url,
+            self.username,
+            self.password,
+            self.project_id,
+            self.form_id,
+            self.target_registry,
+            self.json_formatter,
+            batch_size=2,
+            stream=True,
+        )
+        odk_client.session = "test_token"
+        pages = list(odk_client.iter_submission_pages(top=100))
+
+        self.assertTrue(mock_get.call_args.kwargs["stream"])
+        mock_response.json.assert_not_called()
+        mock_response.close.assert_called_once()
+        self.assertEqual(
+            [[member["__id"] for member in page] for page in pages], [["uuid:0", "uuid:1"], ["uuid:2"]]
+        )
+
+    @patch("requests.Session.get")
+    def test_import_delta_records_projects_formatter_fields(self, mock_get):
+        fields_response = MagicMock()
+        fields_response.json.return_value = [
+            {"path": "/name", "name": "name", "type": "string"},
+            {"path": "/age", "name": "age", "type": "int"},
+            {"path": "/photo", "name": "photo", "type": "binary"},
+            {"path": "/household", "name": "household", "type": "repeat"},
+            {"path": "/household/member_name", "name": "member_name", "type": "string"},
+        ]
+        submissions_response = MagicMock()
+        submissions_response.json.return_value = {"value": [{"__id": "uuid:1", "name": "John Doe"}]}
+        submissions_response.raw.tell.return_value = 512
+        mock_get.side_effect = [fields_response, submissions_response]
+
+        odk_client = ODKClient(
+            self.env_mock,
+            self.base_url,
+            self.username,
+            self.password,
+            self.project_id,
+            "projected_form_id",
+            "individual",
+            "{ name: .name, age: .age }",
+            project_fields=True,
+        )
+        odk_client.session = "test_token"
+        result = odk_client.import_delta_records()
+
+        self.assertEqual(
+            mock_get.call_args_list[0].args[0],
+            f"{self.base_url}/v1/projects/5/forms/projected_form_id/fields",
+        )
+        params = mock_get.call_args_list[1].kwargs["params"]
+        self.assertEqual(params["$select"], "__id,__system,name,age")
+        self.assertNotIn("$expand", params)
+        self.assertEqual(result["bytes_downloaded"], 512)
+
+    def _local_client(self, central, env, target_registry, json_formatter, **kwargs):
+        return ODKClient(
+            env,
+            central.base_url,
+            central.username,
+            central.password,
+            central.project_id,
+            central.form_id,
+            target_registry,
+            json_formatter,
+            **kwargs,
+        )
+
+    @staticmethod
+    def _partner_env():
+        partner_model = MagicMock()
+        partner_model.sudo.return_value = partner_model
+        partner_model.create.side_effect = lambda vals_list: MagicMock(ids=list(range(1, len(vals_list) + 1)))
+        env_mock = MagicMock()
+        env_mock.__getitem__.side_effect = (
+            lambda name: partner_model if name == "res.partner" else MagicMock()
+        )
+        return env_mock, partner_model
+
+    def test_import_delta_records_against_local_central(self):
+        submissions = individual_submissions(250)
+        for fetch_workers in (0, 3):
+            clear_token_cache()
+            with LocalODKCentral(submissions) as central:
+                env_mock, partner_model = self._partner_env()
+                odk_client = self._local_client(
+                    central, env_mock, "individual", INDIVIDUAL_FORMATTER, fetch_workers=fetch_workers
+                )
+                odk_client.login()
+                self.assertTrue(odk_client.test_connection())
+                result = odk_client.import_delta_records(top=100)
+
+            created = [vals["name"] for call in partner_model.create.call_args_list for vals in call.args[0]]
+            self.assertEqual(created, [s["name"] for s in submissions])
+            self.assertEqual((result["fetched"], result["pages"]), (250, 3))
+            self.assertEqual(
+                result["cursor"], (submissions[-1]["__system"]["submissionDate"], submissions[-1]["__id"])
+            )
+            self.assertGreater(result["bytes_downloaded"], 0)
+
+    def test_import_delta_records_against_local_central_projected(self):
+        submissions = group_submissions(20, members=3)
+        with LocalODKCentral(submissions, fields=GROUP_FIELDS) as central:
+            env_mock, partner_model = self._partner_env()
+            odk_client = self._local_client(central, env_mock, "group", GROUP_FORMATTER, project_fields=True)
+            odk_client.references.membership_kind_id = MagicMock(return_value=7)
+            odk_client.login()
+            result = odk_client.import_delta_records(top=10)
+
+        params = [params for _method, path, params in central.requests if path.endswith("Submissions")]
+        self.assertEqual(params[0]["$select"], "__id,__system,household_name,household_phone,members")
+        self.assertEqual(params[0]["$expand"], "*")
+        self.assertEqual((result["created"], result["members_created"]), (20, 60))
+
+    def test_import_delta_records_with_field_mapping(self):
+        submissions = individual_submissions(30)
+        with LocalODKCentral(submissions) as central:
+            env_mock, partner_model = self._partner_env()
+            odk_client = self._local_client(
+                central,
+                env_mock,
+                "individual",
+                INDIVIDUAL_FIELD_MAPPING,
+                mapping_engine="fields",
+                project_fields=True,
+            )
+            odk_client.login()
+            result = odk_client.import_delta_records(top=10)
+
+        params = [params for _method, path, params in central.requests if path.endswith("Submissions")]
+        self.assertEqual(params[0]["$select"], "__id,__system,name,birthdate,gender,national_id,phones")
+        self.assertEqual(result["created"], 30)
+        vals = partner_model.create.call_args_list[0].args[0][0]
+        self.assertEqual(vals["name"], submissions[0]["name"])
+        self.assertEqual(vals["phone_number_ids"][0][2]["phone_no"], submissions[0]["phones"][0]["number"])
+
+    def test_import_delta_records_stops_at_record_budget(self):
+        submissions = individual_submissions(250)
+        with LocalODKCentral(submissions) as central:
+            env_mock, partner_model = self._partner_env()
+            odk_client = self._local_client(
+                central, env_mock, "individual", INDIVIDUAL_FORMATTER, fetch_workers=3, transform_workers=2
+            )
+            odk_client.login()
+            first = odk_client.import_delta_records(top=50, max_records=120)
+            rest = odk_client.import_delta_records(top=50, cursor=first["cursor"], max_records=120)
+
+        # The budget is checked after each committed page
+        self.assertTrue(first["budget_exhausted"])
+        self.assertEqual((first["fetched"], first["pages"]), (150, 3))
+        self.assertEqual(
+            first["cursor"], (submissions[149]["__system"]["submissionDate"], submissions[149]["__id"])
+        )
+        self.assertFalse(rest["budget_exhausted"])
+        self.assertEqual(rest["fetched"], 100)
+        created = [vals["name"] for call in partner_model.create.call_args_list for vals in call.args[0]]
+        self.assertEqual(created, [s["name"] for s in submissions])
+
+    def test_budget_reached_with_the_last_page_ends_the_import(self):
+        submissions = individual_submissions(100)
+        for fetch_workers in (0, 3):
+            with LocalODKCentral(submissions) as central:
+                env_mock, _partner_model = self._partner_env()
+                odk_client = self._local_client(
+                    central, env_mock, "individual", INDIVIDUAL_FORMATTER, fetch_workers=fetch_workers
+                )
+                odk_client.login()
+                result = odk_client.import_delta_records(top=50, max_records=100)
+
+            self.assertEqual(result["fetched"], 100)
+            self.assertFalse(result["budget_exhausted"], fetch_workers)
+
+    @patch("odoo.addons.g2p_odk_importer.models.odk_client.KEY_PAGE_SIZE", 20)
+    def test_concurrent_import_stopping_at_its_budget_lists_few_keys(self):
+        submissions = individual_submissions(250)
+        with LocalODKCentral(submissions) as central:
+            env_mock, _partner_model = self._partner_env()
+            odk_client = self._local_client(
+                central, env_mock, "individual", INDIVIDUAL_FORMATTER, fetch_workers=2
+            )
+            odk_client.login()
+            result = odk_client.import_delta_records(top=10, max_records=20)
+
+        key_listings = [
+            params for _method, _path, params in central.requests if params.get("$select") == "__id,__system"
+        ]
+        self.assertEqual((result["fetched"], result["pages"]), (20, 2))
+        # The keys are listed only a few ranges ahead of the import, not up to the end of the delta
+        self.assertLessEqual(len(key_listings), 4)
+
+    def test_failed_submissions_are_retried_in_the_next_run(self):
+        submissions = individual_submissions(30)
+        failing = submissions[12]
+        with LocalODKCentral(submissions) as central:
+            env_mock, partner_model = self._partner_env()
+            create = partner_model.create.side_effect
+
+            def create_failing(vals_list):
+                if failing["name"] in str(vals_list):
+                    raise ValueError("Invalid registrant")
+                return create(vals_list)
+
+            partner_model.create.side_effect = create_failing
+            odk_client = self._local_client(central, env_mock, "individual", INDIVIDUAL_FORMATTER)
+            odk_client.login()
+            on_page_done = MagicMock()
+            first = odk_client.import_delta_records(top=10, on_page_done=on_page_done)
+
+            partner_model.create.side_effect = create
+            retried = odk_client.import_delta_records(
+                top=10,
+                cursor=first["cursor"],
+                on_page_done=on_page_done,
+                retry_instance_ids=[failing["__id"], "uuid:deleted"],
+            )
+
+        # The cursor moves past the failed submission, which is kept for the next run
+        last_key = (submissions[-1]["__system"]["submissionDate"], submissions[-1]["__id"])
+        self.assertEqual((first["failed"], first["cursor"]), (1, last_key))
+        self.assertEqual(on_page_done.call_args_list[0].args[1], [])
+        self.assertEqual(on_page_done.call_args_list[first["pages"] - 1].args, (last_key, [failing["__id"]]))
+
+        self.assertEqual((retried["created"], retried["failed"], retried["cursor"]), (1, 0, last_key))
+        self.assertEqual(on_page_done.call_args.args, (last_key, []))
+        self.assertEqual(central.request_count(f"Submissions('{failing['__id']}')"), 1)
+        self.assertEqual(partner_model.create.call_args.args[0][0]["name"], failing["name"])
+
+    def test_import_submissions_only_fetches_the_given_ids(self):
+        submissions = individual_submissions(5)
+        with LocalODKCentral(submissions) as central:
+            env_mock, partner_model = self._partner_env()
+            odk_client = self._local_client(central, env_mock, "individual", INDIVIDUAL_FORMATTER)
+            odk_client.login()
+            imported = odk_client.import_submissions([submissions[3]["__id"], "uuid:deleted"], top=10)
+
+        self.assertEqual((imported["fetched"], imported["created"], imported["failed_ids"]), (1, 1, set()))
+        self.assertEqual(partner_model.create.call_args.args[0][0]["name"], submissions[3]["name"])
+
+    def test_budget_keeps_the_retries_not_imported_yet(self):
+        submissions = individual_submissions(25)
+        retry_ids = [submission["__id"] for submission in submissions] + ["uuid:deleted"]
+        with LocalODKCentral(submissions) as central:
+            env_mock, partner_model = self._partner_env()
+            odk_client = self._local_client(central, env_mock, "individual", INDIVIDUAL_FORMATTER)
+            odk_client.login()
+            on_page_done = MagicMock()
+            last_key = (submissions[-1]["__system"]["submissionDate"], submissions[-1]["__id"])
+            result = odk_client.import_delta_records(
+                top=10,
+                cursor=last_key,
+                on_page_done=on_page_done,
+                max_records=10,
+                retry_instance_ids=retry_ids,
+            )
+
+        # Only the first page of retries was imported, the others stay stored. The
+        # second one was fetched to know the import goes on.
+        self.assertTrue(result["budget_exhausted"])
+        self.assertEqual((result["fetched"], result["cursor"]), (10, last_key))
+        self.assertEqual(central.request_count("Submissions('"), 20)
+        on_page_done.assert_called_once_with(last_key, sorted(retry_ids[10:]))
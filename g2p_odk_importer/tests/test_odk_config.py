@@ -1,5 +1,8 @@
+import base64
+from datetime import datetime
 from unittest.mock import patch
 
+from odoo import fields
 from odoo.tests.common import TransactionCase
 
 from odoo.addons.g2p_odk_importer.models.odk_client import ODKClient
@@ -92,3 +95,298 @@ class TestOdkConfig(TransactionCase):
         self.assertTrue(mock_import_delta_records.called)
         self.assertEqual(result["params"]["type"], "warning")
         self.assertEqual(result["params"]["message"], "No new form records were submitted.")
+
+    @patch.object(ODKClient, "login")
+    @patch.object(ODKClient, "list_page_ranges")
+    def test_import_records_by_id_enqueues_page_jobs(self, mock_list_page_ranges, mock_login):
+        mock_list_page_ranges.return_value = [
+            (None, ("2023-01-01T00:00:00.000Z", "uuid:1")),
+            (("2023-01-01T00:00:00.000Z", "uuid:1"), ("2023-01-01T00:00:01.000Z", "uuid:2")),
+        ]
+
+        odk_config = self.env["odk.config"].create(
+            {
+                "name": "Test ODK Config",
+                "base_url": self.base_url,
+                "username": self.username,
+                "password": self.password,
+                "project": self.project_id,
+                "form_id": self.form_id,
+                "target_registry": self.target_registry,
+                "json_formatter": self.json_formatter,
+                "import_mode": "queue",
+            }
+        )
+
+        odk_config.import_records_by_id(odk_config.id)
+
+        jobs = self.env["queue.job"].search([("func_string", "like", f"odk.config({odk_config.id},).")])
+        self.assertEqual(len(jobs.filtered(lambda job: job.method_name == "_import_page_range")), 2)
+        self.assertEqual(len(jobs.filtered(lambda job: job.method_name == "_finish_queued_import")), 1)
+        self.assertFalse(odk_config.last_sync_time)
+
+        # The delta is not listed again while its jobs are queued
+        odk_config.import_records_by_id(odk_config.id)
+        self.assertEqual(mock_list_page_ranges.call_count, 1)
+
+    @patch.object(ODKClient, "login")
+    @patch.object(ODKClient, "import_delta_records")
+    def test_import_records_resumes_from_sync_cursor(self, mock_import_delta_records, mock_login):
+        def import_delta_records(**kwargs):
+            kwargs["on_page_done"](("2023-01-01T00:00:01.000Z", "uuid:2"), [])
+            return {"form_updated": True}
+
+        mock_import_delta_records.side_effect = import_delta_records
+
+        odk_config = self.env["odk.config"].create(
+            {
+                "name": "Test ODK Config",
+                "base_url": self.base_url,
+                "username": self.username,
+                "password": self.password,
+                "project": self.project_id,
+                "form_id": self.form_id,
+                "target_registry": self.target_registry,
+                "json_formatter": self.json_formatter,
+            }
+        )
+
+        odk_config.import_records()
+        self.assertIsNone(mock_import_delta_records.call_args.kwargs["cursor"])
+        self.assertEqual(odk_config.sync_cursor_date, "2023-01-01T00:00:01.000Z")
+        self.assertEqual(odk_config.sync_cursor_instance_id, "uuid:2")
+
+        odk_config.import_records()
+        kwargs = mock_import_delta_records.call_args.kwargs
+        self.assertEqual(kwargs["cursor"], ("2023-01-01T00:00:01.000Z", "uuid:2"))
+        self.assertIsNone(kwargs["last_sync_timestamp"])
+
+    @patch.object(ODKClient, "login")
+    @patch.object(ODKClient, "import_delta_records")
+    def test_import_records_retries_failed_submissions(self, mock_import_delta_records, mock_login):
+        def import_delta_records(**kwargs):
+            kwargs["on_page_done"](("2023-01-01T00:00:01.000Z", "uuid:2"), ["uuid:1"])
+            return {"form_updated": True, "form_failed": True}
+
+        mock_import_delta_records.side_effect = import_delta_records
+
+        odk_config = self.env["odk.config"].create(
+            {
+                "name": "Test ODK Config",
+                "base_url": self.base_url,
+                "username": self.username,
+                "password": self.password,
+                "project": self.project_id,
+                "form_id": self.form_id,
+                "target_registry": self.target_registry,
+                "json_formatter": self.json_formatter,
+            }
+        )
+
+        # The run starts on Jan 2nd and ends later, submissions received meanwhile are not skipped
+        with patch.object(
+            fields.Datetime, "now", side_effect=[datetime(2023, 1, 2)] + [datetime(2023, 1, 3)] * 10
+        ):
+            odk_config.import_records()
+        self.assertEqual(mock_import_delta_records.call_args.kwargs["retry_instance_ids"], [])
+        self.assertEqual(odk_config.failed_instance_ids, "uuid:1")
+        self.assertEqual(odk_config.last_sync_time, datetime(2023, 1, 2))
+
+        mock_import_delta_records.side_effect = None
+        mock_import_delta_records.return_value = {"form_updated": True}
+        odk_config.import_records()
+        self.assertEqual(mock_import_delta_records.call_args.kwargs["retry_instance_ids"], ["uuid:1"])
+
+    @patch.object(ODKClient, "login")
+    @patch.object(ODKClient, "import_submissions")
+    @patch.object(ODKClient, "import_delta_records")
+    @patch.object(ODKClient, "list_page_ranges")
+    def test_queued_import_keeps_failed_submissions(
+        self, mock_list_page_ranges, mock_import_delta_records, mock_import_submissions, mock_login
+    ):
+        until = ("2023-01-01T00:00:01.000Z", "uuid:2")
+        mock_list_page_ranges.return_value = []
+        mock_import_delta_records.return_value = {
+            "form_updated": True,
+            "form_failed": True,
+            "failed_ids": {"uuid:2"},
+        }
+        mock_import_submissions.return_value = {"form_updated": True, "failed_ids": set()}
+
+        odk_config = self.env["odk.config"].create(
+            {
+                "name": "Test ODK Config",
+                "base_url": self.base_url,
+                "username": self.username,
+                "password": self.password,
+                "project": self.project_id,
+                "form_id": self.form_id,
+                "target_registry": self.target_registry,
+                "json_formatter": self.json_formatter,
+                "import_mode": "queue",
+                "failed_instance_ids": "uuid:1",
+            }
+        )
+        listed_at = datetime(2023, 1, 2)
+        with patch.object(fields.Datetime, "now", return_value=listed_at):
+            odk_config._import_page_range(None, until)
+            odk_config._import_failed_submissions(["uuid:1"])
+        odk_config._finish_queued_import(listed_at, until, ["uuid:1"])
+
+        self.assertEqual(mock_import_submissions.call_args.args[0], ["uuid:1"])
+        self.assertEqual(odk_config.sync_cursor_instance_id, "uuid:2")
+        self.assertEqual(odk_config.failed_instance_ids, "uuid:2")
+
+        # The stored failures are retried by the next delta even when it is empty
+        odk_config.import_records_by_id(odk_config.id)
+        jobs = self.env["queue.job"].search([("func_string", "like", f"odk.config({odk_config.id},).")])
+        self.assertEqual(len(jobs.filtered(lambda job: job.method_name == "_import_failed_submissions")), 1)
+
+    @patch.object(ODKClient, "login")
+    @patch.object(ODKClient, "import_delta_records")
+    def test_import_records_by_id_continues_after_budget(self, mock_import_delta_records, mock_login):
+        def import_delta_records(**kwargs):
+            kwargs["on_page_done"](("2023-01-01T00:00:01.000Z", "uuid:2"), [])
+            return {"form_updated": True, "budget_exhausted": True}
+
+        mock_import_delta_records.side_effect = import_delta_records
+
+        odk_config = self.env["odk.config"].create(
+            {
+                "name": "Test ODK Config",
+                "base_url": self.base_url,
+                "username": self.username,
+                "password": self.password,
+                "project": self.project_id,
+                "form_id": self.form_id,
+                "target_registry": self.target_registry,
+                "json_formatter": self.json_formatter,
+                "max_run_seconds": 60,
+                "max_run_records": 1000,
+            }
+        )
+        odk_config.cron_id = self.env["ir.cron"].create(
+            {
+                "name": "ODK Pull Cron",
+                "model_id": self.env["ir.model"]._get_id("odk.config"),
+                "state": "code",
+                "code": "model.import_records_by_id(%s)" % odk_config.id,
+            }
+        )
+
+        with patch.object(type(self.env["ir.cron"]), "_trigger") as mock_trigger, patch.object(
+            self.env.cr, "commit"
+        ):
+            odk_config.import_records_by_id(odk_config.id)
+
+        kwargs = mock_import_delta_records.call_args.kwargs
+        self.assertEqual((kwargs["max_seconds"], kwargs["max_records"]), (60, 1000))
+        self.assertTrue(mock_trigger.called)
+        self.assertEqual(odk_config._get_sync_cursor(), ("2023-01-01T00:00:01.000Z", "uuid:2"))
+
+    @patch.object(ODKClient, "login")
+    @patch.object(ODKClient, "import_delta_records")
+    def test_import_records_logs_import_run(self, mock_import_delta_records, mock_login):
+        mock_import_delta_records.return_value = {
+            "form_updated": True,
+            "pages": 2,
+            "fetched": 150,
+            "created": 140,
+            "skipped": 10,
+            "wall_time": 3.0,
+            "timings": {
+                "fetch": (1.0, 0.1),
+                "transform": (0.5, 0.5),
+                "lookup": (0.5, 0.4),
+                "write": (1.0, 0.8),
+            },
+        }
+
+        odk_config = self.env["odk.config"].create(
+            {
+                "name": "Test ODK Config",
+                "base_url": self.base_url,
+                "username": self.username,
+                "password": self.password,
+                "project": self.project_id,
+                "form_id": self.form_id,
+                "target_registry": self.target_registry,
+                "json_formatter": self.json_formatter,
+            }
+        )
+        odk_config.import_records()
+
+        run = odk_config.import_run_ids
+        self.assertEqual(len(run), 1)
+        self.assertEqual((run.pages, run.fetched, run.created, run.skipped), (2, 150, 140, 10))
+        self.assertEqual((run.fetch_time, run.write_cpu_time), (1.0, 0.8))
+        self.assertEqual(run.records_per_second, 50.0)
+        self.assertEqual(odk_config.last_records_per_second, 50.0)
+
+    @patch.object(ODKClient, "login")
+    @patch.object(ODKClient, "download_export")
+    @patch.object(ODKClient, "import_export")
+    def test_backfill_moves_sync_cursor_to_export_end(
+        self, mock_import_export, mock_download_export, mock_login
+    ):
+        mock_import_export.return_value = {
+            "form_updated": True,
+            "pages": 1,
+            "fetched": 2,
+            "created": 2,
+            "cursor": ("2023-01-02T00:00:00.000Z", "uuid:9"),
+        }
+
+        odk_config = self.env["odk.config"].create(
+            {
+                "name": "Test ODK Config",
+                "base_url": self.base_url,
+                "username": self.username,
+                "password": self.password,
+                "project": self.project_id,
+                "form_id": self.form_id,
+                "target_registry": self.target_registry,
+                "json_formatter": self.json_formatter,
+                "sync_cursor_date": "2023-01-01T00:00:00.000Z",
+                "sync_cursor_instance_id": "uuid:1",
+            }
+        )
+        odk_config._backfill_from_export()
+
+        self.assertTrue(mock_download_export.called)
+        self.assertEqual(odk_config._get_sync_cursor(), ("2023-01-02T00:00:00.000Z", "uuid:9"))
+        self.assertEqual(odk_config.import_run_ids.created, 2)
+
+    @patch.object(ODKClient, "login")
+    @patch.object(ODKClient, "download_export")
+    @patch.object(ODKClient, "import_export")
+    def test_backfill_copies_the_uploaded_export(self, mock_import_export, mock_download_export, mock_login):
+        content = b"PK" + bytes(range(256)) * 8192
+        copied = []
+
+        def import_export(export_path, **kwargs):
+            with open(export_path, "rb") as export_file:
+                copied.append(export_file.read())
+            return {"form_updated": True, "cursor": None}
+
+        mock_import_export.side_effect = import_export
+
+        odk_config = self.env["odk.config"].create(
+            {
+                "name": "Test ODK Config",
+                "base_url": self.base_url,
+                "username": self.username,
+                "password": self.password,
+                "project": self.project_id,
+                "form_id": self.form_id,
+                "target_registry": self.target_registry,
+                "json_formatter": self.json_formatter,
+                "backfill_file": base64.b64encode(content),
+                "backfill_filename": "submissions.csv.zip",
+            }
+        )
+        odk_config._backfill_from_export()
+
+        self.assertFalse(mock_download_export.called)
+        self.assertEqual(copied, [content])
+        self.assertFalse(odk_config._get_backfill_attachment())
@@ -0,0 +1,80 @@
+import os
+import tempfile
+import zipfile
+from unittest.mock import MagicMock
+
+from odoo.tests.common import TransactionCase
+
+from odoo.addons.g2p_odk_importer.models.odk_client import ODKClient, clear_token_cache
+from odoo.addons.g2p_odk_importer.models.odk_export import iter_export_submissions
+
+from .odk_central_server import GROUP_FIELDS, GROUP_FORMATTER, LocalODKCentral, group_submissions
+
+
+class TestOdkExport(TransactionCase):
+    def setUp(self):
+        super().setUp()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.export_path = os.path.join(self.tmp_dir.name, "submissions.csv.zip")
+        clear_token_cache()
+
+    def test_iter_export_submissions(self):
+        submissions = group_submissions(30, members=3, per_second=1)
+        submissions[4]["members"] = []
+        with LocalODKCentral(submissions, fields=GROUP_FIELDS) as central, open(
+            self.export_path, "wb"
+        ) as export:
+            export.write(central.export_zip())
+
+        exported = list(iter_export_submissions(self.export_path, "registration", GROUP_FIELDS))
+
+        self.assertEqual([s["__id"] for s in exported], [s["__id"] for s in submissions])
+        for submission, original in zip(exported, submissions):
+            self.assertEqual(submission["__system"]["submissionDate"], original["__system"]["submissionDate"])
+            for name in ("attachmentsPresent", "attachmentsExpected", "edits"):
+                self.assertEqual(submission["__system"][name], original["__system"][name])
+            self.assertEqual(submission["household_name"], original["household_name"])
+            self.assertEqual(submission["members"], original["members"])
+            self.assertEqual(submission["notes"], original["notes"] or None)
+
+    def test_iter_export_submissions_without_main_csv(self):
+        with zipfile.ZipFile(self.export_path, "w") as archive:
+            archive.writestr("other_form.csv", "SubmissionDate,KEY\n")
+
+        with self.assertRaises(ValueError):
+            list(iter_export_submissions(self.export_path, "registration", GROUP_FIELDS))
+
+    def test_import_export(self):
+        submissions = group_submissions(25, members=2)
+        partner_model = MagicMock()
+        partner_model.sudo.return_value = partner_model
+        partner_model.create.side_effect = lambda vals_list: MagicMock(ids=list(range(1, len(vals_list) + 1)))
+        env_mock = MagicMock()
+        env_mock.__getitem__.side_effect = (
+            lambda name: partner_model if name == "res.partner" else MagicMock()
+        )
+
+        with LocalODKCentral(list(reversed(submissions)), fields=GROUP_FIELDS) as central:
+            odk_client = ODKClient(
+                env_mock,
+                central.base_url,
+                central.username,
+                central.password,
+                central.project_id,
+                central.form_id,
+                "group",
+                GROUP_FORMATTER,
+            )
+            odk_client.references.membership_kind_id = MagicMock(return_value=7)
+            odk_client.login()
+            odk_client.download_export(self.export_path)
+            on_page_done = MagicMock()
+            result = odk_client.import_export(self.export_path, top=10, on_page_done=on_page_done)
+
+        self.assertEqual(central.request_count("Submissions"), 0)
+        self.assertEqual((result["pages"], result["created"], result["members_created"]), (3, 25, 50))
+        self.assertEqual(on_page_done.call_count, 3)
+        self.assertEqual(
+            result["cursor"], (submissions[-1]["__system"]["submissionDate"], submissions[-1]["__id"])
+        )
@@ -0,0 +1,104 @@
+import json
+
+from odoo.tests.common import TransactionCase
+
+from odoo.addons.g2p_odk_importer.models.odk_field_mapping import (
+    compile_field_mapping,
+    field_mapping_names,
+    map_page,
+)
+from odoo.addons.g2p_odk_importer.models.odk_transform import transform_page
+
+FIELD_MAPPING = json.dumps(
+    {
+        "name": "name",
+        "birthdate": "demographics/birthdate",
+        "gender": {"path": "demographics/gender", "default": "Unknown"},
+        "phone_number_ids": {
+            "repeat": "phones",
+            "fields": {"phone_no": "number", "date_collected": "collected_on"},
+        },
+        "reg_ids": [{"id_type": {"const": "National ID"}, "value": "national_id"}],
+        "is_head": True,
+    }
+)
+
+
+class TestOdkFieldMapping(TransactionCase):
+    def test_compile_field_mapping(self):
+        map_submission = compile_field_mapping(FIELD_MAPPING)
+
+        self.assertIs(compile_field_mapping(FIELD_MAPPING), map_submission)
+        self.assertEqual(
+            map_submission(
+                {
+                    "name": "John Doe",
+                    "demographics": {"birthdate": "1990-01-01"},
+                    "phones": [{"number": "+1234", "collected_on": "2023-01-01"}, {"number": "+5678"}],
+                    "national_id": "NID1",
+                }
+            ),
+            {
+                "name": "John Doe",
+                "birthdate": "1990-01-01",
+                "gender": "Unknown",
+                "phone_number_ids": [
+                    {"phone_no": "+1234", "date_collected": "2023-01-01"},
+                    {"phone_no": "+5678", "date_collected": None},
+                ],
+                "reg_ids": [{"id_type": "National ID", "value": "NID1"}],
+                "is_head": True,
+            },
+        )
+
+    def test_missing_values(self):
+        self.assertEqual(
+            compile_field_mapping(FIELD_MAPPING)({"demographics": "not a group"}),
+            {
+                "name": None,
+                "birthdate": None,
+                "gender": "Unknown",
+                "phone_number_ids": [],
+                "reg_ids": [{"id_type": "National ID", "value": None}],
+                "is_head": True,
+            },
+        )
+
+    def test_repeat_which_is_not_a_list(self):
+        map_submission = compile_field_mapping(FIELD_MAPPING)
+
+        for phones in ("+123", {"number": "+123"}, 12):
+            self.assertEqual(map_submission({"phones": phones})["phone_number_ids"], [])
+
+    def test_invalid_field_mapping(self):
+        for field_mapping in (
+            "{ name: .name }",
+            '["name"]',
+            '{"name": ""}',
+            '{"name": {"path": 1}}',
+            '{"phones": {"repeat": "phones", "fields": ["number"]}}',
+        ):
+            with self.assertRaises(ValueError):
+                compile_field_mapping(field_mapping)
+
+    def test_default_values_are_not_shared(self):
+        map_submission = compile_field_mapping('{"tags": {"path": "tags", "default": []}}')
+
+        first = map_submission({})
+        first["tags"].append("changed")
+
+        self.assertEqual(map_submission({}), {"tags": []})
+
+    def test_field_mapping_names(self):
+        self.assertEqual(
+            field_mapping_names(FIELD_MAPPING), {"name", "demographics", "phones", "national_id"}
+        )
+
+    def test_transform_page_with_field_mapping(self):
+        page = [{"name": "John Doe", "phones": [{"number": "+1234"}]}, {"name": "Jane Doe", "phones": 12}]
+
+        formatted = transform_page(FIELD_MAPPING, page, engine="fields")
+
+        self.assertEqual(formatted[0], map_page(FIELD_MAPPING, page[:1])[0])
+        self.assertEqual(formatted[0]["phone_number_ids"], [{"phone_no": "+1234", "date_collected": None}])
+        self.assertEqual(formatted[1]["phone_number_ids"], [])
@@ -0,0 +1,55 @@
+from unittest.mock import MagicMock
+
+from odoo.exceptions import ValidationError
+from odoo.tests.common import TransactionCase
+
+from odoo.addons.g2p_odk_importer.models.odk_reference_cache import ReferenceDataResolver
+
+
+class TestReferenceDataResolver(TransactionCase):
+    def setUp(self):
+        super().setUp()
+        self.tables = {
+            "g2p.id.type": [{"id": 1, "name": "National ID"}],
+            "gender.type": [{"id": 2, "code": "Female"}],
+            "g2p.group.membership.kind": [{"id": 3, "name": "Head"}],
+        }
+        self.models = {}
+        for model, rows in self.tables.items():
+            model_mock = MagicMock()
+            model_mock.sudo.return_value = model_mock
+            model_mock.search_read.return_value = rows
+            model_mock.search.return_value = MagicMock(id=False)
+            self.models[model] = model_mock
+        self.env_mock = MagicMock()
+        self.env_mock.__getitem__.side_effect = self.models.__getitem__
+
+    def test_resolves_from_preloaded_tables(self):
+        resolver = ReferenceDataResolver(self.env_mock)
+        resolver.preload()
+
+        for _i in range(3):
+            self.assertEqual(resolver.id_type_id("National ID"), 1)
+            self.assertEqual(resolver.gender_code("Female"), "Female")
+            self.assertEqual(resolver.membership_kind_id("Head"), 3)
+
+        self.assertEqual(resolver.hits, 9)
+        self.assertEqual(resolver.misses, 0)
+        for model_mock in self.models.values():
+            self.assertEqual(model_mock.search_read.call_count, 1)
+            model_mock.search.assert_not_called()
+
+    def test_misses(self):
+        self.models["g2p.group.membership.kind"].create.return_value = MagicMock(id=4)
+        resolver = ReferenceDataResolver(self.env_mock)
+        resolver.preload()
+
+        self.assertEqual(resolver.membership_kind_id("Spouse"), 4)
+        self.assertEqual(resolver.membership_kind_id("Spouse"), 4)
+        self.assertIsNone(resolver.gender_code("Unknown"))
+        with self.assertRaises(ValidationError):
+            resolver.id_type_id("Passport")
+
+        self.assertEqual(self.models["g2p.group.membership.kind"].create.call_count, 1)
+        self.assertEqual(resolver.hits, 1)
+        self.assertEqual(resolver.misses, 3)
@@ -0,0 +1,100 @@
+from odoo.tests.common import TransactionCase
+
+from odoo.addons.g2p_odk_importer.models.odk_transform import (
+    compile_formatter,
+    formatter_field_names,
+    iter_transformed,
+    transform_page,
+)
+
+
+class TestOdkTransform(TransactionCase):
+    def test_compile_formatter_is_cached(self):
+        formatter = "{ name: .name }"
+        program = compile_formatter(formatter)
+
+        self.assertIs(compile_formatter(formatter), program)
+        self.assertEqual(program.all({"name": "John Doe", "age": 4})[0], {"name": "John Doe"})
+
+    def test_compile_formatter_invalid(self):
+        with self.assertRaises(ValueError):
+            compile_formatter("{ name: .name")
+
+    def test_formatter_field_names(self):
+        self.assertEqual(
+            formatter_field_names("{ name: .name, phones: [.phone_details[] | {phone_no: .number}] }"),
+            {"name", "phone_details", "number"},
+        )
+        self.assertEqual(formatter_field_names('{ name, "id": .["national id"] }'), {"name", "national id"})
+        # Past a field access, the formatter reads that field and not the document
+        self.assertEqual(
+            formatter_field_names("{ name: .name | tostring } + (.household | to_entries | from_entries)"),
+            {"name", "household"},
+        )
+        self.assertEqual(
+            formatter_field_names('.age as $age | { name: "\\(.first) \\(.last)", adult: ($age >= 18) }'),
+            {"age", "first", "last"},
+        )
+
+    def test_formatter_field_names_whole_document(self):
+        self.assertIsNone(formatter_field_names("."))
+        self.assertIsNone(formatter_field_names("{ data: . }"))
+        self.assertIsNone(formatter_field_names("{ name: .name } + (. | to_entries | from_entries)"))
+        self.assertIsNone(formatter_field_names("if .name then .name else . end"))
+        self.assertIsNone(formatter_field_names('{ summary: "\\(.)" }'))
+
+    def test_formatter_field_names_builtins_reading_the_document(self):
+        for json_formatter in (
+            "{ name: .name, raw: tostring }",
+            "{ name: .name, raw: @json }",
+            "{ name: .name, fields: keys_unsorted }",
+            "{ name: .name, size: length }",
+            "{ name: .name } + map_values(tostring)",
+        ):
+            self.assertIsNone(formatter_field_names(json_formatter), json_formatter)
+
+    def test_transform_page(self):
+        page = [{"name": "John Doe"}, {"name": "Jane Doe"}]
+
+        self.assertEqual(
+            transform_page("{ name: .name }", page), [{"name": "John Doe"}, {"name": "Jane Doe"}]
+        )
+
+    def test_transform_page_returns_record_errors(self):
+        page = [{"name": "John Doe"}, {"name": 1}, {"name": "Jane Doe"}]
+
+        for engine in ("jq", "jq_page"):
+            formatted = transform_page('{ given_name: (.name | split(" ") | first) }', page, engine=engine)
+
+            self.assertEqual(formatted[0], {"given_name": "John"})
+            self.assertIsInstance(formatted[1], Exception)
+            self.assertEqual(formatted[2], {"given_name": "Jane"})
+
+    def test_transform_page_at_once(self):
+        page = [{"name": "John Doe"}, {"name": "Jane Doe"}]
+
+        self.assertEqual(
+            transform_page("{ name: .name }", page, engine="jq_page"), transform_page("{ name: .name }", page)
+        )
+
+    def test_iter_transformed_with_workers_keeps_page_order(self):
+        pages = [(index, [{"name": f"Person {index}-{i}"} for i in range(3)]) for index in range(10)]
+        formatter = '{ given_name: (.name | split(" ") | last) }'
+
+        inline = list(iter_transformed(formatter, iter(pages)))
+        pooled = list(iter_transformed(formatter, iter(pages), workers=2))
+
+        self.assertEqual([context for context, _formatted in pooled], list(range(10)))
+        self.assertEqual(pooled, inline)
+        self.assertEqual(pooled[4][1][2], {"given_name": "4-2"})
+
+    def test_iter_transformed_with_workers_returns_record_errors(self):
+        pages = [("page", [{"name": "John Doe"}, {"name": 1}])]
+
+        [(context, formatted)] = iter_transformed(
+            '{ given_name: (.name | split(" ") | first) }', pages, workers=2
+        )
+
+        self.assertEqual(context, "page")
+        self.assertEqual(formatted[0], {"given_name": "John"})
+        self.assertIsInstance(formatted[1], Exception)